@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+
+from telegram import Bot
+from telegram.error import BadRequest, ChatMigrated, Forbidden, NetworkError, RetryAfter
+
+from app.config import settings
+from app.metrics import broadcast_duration, broadcast_errors, broadcast_sent
+
+log = logging.getLogger(__name__)
+
+# BadRequest messages that mean the chat is gone for good
+PERMANENT_BAD_REQUESTS = (
+    "chat not found",
+    "user is deactivated",
+    "bot was kicked",
+    "peer_id_invalid",
+)
+
+
+@dataclass
+class BroadcastResult:
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    retries: int = 0
+    permanent: list[int] = field(default_factory=list)
+    delivered: list[int] = field(default_factory=list)
+    # Chats whose message Telegram refused, e.g. over bad markup
+    rejected: list[int] = field(default_factory=list)
+    # Groups that became supergroups: old chat id -> new one. The message
+    # went to the new id, but the lists above keep the id it was sent for.
+    migrated: dict[int, int] = field(default_factory=dict)
+    duration: float = 0.0
+    # Time from broadcast start until the last successful delivery
+    fanout_latency: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.sent / self.duration if self.duration > 0 else 0.0
+
+
+def _retry_after_seconds(e: RetryAfter) -> float:
+    value = e.retry_after
+    # python-telegram-bot >= 22 reports a timedelta
+    return value.total_seconds() if hasattr(value, "total_seconds") else float(value)
+
+
+def _is_permanent(e: Exception) -> bool:
+    if isinstance(e, Forbidden):
+        return True
+    if isinstance(e, BadRequest):
+        message = e.message.lower()
+        return any(reason in message for reason in PERMANENT_BAD_REQUESTS)
+    return False
+
+
+class RateLimiter:
+    """Paces sends to Telegram's global and per-chat limits.
+
+    Slots are handed out in call order, so no lock is needed on the event loop.
+    """
+
+    def __init__(self, rate: float, per_chat_interval: float = 1.0) -> None:
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self.per_chat_interval = per_chat_interval
+        self._next_slot = 0.0
+        self._chat_next: dict[int, float] = {}
+
+    def pause(self, seconds: float) -> None:
+        """Hold all sends back, e.g. after a flood-control RetryAfter."""
+        self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
+    async def acquire(self, chat_id: int) -> None:
+        now = time.monotonic()
+        slot = max(now, self._next_slot, self._chat_next.get(chat_id, 0.0))
+        self._next_slot = slot + self.interval
+        self._chat_next[chat_id] = slot + self.per_chat_interval
+        if len(self._chat_next) > 10_000:
+            self._prune(now)
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def _prune(self, now: float) -> None:
+        self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+
+
+rate_limiter = RateLimiter(settings.BROADCAST_RATE)
+
+
+async def broadcast(
+    bot: Bot,
+    chat_ids: Iterable[int],
+    text: str,
+    *,
+    limiter: RateLimiter | None = None,
+    concurrency: int | None = None,
+    max_retries: int | None = None,
+    **kwargs,
+) -> BroadcastResult:
+    """Send one message to many chats with bounded concurrency.
+
+    Transient errors are retried with backoff; chats that failed permanently
+    (blocked the bot, chat not found) are collected in ``result.permanent``.
+    A group that became a supergroup is sent to at its new id, recorded in
+    ``result.migrated``.
+    """
+    limiter = limiter or rate_limiter
+    concurrency = concurrency or settings.BROADCAST_CONCURRENCY
+    max_retries = settings.BROADCAST_RETRIES if max_retries is None else max_retries
+
+    result = BroadcastResult()
+    started = time.monotonic()
+    pending = iter(chat_ids)
+
+    async def send_one(chat_id: int) -> None:
+        attempt = 0
+        target = chat_id
+        while True:
+            await limiter.acquire(target)
+            backoff = 0.0
+            try:
+                await bot.send_message(chat_id=target, text=text, **kwargs)
+            except ChatMigrated as e:
+                log.info("Chat %s migrated to %s", chat_id, e.new_chat_id)
+                result.migrated[chat_id] = target = e.new_chat_id
+                continue
+            except RetryAfter as e:
+                delay = _retry_after_seconds(e)
+                log.warning("Flood control, pausing sends for %.0fs", delay)
+                broadcast_errors.inc("flood")
+                limiter.pause(delay)
+                error: Exception = e
+            except Exception as e:
+                if _is_permanent(e):
+                    broadcast_errors.inc("unreachable")
+                    log.info("Chat %s unreachable: %s", chat_id, e)
+                    result.permanent.append(chat_id)
+                    result.failed += 1
+                    return
+                # BadRequest is a NetworkError subclass but retrying won't help
+                if not isinstance(e, NetworkError) or isinstance(e, BadRequest):
+                    broadcast_errors.inc("rejected")
+                    log.warning("Помилка надсилання до %s: %s", chat_id, e)
+                    result.rejected.append(chat_id)
+                    result.failed += 1
+                    return
+                broadcast_errors.inc("network")
+                error = e
+                backoff = 2**attempt
+            else:
+                result.sent += 1
+                result.delivered.append(chat_id)
+                result.fanout_latency = time.monotonic() - started
+                return
+
+            if attempt >= max_retries:
+                log.warning("Помилка надсилання до %s: %s", chat_id, error)
+                result.failed += 1
+                return
+            attempt += 1
+            result.retries += 1
+            if backoff:
+                await asyncio.sleep(backoff)
+
+    async def worker() -> None:
+        for chat_id in pending:
+            result.total += 1
+            await send_one(chat_id)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    result.duration = time.monotonic() - started
+    broadcast_duration.observe(result.duration)
+    broadcast_sent.inc(result.sent)
+    log.info(
+        "Broadcast: %d/%d sent, %d failed, %d retries in %.2fs (%.1f msg/s, fan-out %.2fs)",
+        result.sent,
+        result.total,
+        result.failed,
+        result.retries,
+        result.duration,
+        result.throughput,
+        result.fanout_latency,
+    )
+    return result
@@ -1,24 +1,202 @@
+import dataclasses
 import time
-from datetime import datetime
+from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
-from telegram.ext import ContextTypes
+from telegram.ext import ApplicationHandlerStop, ContextTypes
 
-from app.bot.keyboard import BTN_CHECK, BTN_DETAILS, BTN_SCHEDULE, get_keyboard, get_status_text
-from app.services.schedule import fetch_schedule, format_schedule_text
+from app.bot.keyboard import (
+    BTN_CHECK,
+    BTN_DETAILS,
+    BTN_SCHEDULE,
+    BTN_STATS,
+    age_minutes,
+    format_duration,
+    get_keyboard,
+    get_status_text,
+    site_header,
+)
+from app.bot.render_cache import RenderCache
+from app.config import DEFAULT_REGION, settings
+from app.services.schedule import (
+    device_region,
+    fetch_schedules,
+    format_schedule_text,
+    region_groups,
+)
 from app.database import async_session
-from app.services.subscriber import add_subscriber, remove_subscriber
-from app.state import power_state
+from app.services.events import get_outage_stats
+from app.services.ratelimit import RateLimiter
+from app.services.subscriber import (
+    add_subscriber,
+    remove_subscriber,
+    set_preferences,
+    set_subscription,
+)
+from app.state import DeviceState, Preferences, power_state, subscriber_registry
 
 KYIV_TZ = ZoneInfo("Europe/Kyiv")
 
+# Quiet hours a subscriber can cycle through in /settings
+QUIET_PRESETS = [(None, None), (22, 7), (23, 7), (0, 8)]
+
+details_texts = RenderCache("details")
+chat_limiter = RateLimiter("chat", settings.CHAT_RATE_LIMIT, settings.CHAT_RATE_BURST)
+
+NO_SITES_TEXT = "🏠 Ти не стежиш за жодним об'єктом.\n\nОбери їх командою /sites"
+
+
+def _followed_devices(chat_id: int) -> list[DeviceState]:
+    if len(settings.DEVICES) == 1:
+        return list(power_state.devices.values())
+    followed = subscriber_registry.sites(chat_id)
+    return [d for d in power_state.devices.values() if d.device_id in followed]
+
+
+def _regions(chat_id: int) -> list[str]:
+    """Regions of the sites a subscriber follows, in configured order; the first if none."""
+    regions = {device_region(d.device_id) for d in _followed_devices(chat_id)}
+    return [r for r in settings.SCHEDULE_SOURCES if r in regions] or [DEFAULT_REGION]
+
+
+def _groups(chat_id: int) -> list[str]:
+    """Outage groups a subscriber can pick from: those of their regions."""
+    return list(dict.fromkeys(g for r in _regions(chat_id) for g in region_groups(r)))
+
+
+def _sites_keyboard(followed: set[str]) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton(
+                f"{'✅' if device_id in followed else '▫️'} {name}",
+                callback_data=f"site:{device_id}",
+            )
+        ]
+        for device_id, name in settings.DEVICES.items()
+    ])
+
+
+def _settings_keyboard(prefs: Preferences, groups: list[str]) -> InlineKeyboardMarkup:
+    def mark(on: bool) -> str:
+        return "✅" if on else "▫️"
+
+    quiet = (
+        f"{prefs.quiet_start:02d}:00–{prefs.quiet_end:02d}:00"
+        if prefs.quiet_start is not None
+        else "вимкнено"
+    )
+    rows = [
+        [InlineKeyboardButton(f"🌙 Тихі години: {quiet}", callback_data="pref:quiet")],
+        [InlineKeyboardButton(
+            f"{mark(prefs.off_only)} Лише про відключення", callback_data="pref:off_only"
+        )],
+        [InlineKeyboardButton(
+            f"{mark(prefs.schedule_alerts)} Зміни графіку", callback_data="pref:schedule"
+        )],
+    ]
+    if len(groups) > 1:
+        rows.extend(
+            [InlineKeyboardButton(
+                f"{mark(prefs.follows_group(g))} Група {g}", callback_data=f"pref:group:{g}"
+            )]
+            for g in groups
+        )
+    return InlineKeyboardMarkup(rows)
+
+
+def _toggle_preference(prefs: Preferences, option: str, available: list[str]) -> Preferences:
+    if option == "quiet":
+        current = (prefs.quiet_start, prefs.quiet_end)
+        index = QUIET_PRESETS.index(current) if current in QUIET_PRESETS else -1
+        start, end = QUIET_PRESETS[(index + 1) % len(QUIET_PRESETS)]
+        return dataclasses.replace(prefs, quiet_start=start, quiet_end=end)
+    if option == "off_only":
+        return dataclasses.replace(prefs, off_only=not prefs.off_only)
+    if option == "schedule":
+        return dataclasses.replace(prefs, schedule_alerts=not prefs.schedule_alerts)
+    if option.startswith("group:"):
+        group = option.removeprefix("group:")
+        groups = set(prefs.groups if prefs.groups is not None else available)
+        groups.symmetric_difference_update({group})
+        # Following every group is stored as "no filter"
+        return dataclasses.replace(
+            prefs,
+            groups=None if groups >= set(available) else frozenset(groups),
+        )
+    return prefs
+
+
+def _details_text(device: DeviceState) -> str:
+    age = age_minutes(device, time.time())
+    return details_texts.get(
+        (device.device_id, device.version, age), lambda: _render_details(device, age)
+    )
+
+
+def _render_details(device: DeviceState, age: int) -> str:
+    last = datetime.fromtimestamp(device.last_ping, tz=KYIV_TZ).strftime(
+        "%d.%m %H:%M:%S"
+    )
+    status = (
+        "✅ Електроенергія є"
+        if device.power_is_on
+        else "❌ Електроенергії немає"
+    )
+    text = (
+        f"{site_header(device)}"
+        f"📊 *Детальна інформація*\n\n"
+        f"Стан: {status}\n"
+        f"Останній пінг: {last}\n"
+    )
+    if not device.power_is_on and device.power_off_time:
+        off = datetime.fromtimestamp(
+            device.power_off_time, tz=KYIV_TZ
+        ).strftime("%d.%m %H:%M")
+        text += f"\nВідключено: {off}\nТривалість: {age} хв"
+    return text
+
+
+async def _stats_text(device: DeviceState) -> str:
+    ongoing = (
+        datetime.fromtimestamp(device.power_off_time, tz=timezone.utc)
+        if not device.power_is_on and device.power_off_time
+        else None
+    )
+    lines = [f"{site_header(device)}📈 *Статистика відключень*"]
+    async with async_session() as session:
+        for days in (7, 30):
+            stats = await get_outage_stats(
+                session, device.device_id, days, ongoing_since=ongoing
+            )
+            lines.append(
+                f"\n*За {days} днів:*\n"
+                f"Відключень: {stats.outages}\n"
+                f"Без світла: {format_duration(stats.downtime_seconds)}\n"
+                f"Найдовше: {format_duration(stats.longest_outage_seconds)}"
+            )
+    return "\n".join(lines)
+
+
+async def throttle(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Runs ahead of every other handler and drops updates from chats over their rate."""
+    chat = update.effective_chat
+    if chat is None or chat_limiter.allow(chat.id):
+        return
+    if update.callback_query:
+        # Stops the button's spinner; cheaper than a message
+        await update.callback_query.answer("⏳ Забагато запитів, зачекай трохи")
+    raise ApplicationHandlerStop
+
 
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
+    single_site = len(settings.DEVICES) == 1
 
     async with async_session() as session:
-        is_new = await add_subscriber(session, chat_id)
+        is_new = await add_subscriber(
+            session, chat_id, list(settings.DEVICES) if single_site else []
+        )
 
     greeting = (
         "👋 Вітаю! Ти підписаний на сповіщення про світло."
@@ -31,6 +209,10 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         reply_markup=get_keyboard(),
         parse_mode="Markdown",
     )
+    if is_new and not single_site:
+        await update.message.reply_text(
+            "Обери об'єкти, за якими стежити:", reply_markup=_sites_keyboard(set())
+        )
 
 
 async def cmd_stop(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -44,36 +226,47 @@ async def cmd_stop(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     )
 
 
+async def cmd_sites(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    followed = subscriber_registry.sites(update.effective_chat.id)
+    await update.message.reply_text(
+        "Обери об'єкти, за якими стежити:", reply_markup=_sites_keyboard(followed)
+    )
+
+
+async def cmd_settings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat_id = update.effective_chat.id
+    if chat_id not in subscriber_registry:
+        await update.message.reply_text("Спершу підпишись: /start")
+        return
+
+    prefs = subscriber_registry.preferences(chat_id)
+    await update.message.reply_text(
+        "⚙️ *Налаштування сповіщень*",
+        reply_markup=_settings_keyboard(prefs, _groups(chat_id)),
+        parse_mode="Markdown",
+    )
+
+
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     msg = update.message.text
 
-    if msg == BTN_CHECK:
+    if msg in (BTN_CHECK, BTN_DETAILS):
+        devices = _followed_devices(update.effective_chat.id)
+        if not devices:
+            await update.message.reply_text(NO_SITES_TEXT)
+            return
+        render = get_status_text if msg == BTN_CHECK else _details_text
         await update.message.reply_text(
-            text=get_status_text(), parse_mode="Markdown"
-        )
-
-    elif msg == BTN_DETAILS:
-        last = datetime.fromtimestamp(power_state.last_ping, tz=KYIV_TZ).strftime(
-            "%d.%m %H:%M:%S"
-        )
-        status = (
-            "✅ Електроенергія є"
-            if power_state.power_is_on
-            else "❌ Електроенергії немає"
-        )
-        text = (
-            f"📊 *Детальна інформація*\n\n"
-            f"Стан: {status}\n"
-            f"Останній пінг: {last}\n"
+            text="\n\n".join(render(d) for d in devices), parse_mode="Markdown"
         )
-        if not power_state.power_is_on and power_state.power_off_time:
-            off = datetime.fromtimestamp(
-                power_state.power_off_time, tz=KYIV_TZ
-            ).strftime("%d.%m %H:%M")
-            duration = int((time.time() - power_state.power_off_time) / 60)
-            text += f"\nВідключено: {off}\nТривалість: {duration} хв"
 
-        await update.message.reply_text(text=text, parse_mode="Markdown")
+    elif msg == BTN_STATS:
+        devices = _followed_devices(update.effective_chat.id)
+        if not devices:
+            await update.message.reply_text(NO_SITES_TEXT)
+            return
+        texts = [await _stats_text(d) for d in devices]
+        await update.message.reply_text(text="\n\n".join(texts), parse_mode="Markdown")
 
     elif msg == BTN_SCHEDULE:
         keyboard = InlineKeyboardMarkup([
@@ -92,9 +285,55 @@ async def schedule_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
 
     day = "today" if query.data == "schedule_today" else "tomorrow"
-    data = await fetch_schedule()
-    if data:
-        text = format_schedule_text(data, day=day)
-    else:
-        text = "⚠️ Не вдалось отримати графік"
-    await query.edit_message_text(text=text, parse_mode="Markdown")
+    chat_id = update.effective_chat.id
+    prefs = subscriber_registry.preferences(chat_id)
+    indexes = await fetch_schedules(_regions(chat_id))
+    texts = []
+    for region, data in indexes.items():
+        available = region_groups(region)
+        groups = [g for g in available if prefs.follows_group(g)] or available
+        if data:
+            text = format_schedule_text(data, day=day, groups=groups)
+        else:
+            text = "⚠️ Не вдалось отримати графік"
+        if len(indexes) > 1:
+            text = f"🗺 *{settings.SCHEDULE_SOURCES[region].name or region}*\n{text}"
+        texts.append(text)
+    await query.edit_message_text(text="\n\n".join(texts), parse_mode="Markdown")
+
+
+async def site_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    device_id = query.data.removeprefix("site:")
+    if device_id not in settings.DEVICES:
+        await query.answer()
+        return
+
+    async with async_session() as session:
+        # Subscriptions reference the subscriber row, so make sure it exists
+        await add_subscriber(session, chat_id)
+        follow = device_id not in subscriber_registry.sites(chat_id)
+        await set_subscription(session, chat_id, device_id, follow)
+
+    followed = subscriber_registry.sites(chat_id)
+    await query.answer("Підписано" if follow else "Відписано")
+    await query.edit_message_reply_markup(reply_markup=_sites_keyboard(followed))
+
+
+async def preference_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    if chat_id not in subscriber_registry:
+        await query.answer("Спершу підпишись: /start")
+        return
+
+    groups = _groups(chat_id)
+    prefs = _toggle_preference(
+        subscriber_registry.preferences(chat_id), query.data.removeprefix("pref:"), groups
+    )
+    async with async_session() as session:
+        await set_preferences(session, chat_id, prefs)
+
+    await query.answer("Збережено")
+    await query.edit_message_reply_markup(reply_markup=_settings_keyboard(prefs, groups))
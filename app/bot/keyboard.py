@@ -5,40 +5,73 @@ import time
 
 from telegram import ReplyKeyboardMarkup
 
-from app.state import power_state
+from app.bot.render_cache import RenderCache
+from app.config import settings
+from app.state import DeviceState
 
 KYIV_TZ = ZoneInfo("Europe/Kyiv")
 
 BTN_CHECK = "🔍 Перевірити стан"
 BTN_DETAILS = "📊 Детальніше"
 BTN_SCHEDULE = "📅 Графік"
+BTN_STATS = "📈 Статистика"
+
+status_texts = RenderCache("status")
 
 
 def get_keyboard() -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(
-        [[BTN_CHECK, BTN_DETAILS], [BTN_SCHEDULE]],
+        [[BTN_CHECK, BTN_DETAILS], [BTN_SCHEDULE, BTN_STATS]],
         resize_keyboard=True,
     )
 
 
-def get_status_text() -> str:
-    if power_state.power_is_on:
-        last = datetime.fromtimestamp(power_state.last_ping, tz=KYIV_TZ).strftime(
+def site_header(device: DeviceState) -> str:
+    """Site name line, only when the deployment watches more than one site."""
+    return f"🏠 *{device.name}*\n" if len(settings.DEVICES) > 1 else ""
+
+
+def age_minutes(device: DeviceState, now: float) -> int:
+    """Whole minutes since the last ping, or since the outage began when off.
+
+    Together with ``device.version`` this is all the time dependence of a
+    status reply, so the pair keys the render caches.
+    """
+    since = device.last_ping if device.power_is_on else device.power_off_time or device.last_ping
+    return int((now - since) / 60)
+
+
+def get_status_text(device: DeviceState) -> str:
+    now = time.time()
+    age = age_minutes(device, now)
+    return status_texts.get(
+        (device.device_id, device.version, age), lambda: _render_status(device, age)
+    )
+
+
+def _render_status(device: DeviceState, age: int) -> str:
+    header = site_header(device)
+    if device.power_is_on:
+        last = datetime.fromtimestamp(device.last_ping, tz=KYIV_TZ).strftime(
             "%H:%M:%S"
         )
-        elapsed = int((time.time() - power_state.last_ping) / 60)
-        ago_text = f"\n({elapsed} хв тому)" if elapsed > 0 else ""
-        return f"✅ *Світло є.*\n\n⏰ Останній сигнал: {last}{ago_text}"
+        ago_text = f"\n({age} хв тому)" if age > 0 else ""
+        return f"{header}✅ *Світло є.*\n\n⏰ Останній сигнал: {last}{ago_text}"
     else:
         off_time = datetime.fromtimestamp(
-            power_state.power_off_time, tz=KYIV_TZ
+            device.power_off_time, tz=KYIV_TZ
         ).strftime("%H:%M")
-        duration = int((time.time() - power_state.power_off_time) / 60)
-        hours = duration // 60
-        minutes = duration % 60
+        hours = age // 60
+        minutes = age % 60
         dur_text = f"{hours} год {minutes} хв" if hours > 0 else f"{minutes} хв"
         return (
-            f"❌ *Світла немає.*\n\n"
+            f"{header}❌ *Світла немає.*\n\n"
             f"⏰ Зникло о: {off_time}\n"
             f"⏳ Вже {dur_text} без світла"
         )
+
+
+def format_duration(seconds: int) -> str:
+    minutes = seconds // 60
+    hours = minutes // 60
+    return f"{hours} год {minutes % 60} хв" if hours > 0 else f"{minutes} хв"
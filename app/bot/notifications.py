@@ -1,28 +1,108 @@
-import logging
+from datetime import datetime
+from typing import Literal
+from zoneinfo import ZoneInfo
 
 from telegram import Bot
 
+from app.bot.broadcast import BroadcastResult, broadcast
+from app.bot.outbox import outbox_worker
+from app.config import DEFAULT_REGION, settings
 from app.database import async_session
-from app.services.subscriber import get_all_subscribers, remove_subscribers
+from app.services.outbox import enqueue, release_job
+from app.services.schedule import region_devices
+from app.services.subscriber import migrate_subscribers, remove_subscribers
+from app.state import subscriber_registry
 
-log = logging.getLogger(__name__)
+KYIV_TZ = ZoneInfo("Europe/Kyiv")
 
 
-async def notify_all(bot: Bot, text: str) -> None:
+async def _send(bot: Bot, chat_ids: list[int], text: str) -> BroadcastResult:
+    result = await broadcast(bot, chat_ids, text, parse_mode="Markdown")
+
+    if result.permanent or result.migrated:
+        async with async_session() as session:
+            await remove_subscribers(session, result.permanent)
+            await migrate_subscribers(session, result.migrated)
+
+    return result
+
+
+async def notify_all(bot: Bot, text: str) -> BroadcastResult:
     """Send a message to all subscribers, removing those who blocked the bot."""
+    return await _send(bot, subscriber_registry.chat_ids(), text)
+
+
+def _site_text(device_id: str, text: str) -> str:
+    if len(settings.DEVICES) > 1:
+        return f"🏠 *{settings.DEVICES.get(device_id, device_id)}*\n\n{text}"
+    return text
+
+
+async def notify_site(
+    device_id: str,
+    text: str,
+    kind: Literal["off", "on"],
+    dedupe_key: str,
+    event_at: datetime | None = None,
+    held_until: datetime | None = None,
+) -> int | None:
+    """Queue a power alert for ``device_id``'s followers whose preferences allow it.
+
+    The alert goes through the outbox, so it survives a restart and is
+    queued once per ``dedupe_key``. Returns the outbox job id, or None if
+    the alert was already queued. A ``held_until`` alert waits for
+    release_site_alert, or goes out as it is once that time has passed.
+    """
+    chat_ids = subscriber_registry.recipients(
+        kind, hour=datetime.now(KYIV_TZ).hour, device_id=device_id
+    )
     async with async_session() as session:
-        chat_ids = await get_all_subscribers(session)
-
-    failed: list[int] = []
-    for chat_id in chat_ids:
-        try:
-            await bot.send_message(
-                chat_id=chat_id, text=text, parse_mode="Markdown"
-            )
-        except Exception as e:
-            log.warning("Помилка надсилання до %s: %s", chat_id, e)
-            failed.append(chat_id)
-
-    if failed:
-        async with async_session() as session:
-            await remove_subscribers(session, failed)
+        job_id = await enqueue(
+            session, dedupe_key, _site_text(device_id, text), chat_ids, event_at, held_until
+        )
+    if held_until is None:
+        outbox_worker.wake.set()
+    return job_id
+
+
+async def release_site_alert(job_id: int, device_id: str, text: str, held_until: datetime) -> None:
+    """Replace a held alert's text and send it now."""
+    async with async_session() as session:
+        await release_job(session, job_id, _site_text(device_id, text), held_until)
+    outbox_worker.wake.set()
+
+
+async def notify_groups(
+    bot: Bot,
+    header: str,
+    lines: dict[str, str],
+    footer: str = "",
+    region: str = DEFAULT_REGION,
+) -> None:
+    """Send schedule news, where ``lines`` maps outage group -> text about it.
+
+    Each subscriber gets one message with only the groups their preferences
+    cover; subscribers sharing the same set of groups share a broadcast.
+    With several regions, only followers of ``region``'s sites hear about it.
+    """
+    hour = datetime.now(KYIV_TZ).hour
+    in_region = None
+    if len(settings.SCHEDULE_SOURCES) > 1:
+        in_region = {
+            chat_id for d in region_devices(region) for chat_id in subscriber_registry.followers(d)
+        }
+    groups_by_chat: dict[int, list[str]] = {}
+    for group in lines:
+        for chat_id in subscriber_registry.recipients("schedule", hour=hour, group=group):
+            if in_region is None or chat_id in in_region:
+                groups_by_chat.setdefault(chat_id, []).append(group)
+
+    chats_by_groups: dict[tuple[str, ...], list[int]] = {}
+    for chat_id, groups in groups_by_chat.items():
+        chats_by_groups.setdefault(tuple(groups), []).append(chat_id)
+
+    for groups, chat_ids in chats_by_groups.items():
+        text = "\n".join([header, *(lines[g] for g in groups)])
+        if footer:
+            text += f"\n\n{footer}"
+        await _send(bot, chat_ids, text)
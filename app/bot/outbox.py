@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import time
+
+from telegram import Bot
+
+from app.bot.broadcast import broadcast
+from app.config import settings
+from app.database import async_session
+from app.metrics import outage_alert_delay
+from app.services.outbox import claim_deliveries, finish_deliveries, get_jobs, prune_outbox
+from app.services.subscriber import migrate_subscribers, remove_subscribers
+
+log = logging.getLogger(__name__)
+
+
+class OutboxWorker:
+    """Drains the outbox: claims a batch of deliveries, sends, records the outcome.
+
+    A chat is marked sent right after its batch goes out, so a crash can
+    repeat at most the batch in flight; deliveries already recorded as sent
+    are never claimed again. Enqueueing in this process wakes the worker;
+    otherwise, e.g. for work left by a crashed replica, it polls.
+    """
+
+    def __init__(self) -> None:
+        self.wake = asyncio.Event()
+        self._last_prune = 0.0
+
+    async def drain(self, bot: Bot) -> int:
+        """Send pending deliveries until none are left; returns how many were sent."""
+        total = 0
+        while True:
+            async with async_session() as session:
+                claimed = await claim_deliveries(session, settings.OUTBOX_BATCH_SIZE)
+                if not claimed:
+                    return total
+                jobs = await get_jobs(session, {job_id for job_id, _ in claimed})
+
+            by_job: dict[int, list[int]] = {}
+            for job_id, chat_id in claimed:
+                by_job.setdefault(job_id, []).append(chat_id)
+
+            for job_id, chat_ids in by_job.items():
+                job = jobs[job_id]
+                result = await broadcast(bot, chat_ids, job.text, parse_mode="Markdown")
+                if job.event_at is not None:
+                    delay = time.time() - job.event_at.timestamp()
+                    for _ in result.delivered:
+                        outage_alert_delay.observe(delay)
+                done = set(result.delivered) | set(result.permanent) | set(result.rejected)
+                async with async_session() as session:
+                    await finish_deliveries(
+                        session,
+                        job_id,
+                        result.delivered,
+                        result.permanent + result.rejected,
+                        [c for c in chat_ids if c not in done],
+                        settings.OUTBOX_MAX_ATTEMPTS,
+                    )
+                    if result.permanent:
+                        await remove_subscribers(session, result.permanent)
+                    if result.migrated:
+                        await migrate_subscribers(session, result.migrated)
+                total += result.sent
+
+    async def run(self, bot: Bot) -> None:
+        while True:
+            try:
+                await self.drain(bot)
+                if time.time() - self._last_prune > 3600:
+                    async with async_session() as session:
+                        await prune_outbox(session)
+                    self._last_prune = time.time()
+            except Exception:
+                log.exception("outbox error")
+            try:
+                await asyncio.wait_for(self.wake.wait(), settings.OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+
+
+outbox_worker = OutboxWorker()
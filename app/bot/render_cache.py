@@ -0,0 +1,27 @@
+from collections.abc import Callable, Hashable
+
+from app.metrics import render_cache_hits, render_cache_misses
+
+
+class RenderCache:
+    """Rendered reply texts, keyed on everything the text depends on.
+
+    Keys embed versions, so stale entries are never hit, only left behind;
+    the cache is cleared when it fills up rather than tracking recency.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.texts: dict[Hashable, str] = {}
+
+    def get(self, key: Hashable, render: Callable[[], str]) -> str:
+        text = self.texts.get(key)
+        if text is not None:
+            render_cache_hits.inc(self.name)
+            return text
+        render_cache_misses.inc(self.name)
+        if len(self.texts) >= self.maxsize:
+            self.texts.clear()
+        text = self.texts[key] = render()
+        return text
@@ -1,29 +1,125 @@
-from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, filters
+import asyncio
+import logging
 
-from app.bot.handlers import button_handler, cmd_start, cmd_stop, schedule_callback
-from app.bot.keyboard import BTN_CHECK, BTN_DETAILS, BTN_SCHEDULE
+from telegram import Update
+from telegram.ext import (
+    Application,
+    CallbackQueryHandler,
+    CommandHandler,
+    MessageHandler,
+    TypeHandler,
+    filters,
+)
+
+from app.bot.handlers import (
+    button_handler,
+    cmd_settings,
+    cmd_sites,
+    cmd_start,
+    cmd_stop,
+    preference_callback,
+    schedule_callback,
+    site_callback,
+    throttle,
+)
+from app.bot.keyboard import BTN_CHECK, BTN_DETAILS, BTN_SCHEDULE, BTN_STATS
 from app.config import settings
 
+log = logging.getLogger(__name__)
+
+WEBHOOK_PATH = "/telegram/webhook"
+
 tg_app: Application | None = None
+# Webhook mode: updates posted to WEBHOOK_PATH wait here for a worker
+update_queue: asyncio.Queue[Update] = asyncio.Queue(maxsize=settings.BOT_UPDATE_QUEUE_SIZE)
+_workers: list[asyncio.Task] = []
 
 
 async def setup_bot() -> Application:
     global tg_app
 
-    tg_app = Application.builder().token(settings.BOT_TOKEN).build()
+    builder = Application.builder().token(settings.BOT_TOKEN)
+    if settings.BOT_MODE == "webhook":
+        builder = builder.updater(None)
+    tg_app = builder.build()
 
+    # Group -1 runs before the handlers below
+    tg_app.add_handler(TypeHandler(Update, throttle), group=-1)
     tg_app.add_handler(CommandHandler("start", cmd_start))
     tg_app.add_handler(CommandHandler("stop", cmd_stop))
+    tg_app.add_handler(CommandHandler("sites", cmd_sites))
+    tg_app.add_handler(CommandHandler("settings", cmd_settings))
     tg_app.add_handler(
         MessageHandler(
-            filters.TEXT & filters.Regex(f"^({BTN_CHECK}|{BTN_DETAILS}|{BTN_SCHEDULE})$"),
+            filters.TEXT
+            & filters.Regex(f"^({BTN_CHECK}|{BTN_DETAILS}|{BTN_SCHEDULE}|{BTN_STATS})$"),
             button_handler,
         )
     )
     tg_app.add_handler(CallbackQueryHandler(schedule_callback, pattern="^schedule_"))
+    tg_app.add_handler(CallbackQueryHandler(site_callback, pattern="^site:"))
+    tg_app.add_handler(CallbackQueryHandler(preference_callback, pattern="^pref:"))
 
     await tg_app.initialize()
     await tg_app.start()
-    await tg_app.updater.start_polling()
+
+    if settings.BOT_MODE == "webhook":
+        _workers.extend(
+            asyncio.create_task(_process_updates()) for _ in range(settings.BOT_UPDATE_WORKERS)
+        )
+        # Without a public URL the route still works, e.g. for posting
+        # recorded updates locally.
+        if settings.BOT_WEBHOOK_URL:
+            await tg_app.bot.set_webhook(
+                url=settings.BOT_WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=settings.BOT_WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES,
+            )
 
     return tg_app
+
+
+async def start_polling() -> None:
+    """Start fetching updates in polling mode. Telegram allows one poller per
+    token, so with several replicas only the leader calls this."""
+    if tg_app.updater and not tg_app.updater.running:
+        await tg_app.updater.start_polling()
+
+
+async def stop_polling() -> None:
+    if tg_app is not None and tg_app.updater and tg_app.updater.running:
+        await tg_app.updater.stop()
+
+
+def enqueue_update(data: dict) -> bool:
+    """Queue a webhook update for processing. False when the queue is full."""
+    update = Update.de_json(data, tg_app.bot)
+    try:
+        update_queue.put_nowait(update)
+    except asyncio.QueueFull:
+        return False
+    return True
+
+
+async def _process_updates() -> None:
+    while True:
+        update = await update_queue.get()
+        try:
+            await tg_app.process_update(update)
+        except Exception:
+            log.exception("update processing error")
+        finally:
+            update_queue.task_done()
+
+
+async def shutdown_bot() -> None:
+    if tg_app is None:
+        return
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    await stop_polling()
+    if tg_app.running:
+        await tg_app.stop()
+    await tg_app.shutdown()
@@ -1,14 +1,118 @@
+from typing import Literal
+
+from pydantic import BaseModel, model_validator
 from pydantic_settings import BaseSettings
 
 
+class ScheduleSource(BaseModel):
+    """One region's published outage schedule."""
+
+    url: str
+    # The region's outage groups we serve, in display order
+    groups: list[str]
+    # Shown to subscribers whose sites span several regions; defaults to the region's key
+    name: str | None = None
+    # Seconds one fetch may take before the last good copy is served instead
+    timeout: float = 10.0
+
+
 class Settings(BaseSettings):
     BOT_TOKEN: str
+    # "polling" or "webhook"; webhook mode serves updates at /telegram/webhook
+    BOT_MODE: Literal["polling", "webhook"] = "polling"
+    # Public base URL registered with Telegram in webhook mode
+    BOT_WEBHOOK_URL: str | None = None
+    BOT_WEBHOOK_SECRET: str | None = None
+    BOT_UPDATE_QUEUE_SIZE: int = 1000
+    BOT_UPDATE_WORKERS: int = 8
     DATABASE_URL: str
+    # Postgres only: how often followers try to take over the leader role
+    CLUSTER_POLL_INTERVAL: float = 2.0
     ESP_API_KEY: str
+    # UDP port for signed heartbeats (see app.services.heartbeat); 0 turns it off
+    HEARTBEAT_UDP_PORT: int = 0
+    HEARTBEAT_UDP_HOST: str = "0.0.0.0"
+    # Heartbeats sent further than this many seconds from the server's clock
+    # are dropped, which limits how long a captured packet can be replayed
+    HEARTBEAT_MAX_SKEW: int = 30
+    # device_id -> site name shown to subscribers; the first one is the
+    # default for ESP firmware that doesn't send a device id
+    DEVICES: dict[str, str] = {"home": "Дім"}
     PING_TIMEOUT: int = 60
+    # Max seconds of pings a crash can lose; 0 writes every ping through to the DB
+    PING_FLUSH_INTERVAL: float = 5.0
+    # Days of ping history kept per resolution
+    HISTORY_RETENTION_DAYS: dict[str, int] = {"minute": 2, "hour": 90, "day": 3650}
+    # Schedule sources by region name. Left empty, there is one region,
+    # "default", built from SCHEDULE_URL and OUTAGE_GROUPS
+    SCHEDULE_SOURCES: dict[str, ScheduleSource] = {}
+    # device_id -> region; devices not listed are in the first region
+    DEVICE_REGIONS: dict[str, str] = {}
     OUTAGE_GROUPS: list[str] = ["GPV5.2"]
+    SCHEDULE_URL: str = (
+        "https://raw.githubusercontent.com/yaroslav2901/OE_OUTAGE_DATA"
+        "/main/data/Ternopiloblenerho.json"
+    )
+    # Seconds a fetched schedule is served before revalidating it
+    SCHEDULE_TTL: int = 300
+    # Bounds of the adaptive interval for polling the schedule for changes
+    SCHEDULE_POLL_MIN: float = 60
+    SCHEDULE_POLL_MAX: float = 900
+    # How long before a planned outage to remind subscribers; 0 turns reminders off
+    REMINDER_LEAD_MINUTES: int = 30
+    # Telegram allows ~30 messages/s per bot and ~1 message/s per chat
+    BROADCAST_RATE: float = 25.0
+    BROADCAST_CONCURRENCY: int = 20
+    BROADCAST_RETRIES: int = 3
+    # Alert outbox: deliveries claimed per batch, attempts before a chat is
+    # given up on, and how often to look for work left by a crashed worker
+    OUTBOX_BATCH_SIZE: int = 50
+    OUTBOX_MAX_ATTEMPTS: int = 5
+    OUTBOX_POLL_INTERVAL: float = 10.0
+    # Token buckets, as requests a second and a burst size, for each ESP
+    # device, each other HTTP client IP and each bot chat; a rate of 0 turns one off
+    DEVICE_RATE_LIMIT: float = 1.0
+    DEVICE_RATE_BURST: int = 5
+    CLIENT_RATE_LIMIT: float = 5.0
+    CLIENT_RATE_BURST: int = 20
+    CHAT_RATE_LIMIT: float = 0.5
+    CHAT_RATE_BURST: int = 5
+    # Log lines as JSON or plain text. Messages are matched on their format
+    # string: LOG_AGGREGATE ones become one summary per LOG_AGGREGATE_INTERVAL
+    # seconds with a count, LOG_SAMPLE ones are kept at the given fraction and
+    # the rest dropped uncounted, so none are sampled by default
+    LOG_FORMAT: Literal["json", "text"] = "json"
+    LOG_AGGREGATE: list[str] = [
+        "Ping received from %s",
+        "Chat %s unreachable: %s",
+        "Помилка надсилання до %s: %s",
+    ]
+    LOG_AGGREGATE_INTERVAL: float = 60.0
+    # Paths whose uvicorn access lines are aggregated too
+    LOG_AGGREGATE_ACCESS: list[str] = ["/ping"]
+    LOG_SAMPLE: dict[str, float] = {}
 
     model_config = {"env_file": ".env", "extra": "ignore"}
 
+    @model_validator(mode="after")
+    def _check_regions(self) -> "Settings":
+        if not self.SCHEDULE_SOURCES:
+            self.SCHEDULE_SOURCES = {
+                "default": ScheduleSource(url=self.SCHEDULE_URL, groups=self.OUTAGE_GROUPS)
+            }
+        unknown = set(self.DEVICE_REGIONS.values()) - set(self.SCHEDULE_SOURCES)
+        if unknown:
+            raise ValueError(f"DEVICE_REGIONS names unknown regions: {', '.join(sorted(unknown))}")
+        return self
+
+    @model_validator(mode="after")
+    def _check_webhook(self) -> "Settings":
+        # Without it anyone could post updates to the webhook route
+        if self.BOT_MODE == "webhook" and not self.BOT_WEBHOOK_SECRET:
+            raise ValueError("BOT_WEBHOOK_SECRET is required when BOT_MODE is webhook")
+        return self
+
 
 settings = Settings()
+DEFAULT_DEVICE = next(iter(settings.DEVICES))
+DEFAULT_REGION = next(iter(settings.SCHEDULE_SOURCES))
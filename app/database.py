@@ -1,11 +1,110 @@
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+"""Engine, sessions and the declarative base.
+
+Two backends are supported: Postgres over asyncpg, and an embedded SQLite
+file over aiosqlite for single-site installs. SQLite allows one writer at
+a time. Its engine keeps a pool of connections for reads, and a lock lets
+one connection at a time write: other writers await their turn on the
+event loop instead of failing with "database is locked". Reads don't take
+the lock, so they carry on during a slow write. Statements run on
+aiosqlite's worker threads, and in WAL mode with synchronous=NORMAL a
+commit appends to the log without an fsync, so a ping save costs well
+under a millisecond.
+"""
+import asyncio
+from datetime import datetime, timezone
+
+from sqlalchemy import DateTime, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.util import await_only
 
 from app.config import settings
 
-engine = create_async_engine(settings.DATABASE_URL)
+SQLITE_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "foreign_keys=ON",
+    # Milliseconds another process (a backup, the sqlite3 shell) may hold the lock
+    "busy_timeout=5000",
+    # Negative: KiB, so 16 MiB of page cache
+    "cache_size=-16384",
+    "temp_store=MEMORY",
+)
+# Statements that don't start a write transaction
+READ_STATEMENTS = ("SELECT", "WITH", "PRAGMA")
+
+
+def _set_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(f"PRAGMA {pragma}")
+    cursor.close()
+
+
+def _serialize_writes(sqlite_engine: AsyncEngine) -> None:
+    """Let one connection at a time write.
+
+    pysqlite begins a transaction at a connection's first write, and SQLite
+    holds the write lock until it ends. The lock is taken just before that
+    write and given back when the connection returns to the pool, after its
+    commit or rollback.
+    """
+    lock = asyncio.Lock()
+
+    def acquire(conn, cursor, statement, parameters, context, executemany) -> None:
+        if conn.info.get("writing") or statement.lstrip()[:6].upper().startswith(READ_STATEMENTS):
+            return
+        # Runs inside SQLAlchemy's greenlet, so it can wait on the event loop
+        await_only(lock.acquire())
+        conn.info["writing"] = True
+
+    def release(dbapi_connection, connection_record) -> None:
+        if connection_record.info.pop("writing", False):
+            lock.release()
+
+    event.listen(sqlite_engine.sync_engine, "before_cursor_execute", acquire)
+    event.listen(sqlite_engine.sync_engine.pool, "checkin", release)
+
+
+def _create_engine(database_url: str):
+    url = make_url(database_url)
+    if url.get_backend_name() != "sqlite":
+        return create_async_engine(url)
+    sqlite_engine = create_async_engine(url)
+    event.listen(sqlite_engine.sync_engine, "connect", _set_pragmas)
+    # In-memory databases share one connection already
+    if url.database not in (None, "", ":memory:"):
+        _serialize_writes(sqlite_engine)
+    return sqlite_engine
+
+
+engine = _create_engine(settings.DATABASE_URL)
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
+class UTCDateTime(TypeDecorator):
+    """A timezone-aware datetime, stored and returned in UTC on every backend.
+
+    SQLite has no timezone type: values are stored as text without an
+    offset and come back naive. Converting to UTC on the way in keeps them
+    comparable, and on the way out they get their timezone back.
+    """
+
+    impl = DateTime(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, value: datetime | None, dialect) -> datetime | None:
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value
+
+    def process_result_value(self, value: datetime | None, dialect) -> datetime | None:
+        if value is not None and value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value
+
+
 class Base(DeclarativeBase):
     pass
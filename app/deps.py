@@ -1,6 +1,11 @@
-from fastapi import Header, HTTPException, Query
+import math
+
+from fastapi import Header, HTTPException, Query, Request
 
 from app.config import settings
+from app.services.ratelimit import RateLimiter
+
+client_limiter = RateLimiter("client", settings.CLIENT_RATE_LIMIT, settings.CLIENT_RATE_BURST)
 
 
 async def verify_api_key(
@@ -10,3 +15,17 @@ async def verify_api_key(
     key = api_key or x_api_key
     if not key or key != settings.ESP_API_KEY:
         raise HTTPException(status_code=401, detail="Invalid API key")
+
+
+def too_many_requests(limiter: RateLimiter, key) -> HTTPException:
+    retry = math.ceil(limiter.retry_after(key))
+    return HTTPException(
+        status_code=429, detail="Too many requests", headers={"Retry-After": str(retry)}
+    )
+
+
+async def limit_client(request: Request) -> None:
+    """Per-IP rate limit for the public routes."""
+    key = request.client.host if request.client else None
+    if not client_limiter.allow(key):
+        raise too_many_requests(client_limiter, key)
@@ -0,0 +1,213 @@
+"""Logging that keeps stream I/O off the event loop.
+
+The root logger has a single QueueHandler: a log call on the loop formats
+the message and puts the record on a bounded queue, and a QueueListener
+thread writes it out, as JSON lines by default. When the queue is full,
+e.g. because the log driver stalls, records are dropped and counted
+rather than blocking the loop.
+
+Hot messages are thinned before they are queued, matched on their format
+string. LOG_SAMPLE keeps a fraction of a message's records, every n-th
+one. LOG_AGGREGATE replaces a message's records with one summary every
+LOG_AGGREGATE_INTERVAL seconds, e.g. "Ping received from esp1, esp2 (240
+in the last 60s)".
+
+uvicorn's access lines have their api_key redacted, and those for
+LOG_AGGREGATE_ACCESS paths, /ping by default, are aggregated the same
+way, e.g. '"GET /ping" 200, 429 (240 in the last 60s)'.
+"""
+import atexit
+import copy
+import json
+import logging
+import queue
+import re
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import TextIO
+
+from app.config import settings
+from app.metrics import log_records_dropped
+
+QUEUE_SIZE = 10000
+# Distinct values listed per argument in a summary
+SUMMARY_VALUES = 10
+# uvicorn.access records: (client, method, path with query, HTTP version, status)
+ACCESS_FORMAT = '%s - "%s %s HTTP/%s" %d'
+# What access records of aggregated paths become: (method, path, status).
+# %s throughout, since a summary fills in lists of values
+ACCESS_SUMMARY = '"%s %s" %s'
+API_KEY_QUERY = re.compile(r"([?&]api_key=)[^&]*")
+
+_listener: QueueListener | None = None
+_summarizer: tuple[threading.Thread, threading.Event] | None = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DroppingQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Like QueueHandler.prepare, but the traceback stays out of the message
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped.inc()
+
+
+class AccessLog(logging.Filter):
+    """Redacts uvicorn access records and marks those of ``aggregate`` paths for Thinning."""
+
+    def __init__(self, aggregate: list[str]) -> None:
+        super().__init__()
+        self.aggregate = frozenset(aggregate)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.name != "uvicorn.access" or record.msg != ACCESS_FORMAT:
+            return True
+        client, method, path, version, status = record.args
+        route = path.split("?", 1)[0]
+        if route in self.aggregate:
+            record.msg, record.args = ACCESS_SUMMARY, (method, route, status)
+        else:
+            record.args = (client, method, API_KEY_QUERY.sub(r"\1***", path), version, status)
+        return True
+
+
+class Thinning(logging.Filter):
+    """Samples and aggregates records by format string; see the module docstring."""
+
+    def __init__(self, sample: dict[str, float], aggregate: list[str]) -> None:
+        super().__init__()
+        self.every = {msg: max(1, round(1 / rate)) if rate > 0 else 0 for msg, rate in sample.items()}
+        self.aggregate = frozenset(aggregate)
+        self._seen: dict[str, int] = {}
+        # (logger, level, format string) -> {args: count}
+        self._counts: dict[tuple[str, int, str], dict[tuple, int]] = {}
+        # Taken by the summary thread too
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        msg = record.msg
+        # Anything can be logged, e.g. a dict, which isn't hashable
+        if not isinstance(msg, str):
+            return True
+        if msg in self.aggregate:
+            key = (record.name, record.levelno, msg)
+            args = record.args if isinstance(record.args, tuple) else ()
+            with self._lock:
+                by_args = self._counts.setdefault(key, {})
+                by_args[args] = by_args.get(args, 0) + 1
+            return False
+        every = self.every.get(msg)
+        if every is None:
+            return True
+        seen = self._seen[msg] = self._seen.get(msg, 0) + 1
+        return every > 0 and (seen - 1) % every == 0
+
+    def summaries(self, interval: float) -> list[logging.LogRecord]:
+        """One record per aggregated message seen since the last call."""
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        records = []
+        for (name, level, msg), by_args in counts.items():
+            columns = list(zip(*by_args)) if by_args else []
+            values = []
+            for column in columns:
+                distinct = sorted({str(v) for v in column})
+                more = len(distinct) - SUMMARY_VALUES
+                values.append(", ".join(distinct[:SUMMARY_VALUES]) + (f" and {more} more" if more > 0 else ""))
+            try:
+                text = msg % tuple(values)
+            except (TypeError, ValueError):
+                text = msg
+            total = sum(by_args.values())
+            records.append(logging.LogRecord(
+                name, level, __file__, 0, f"{text} ({total} in the last {interval:.0f}s)", None, None
+            ))
+        return records
+
+
+def _summarize(handler: logging.Handler, thinning: Thinning, interval: float, stop: threading.Event) -> None:
+    while not stop.wait(interval):
+        for record in thinning.summaries(interval):
+            handler.handle(record)
+    for record in thinning.summaries(interval):
+        handler.handle(record)
+
+
+def setup_logging(stream: TextIO | None = None) -> None:
+    """Route the root logger, and uvicorn's, through the queue; replaces any earlier setup."""
+    global _listener, _summarizer
+
+    stop_logging()
+    output = logging.StreamHandler(stream or sys.stderr)
+    if settings.LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    log_queue: queue.Queue = queue.Queue(QUEUE_SIZE)
+    handler = DroppingQueueHandler(log_queue)
+    aggregate = settings.LOG_AGGREGATE + ([ACCESS_SUMMARY] if settings.LOG_AGGREGATE_ACCESS else [])
+    thinning = Thinning(settings.LOG_SAMPLE, aggregate)
+    handler.addFilter(AccessLog(settings.LOG_AGGREGATE_ACCESS))
+    handler.addFilter(thinning)
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(logging.INFO)
+    # uvicorn installs its own stream handlers; send its records through the queue too
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        logger = logging.getLogger(name)
+        logger.handlers = []
+        logger.propagate = True
+
+    _listener = QueueListener(log_queue, output)
+    _listener.start()
+    stop = threading.Event()
+    summarizer = threading.Thread(
+        target=_summarize,
+        args=(handler, thinning, settings.LOG_AGGREGATE_INTERVAL, stop),
+        name="log-summaries",
+        daemon=True,
+    )
+    summarizer.start()
+    _summarizer = (summarizer, stop)
+
+
+def stop_logging() -> None:
+    """Write out pending summaries and records, then stop the writer thread."""
+    global _listener, _summarizer
+    if _listener is None:
+        return
+    summarizer, stop = _summarizer
+    stop.set()
+    summarizer.join()
+    _listener.stop()
+    _listener = _summarizer = None
+
+
+atexit.register(stop_logging)
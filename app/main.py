@@ -1,46 +1,190 @@
 import asyncio
 import logging
+import time
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 
-logging.basicConfig(level=logging.INFO)
+from app.logs import setup_logging
+
+# Before the other app imports, so anything they log goes through the queue
+setup_logging()
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
-from app.database import Base, engine
-from app.bot import setup as bot_setup
-from app.bot.setup import setup_bot
-from app.routes import esp, status
-from app.services.monitor import monitor_power
+from app.config import settings
+from app.database import async_session, engine
+from app.deps import limit_client
+from app.migrations import migrate
+from app.routes import esp, history, metrics, outbox, stats, status
+from app.services.cluster import cluster, share_state
+from app.services.heartbeat import start_heartbeat_listener
+from app.services.history import ping_history
+from app.services.subscriber import load_subscribers
 from app.state import power_state
 
+log = logging.getLogger(__name__)
+
+# Seconds between attempts to reach Telegram at startup
+BOT_RETRY = 10
+# Seconds each startup phase took, for the logs and benchmarks.bench_startup
+startup_phases: dict[str, float] = {}
+# Jobs only the leading replica runs, so alerts go out once
+_leader_tasks: list[asyncio.Task] = []
+# Set once Telegram is reachable; until then a leader only persists pings
+_bot = None
+_background: asyncio.Task | None = None
+_heartbeats: asyncio.DatagramTransport | None = None
+
+
+async def _phase(name: str, awaitable):
+    started = time.perf_counter()
+    try:
+        result = await awaitable
+    except Exception:
+        log.warning("Startup: %s failed after %.3fs", name, time.perf_counter() - started)
+        raise
+    startup_phases[name] = round(time.perf_counter() - started, 4)
+    log.info("Startup: %s took %.3fs", name, startup_phases[name])
+    return result
+
+
+async def _load_subscribers() -> None:
+    async with async_session() as session:
+        await load_subscribers(session)
+
+
+async def _lead() -> None:
+    power_state.start_flusher()
+    ping_history.writer = True
+    if _bot is not None:
+        await _start_leader_tasks(_bot)
+
+
+async def _start_leader_tasks(bot) -> None:
+    # The bot stack is imported here and in _start_bot, off the path to serving /ping
+    from app.bot.outbox import outbox_worker
+    from app.bot.setup import start_polling
+    from app.services.monitor import monitor_power
+    from app.services.reminders import reminder_schedulers
+    from app.services.schedule_watch import schedule_watchers
+
+    # Both _lead and _start_bot can get here; the first one starts the jobs
+    if _leader_tasks:
+        return
+    _leader_tasks.append(asyncio.create_task(monitor_power(bot)))
+    _leader_tasks.append(asyncio.create_task(outbox_worker.run(bot)))
+    for region, watcher in schedule_watchers.items():
+        if settings.REMINDER_LEAD_MINUTES:
+            _leader_tasks.append(asyncio.create_task(reminder_schedulers[region].run(bot)))
+        _leader_tasks.append(asyncio.create_task(watcher.run(bot)))
+    if settings.BOT_MODE == "polling":
+        await start_polling()
+
+
+async def _follow() -> None:
+    from app.bot.setup import stop_polling
+
+    for task in _leader_tasks:
+        task.cancel()
+    await asyncio.gather(*_leader_tasks, return_exceptions=True)
+    _leader_tasks.clear()
+    await stop_polling()
+    await power_state.stop_flusher()
+    try:
+        # Hand over with the database up to date, open minutes included
+        ping_history.close()
+        await power_state.save_to_db()
+        await ping_history.flush()
+    finally:
+        ping_history.writer = False
+
+
+async def _start_bot() -> None:
+    """Bring up the bot, then run the leader's jobs when this replica leads; runs while /ping is served."""
+    global _bot
+    from app.bot.setup import setup_bot
+    from app.services.reminders import reminder_schedulers
+    from app.services.schedule_watch import schedule_watchers
+
+    while True:
+        try:
+            application = await _phase("bot", setup_bot())
+            break
+        except Exception:
+            log.exception("Bot startup failed, retrying in %ds", BOT_RETRY)
+            await asyncio.sleep(BOT_RETRY)
+
+    if settings.REMINDER_LEAD_MINUTES:
+        for region, watcher in schedule_watchers.items():
+            watcher.on_change(reminder_schedulers[region].reschedule)
+    _bot = application.bot
+    if cluster.is_leader:
+        try:
+            await _start_leader_tasks(_bot)
+        except Exception:
+            log.exception("leader jobs failed to start")
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Create tables
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-
-    # Restore state from DB
-    await power_state.load_from_db()
+    global _background, _heartbeats
 
-    # Start Telegram bot
-    application = await setup_bot()
+    started = time.perf_counter()
+    await _phase("migrate", migrate(engine))
+    # Independent of each other; /ping only needs the power state
+    await asyncio.gather(
+        _phase("subscribers", _load_subscribers()),
+        _phase("power_state", power_state.load_from_db()),
+    )
+    share_state()
+    ping_history.writer = False
+    ping_history.start_flusher()
+    # Elected before serving /ping and independently of the bot, so pings
+    # are persisted even while Telegram is unreachable; alone it leads at once
+    cluster.on_elected(_lead)
+    cluster.on_demoted(_follow)
+    await _phase("cluster", cluster.start())
+    if settings.HEARTBEAT_UDP_PORT:
+        _heartbeats = await start_heartbeat_listener(
+            settings.HEARTBEAT_UDP_HOST, settings.HEARTBEAT_UDP_PORT
+        )
+    startup_phases["ready"] = round(time.perf_counter() - started, 4)
+    log.info("Startup: accepting requests after %.3fs", startup_phases["ready"])
 
-    # Start background power monitor
-    asyncio.create_task(monitor_power(application.bot))
+    _background = asyncio.create_task(_start_bot())
 
     yield
 
-    # Graceful shutdown: save state, stop bot
+    # Graceful shutdown: flush buffered pings, hand over leadership, stop bot
+    from app.bot.setup import shutdown_bot
+    from app.services.schedule import close_http_client
+
+    if _heartbeats is not None:
+        _heartbeats.close()
+    _background.cancel()
+    await asyncio.gather(_background, return_exceptions=True)
+    await ping_history.stop_flusher()
+    # A leader hands over in _follow, which saves first
+    await cluster.stop()
+    # Whatever the role, leave this replica's pings in the database, in case
+    # no other replica is left to write them
+    ping_history.writer = True
+    ping_history.close()
     await power_state.save_to_db()
-    if bot_setup.tg_app:
-        await bot_setup.tg_app.updater.stop()
-        await bot_setup.tg_app.stop()
-        await bot_setup.tg_app.shutdown()
+    await ping_history.flush()
+    await shutdown_bot()
+    await close_http_client()
 
 
 app = FastAPI(lifespan=lifespan)
 
 app.include_router(esp.router)
-app.include_router(status.router)
+app.include_router(status.router, dependencies=[Depends(limit_client)])
+app.include_router(stats.router, dependencies=[Depends(limit_client)])
+app.include_router(history.router, dependencies=[Depends(limit_client)])
+app.include_router(metrics.router)
+app.include_router(outbox.router, dependencies=[Depends(limit_client)])
+if settings.BOT_MODE == "webhook":
+    from app.routes import telegram
+
+    app.include_router(telegram.router)
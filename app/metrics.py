@@ -0,0 +1,210 @@
+"""In-process metrics in the Prometheus text format.
+
+Everything runs on the event loop thread, so updates are plain attribute
+arithmetic with no locks. Histogram buckets are preallocated and found
+with bisect, so an observation doesn't allocate a new container.
+"""
+from bisect import bisect_left
+from collections.abc import Callable
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+class Counter:
+    __slots__ = ("name", "help", "labels", "value")
+
+    def __init__(self, name: str, help: str, labels: dict[str, str] | None = None) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labels)} {self.value}"]
+
+
+class LabeledCounter:
+    """A counter family; each label value gets its own Counter on first use."""
+
+    __slots__ = ("name", "help", "label", "children")
+
+    def __init__(self, name: str, help: str, label: str) -> None:
+        self.name = name
+        self.help = help
+        self.label = label
+        self.children: dict[str, Counter] = {}
+
+    def inc(self, value: str, amount: int = 1) -> None:
+        child = self.children.get(value)
+        if child is None:
+            child = self.children[value] = Counter(self.name, self.help, {self.label: value})
+        child.value += amount
+
+    def samples(self) -> list[str]:
+        return [line for child in self.children.values() for line in child.samples()]
+
+
+class Gauge:
+    """A value read at scrape time from ``fn``."""
+
+    __slots__ = ("name", "help", "fn")
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]) -> None:
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def samples(self) -> list[str]:
+        return [f"{self.name} {self.fn()}"]
+
+
+class Histogram:
+    __slots__ = ("name", "help", "buckets", "counts", "sum", "count")
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # One slot per bucket plus +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: list = []
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._add(Counter(name, help))
+
+    def labeled_counter(self, name: str, help: str, label: str) -> LabeledCounter:
+        return self._add(LabeledCounter(name, help, label))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float]) -> Gauge:
+        return self._add(Gauge(name, help, fn))
+
+    def histogram(
+        self, name: str, help: str, buckets: tuple[float, ...] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._add(Histogram(name, help, buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            kind = {
+                Histogram: "histogram",
+                Gauge: "gauge",
+            }.get(type(metric), "counter")
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+ping_latency = registry.histogram("lcm_ping_seconds", "Time to handle a /ping request")
+rate_limited = registry.labeled_counter(
+    "lcm_rate_limited_total", "Requests turned away or coalesced by a rate limiter", "limiter"
+)
+heartbeat_packets = registry.labeled_counter(
+    "lcm_heartbeat_packets_total", "UDP heartbeat packets by outcome", "result"
+)
+db_commit_latency = registry.histogram(
+    "lcm_power_state_commit_seconds", "Time to commit device state in upsert_power_states"
+)
+schedule_fetch_latency = registry.histogram(
+    "lcm_schedule_fetch_seconds", "Time to download or revalidate the outage schedule"
+)
+schedule_cache_hits = registry.counter(
+    "lcm_schedule_cache_hits_total", "Schedule requests answered from cache"
+)
+schedule_cache_misses = registry.counter(
+    "lcm_schedule_cache_misses_total", "Schedule requests that waited for a fetch"
+)
+render_cache_hits = registry.labeled_counter(
+    "lcm_render_cache_hits_total", "Bot replies served from a render cache", "cache"
+)
+render_cache_misses = registry.labeled_counter(
+    "lcm_render_cache_misses_total", "Bot replies rendered afresh", "cache"
+)
+broadcast_duration = registry.histogram(
+    "lcm_broadcast_seconds", "Time to send one broadcast to all its recipients", SLOW_BUCKETS
+)
+broadcast_sent = registry.counter("lcm_broadcast_messages_total", "Messages delivered by broadcasts")
+broadcast_errors = registry.labeled_counter(
+    "lcm_broadcast_errors_total", "Failed message sends by reason", "reason"
+)
+monitor_lag = registry.histogram(
+    "lcm_monitor_lag_seconds", "How late the monitor handled a device deadline"
+)
+log_records_dropped = registry.counter(
+    "lcm_log_records_dropped_total", "Log records dropped because the log queue was full"
+)
+outage_alert_delay = registry.histogram(
+    "lcm_outage_alert_seconds",
+    "Time from a device's last ping until Telegram accepted its outage alert, per recipient",
+    SLOW_BUCKETS,
+)
+
+
+class DetectionStats:
+    """How late outages are declared relative to their deadline."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        # Last ping to outage declaration, for the most recent outage
+        self.last_silence = 0.0
+
+    def observe(self, lag: float, silence: float) -> None:
+        self.count += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.total_lag += lag
+        self.last_silence = silence
+
+    def as_dict(self) -> dict:
+        return {
+            "outages_detected": self.count,
+            "last_lag_ms": round(self.last_lag * 1000, 1),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "avg_lag_ms": round(self.total_lag / self.count * 1000, 1) if self.count else 0.0,
+            "last_silence_seconds": round(self.last_silence, 1),
+        }
+
+
+detection = DetectionStats()
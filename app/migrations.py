@@ -0,0 +1,131 @@
+"""Versioned schema migrations, run at startup.
+
+The schema_version table records the last migration applied, so a boot
+against an up-to-date database costs one query instead of a create_all
+sweep over every table. Any schema change needs a new entry at the end
+of MIGRATIONS; create_all only covers databases that start out empty.
+"""
+import logging
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import DEFAULT_DEVICE, DEFAULT_REGION
+from app.database import Base
+from app.models import OutboxJob, PendingReminder, SchemaVersion
+
+log = logging.getLogger(__name__)
+
+# pg_advisory_xact_lock key, so replicas booting together migrate once
+MIGRATION_LOCK = 0x6C636E
+
+
+def _create_tables(conn: Connection) -> None:
+    # Also fills in tables missing from databases created before versioning
+    Base.metadata.create_all(conn)
+
+
+def _add_subscriber_preferences(conn: Connection) -> None:
+    # create_all didn't add these to subscribers tables that already existed
+    existing = {c["name"] for c in inspect(conn).get_columns("subscribers")}
+    columns = {
+        "quiet_start": "SMALLINT",
+        "quiet_end": "SMALLINT",
+        "off_only": "BOOLEAN NOT NULL DEFAULT FALSE",
+        "schedule_alerts": "BOOLEAN NOT NULL DEFAULT TRUE",
+        "groups": "VARCHAR(255)",
+    }
+    for name, ddl in columns.items():
+        if name not in existing:
+            conn.execute(text(f'ALTER TABLE subscribers ADD COLUMN "{name}" {ddl}'))
+
+
+def _add_reminder_source(conn: Connection) -> None:
+    existing = {c["name"] for c in inspect(conn).get_columns("pending_reminders")}
+    if "source" in existing:
+        return
+    # The column joins the primary key, which SQLite can only change by
+    # rebuilding the table. Existing reminders came from the first region.
+    conn.execute(text("ALTER TABLE pending_reminders RENAME TO pending_reminders_old"))
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("ALTER INDEX pending_reminders_pkey RENAME TO pending_reminders_old_pkey"))
+    PendingReminder.__table__.create(conn)
+    conn.execute(
+        text(
+            'INSERT INTO pending_reminders (source, "group", starts_at, fire_at) '
+            'SELECT :source, "group", starts_at, fire_at FROM pending_reminders_old'
+        ),
+        {"source": DEFAULT_REGION},
+    )
+    conn.execute(text("DROP TABLE pending_reminders_old"))
+
+
+def _move_single_device_state(conn: Connection) -> None:
+    if not inspect(conn).has_table("power_state"):
+        return
+    # The one-device table became device_power_state; its row belongs to the
+    # first device, unless that already has state of its own
+    conn.execute(
+        text(
+            "INSERT INTO device_power_state "
+            "(device_id, power_is_on, last_ping_at, power_off_at, power_on_at, updated_at) "
+            "SELECT :device, power_is_on, last_ping_at, power_off_at, power_on_at, updated_at "
+            "FROM power_state WHERE id = 1 AND NOT EXISTS "
+            "(SELECT 1 FROM device_power_state WHERE device_id = :device)"
+        ),
+        {"device": DEFAULT_DEVICE},
+    )
+    # Single-device subscribers implicitly followed the one ESP. Subscriptions
+    # already there mean multi-device code has run and backfilled them
+    conn.execute(
+        text(
+            "INSERT INTO subscriptions (chat_id, device_id) "
+            "SELECT chat_id, :device FROM subscribers "
+            "WHERE NOT EXISTS (SELECT 1 FROM subscriptions)"
+        ),
+        {"device": DEFAULT_DEVICE},
+    )
+    conn.execute(text("DROP TABLE power_state"))
+
+
+def _add_outbox_event_time(conn: Connection) -> None:
+    existing = {c["name"] for c in inspect(conn).get_columns("outbox_jobs")}
+    if "event_at" not in existing:
+        ddl = OutboxJob.__table__.c.event_at.type.compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE outbox_jobs ADD COLUMN event_at {ddl}"))
+
+
+MIGRATIONS = [
+    (1, "create tables", _create_tables),
+    (2, "subscriber preference columns", _add_subscriber_preferences),
+    (3, "schedule region of pending reminders", _add_reminder_source),
+    (4, "single-device power state and subscriptions", _move_single_device_state),
+    (5, "outbox job event time", _add_outbox_event_time),
+]
+LATEST = MIGRATIONS[-1][0]
+
+
+async def get_schema_version(conn) -> int:
+    result = await conn.execute(select(SchemaVersion.version).where(SchemaVersion.id == 1))
+    return result.scalar() or 0
+
+
+async def migrate(engine: AsyncEngine) -> int:
+    """Bring the schema up to LATEST; returns the version found before migrating."""
+    async with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK})
+        await conn.run_sync(SchemaVersion.__table__.create, checkfirst=True)
+        current = await get_schema_version(conn)
+        for version, name, step in MIGRATIONS:
+            if version > current:
+                log.info("Applying migration %d: %s", version, name)
+                await conn.run_sync(step)
+        if current == 0:
+            await conn.execute(SchemaVersion.__table__.insert().values(id=1, version=LATEST))
+        elif current < LATEST:
+            await conn.execute(
+                SchemaVersion.__table__.update().where(SchemaVersion.id == 1).values(version=LATEST)
+            )
+    return current
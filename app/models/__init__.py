@@ -1,4 +1,24 @@
+from app.models.event import PowerDailyStats, PowerEvent
+from app.models.history import PingHistory
+from app.models.outbox import OutboxDelivery, OutboxJob
 from app.models.power import PowerState
-from app.models.subscriber import Subscriber
+from app.models.reminder import PendingReminder
+from app.models.schema import SchemaVersion
+from app.models.schedule import ScheduleVersion
+from app.models.subscriber import Subscriber, Subscription
+from app.models.telemetry import Telemetry
 
-__all__ = ["PowerState", "Subscriber"]
+__all__ = [
+    "OutboxDelivery",
+    "OutboxJob",
+    "PendingReminder",
+    "PingHistory",
+    "PowerDailyStats",
+    "PowerEvent",
+    "PowerState",
+    "ScheduleVersion",
+    "SchemaVersion",
+    "Subscriber",
+    "Subscription",
+    "Telemetry",
+]
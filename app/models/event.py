@@ -0,0 +1,38 @@
+from datetime import date, datetime
+
+from sqlalchemy import BigInteger, Boolean, Date, Index, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base, UTCDateTime
+
+
+class PowerEvent(Base):
+    """Append-only log of power transitions."""
+
+    __tablename__ = "power_events"
+    __table_args__ = (Index("ix_power_events_device_at", "device_id", "at"),)
+
+    # SQLite only autoincrements INTEGER primary keys
+    id: Mapped[int] = mapped_column(
+        BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True
+    )
+    device_id: Mapped[str] = mapped_column(String(64), nullable=False)
+    # State the device entered: True = power came back, False = power lost
+    power_is_on: Mapped[bool] = mapped_column(Boolean, nullable=False)
+    at: Mapped[datetime] = mapped_column(UTCDateTime, nullable=False)
+
+
+class PowerDailyStats(Base):
+    """Per-device, per-day outage rollup, updated as each outage ends.
+
+    Days are Kyiv local dates. Downtime is split across the days an outage
+    spans; the outage itself and its full length count on the day it began.
+    """
+
+    __tablename__ = "power_daily_stats"
+
+    device_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    outages: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    downtime_seconds: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    longest_outage_seconds: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
@@ -0,0 +1,23 @@
+from datetime import datetime
+
+from sqlalchemy import Float, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base, UTCDateTime
+
+
+class PingHistory(Base):
+    """Ping activity rolled up per minute, hour or day."""
+
+    __tablename__ = "ping_history"
+
+    device_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    # "minute", "hour" or "day"
+    resolution: Mapped[str] = mapped_column(String(8), primary_key=True)
+    bucket_start: Mapped[datetime] = mapped_column(UTCDateTime, primary_key=True)
+    pings: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Silences longer than PING_TIMEOUT that ended in this bucket
+    gaps: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    max_gap_seconds: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    # Seconds covered by pings (each ping vouches for up to PING_TIMEOUT)
+    covered_seconds: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import BigInteger, ForeignKey, Index, Integer, SmallInteger, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base, UTCDateTime
+
+
+class OutboxJob(Base):
+    """One alert to broadcast, e.g. a site's power transition."""
+
+    __tablename__ = "outbox_jobs"
+
+    # SQLite only autoincrements INTEGER primary keys
+    id: Mapped[int] = mapped_column(
+        BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True
+    )
+    # Identifies the event, so enqueueing it again is a no-op
+    dedupe_key: Mapped[str] = mapped_column(String(128), nullable=False, unique=True)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        UTCDateTime,
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc),
+    )
+    # For a power-off alert, the device's last ping, so delivery can be timed from it
+    event_at: Mapped[datetime | None] = mapped_column(UTCDateTime, nullable=True)
+    # Set once no delivery is pending
+    completed_at: Mapped[datetime | None] = mapped_column(UTCDateTime, nullable=True)
+
+
+class OutboxDelivery(Base):
+    """A job's message to one chat."""
+
+    __tablename__ = "outbox_deliveries"
+    __table_args__ = (Index("ix_outbox_deliveries_status_job", "status", "job_id"),)
+
+    job_id: Mapped[int] = mapped_column(
+        BigInteger().with_variant(Integer, "sqlite"),
+        ForeignKey("outbox_jobs.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # pending, sent or failed
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="pending")
+    attempts: Mapped[int] = mapped_column(SmallInteger, nullable=False, default=0)
+    # A worker's claim on the delivery; it's up for grabs again once this passes
+    claimed_until: Mapped[datetime | None] = mapped_column(UTCDateTime, nullable=True)
+    sent_at: Mapped[datetime | None] = mapped_column(UTCDateTime, nullable=True)
@@ -1,27 +1,21 @@
 from datetime import datetime, timezone
 
-from sqlalchemy import Boolean, DateTime, Integer
+from sqlalchemy import Boolean, String
 from sqlalchemy.orm import Mapped, mapped_column
 
-from app.database import Base
+from app.database import Base, UTCDateTime
 
 
 class PowerState(Base):
-    __tablename__ = "power_state"
+    __tablename__ = "device_power_state"
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    device_id: Mapped[str] = mapped_column(String(64), primary_key=True)
     power_is_on: Mapped[bool] = mapped_column(Boolean, nullable=False)
-    last_ping_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), nullable=False
-    )
-    power_off_at: Mapped[datetime | None] = mapped_column(
-        DateTime(timezone=True), nullable=True
-    )
-    power_on_at: Mapped[datetime | None] = mapped_column(
-        DateTime(timezone=True), nullable=True
-    )
+    last_ping_at: Mapped[datetime] = mapped_column(UTCDateTime, nullable=False)
+    power_off_at: Mapped[datetime | None] = mapped_column(UTCDateTime, nullable=True)
+    power_on_at: Mapped[datetime | None] = mapped_column(UTCDateTime, nullable=True)
     updated_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True),
+        UTCDateTime,
         nullable=False,
         default=lambda: datetime.now(timezone.utc),
         onupdate=lambda: datetime.now(timezone.utc),
@@ -0,0 +1,19 @@
+from datetime import datetime
+
+from sqlalchemy import String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base, UTCDateTime
+
+
+class PendingReminder(Base):
+    """A pre-outage reminder that hasn't been sent yet."""
+
+    __tablename__ = "pending_reminders"
+
+    # Region whose schedule planned the outage
+    source: Mapped[str] = mapped_column(String(64), primary_key=True)
+    group: Mapped[str] = mapped_column(String(32), primary_key=True)
+    # Planned start of the outage
+    starts_at: Mapped[datetime] = mapped_column(UTCDateTime, primary_key=True)
+    fire_at: Mapped[datetime] = mapped_column(UTCDateTime, nullable=False)
@@ -0,0 +1,28 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import BigInteger, Index, Integer, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base, UTCDateTime
+
+
+class ScheduleVersion(Base):
+    """A distinct version of a published outage schedule."""
+
+    __tablename__ = "schedule_versions"
+    __table_args__ = (Index("ix_schedule_versions_source_id", "source", "id"),)
+
+    # SQLite only autoincrements INTEGER primary keys
+    id: Mapped[int] = mapped_column(
+        BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True
+    )
+    source: Mapped[str] = mapped_column(String(64), nullable=False)
+    # sha256 of the downloaded body
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=False)
+    fetched_at: Mapped[datetime] = mapped_column(
+        UTCDateTime,
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc),
+    )
+    # JSON {day_key: {group: hex of the 24 slot codes}}, for diffing the next version
+    slots: Mapped[str] = mapped_column(Text, nullable=False)
@@ -1,9 +1,9 @@
 from datetime import datetime, timezone
 
-from sqlalchemy import BigInteger, DateTime
+from sqlalchemy import BigInteger, Boolean, ForeignKey, SmallInteger, String
 from sqlalchemy.orm import Mapped, mapped_column
 
-from app.database import Base
+from app.database import Base, UTCDateTime
 
 
 class Subscriber(Base):
@@ -11,7 +11,27 @@ class Subscriber(Base):
 
     chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     created_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True),
+        UTCDateTime,
         nullable=False,
         default=lambda: datetime.now(timezone.utc),
     )
+    # Notification preferences, see app.state.Preferences
+    quiet_start: Mapped[int | None] = mapped_column(SmallInteger, nullable=True)
+    quiet_end: Mapped[int | None] = mapped_column(SmallInteger, nullable=True)
+    off_only: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    schedule_alerts: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
+    # Comma-separated outage groups; NULL means all groups of the followed sites' regions
+    groups: Mapped[str | None] = mapped_column(String(255), nullable=True)
+
+
+class Subscription(Base):
+    """A site (device) a subscriber follows."""
+
+    __tablename__ = "subscriptions"
+
+    chat_id: Mapped[int] = mapped_column(
+        BigInteger,
+        ForeignKey("subscribers.chat_id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    device_id: Mapped[str] = mapped_column(String(64), primary_key=True, index=True)
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Float, Index, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base, UTCDateTime
+
+
+class Telemetry(Base):
+    """One reading reported by an ESP device."""
+
+    __tablename__ = "telemetry"
+    __table_args__ = (Index("ix_telemetry_device_measured_at", "device_id", "measured_at"),)
+
+    # SQLite only autoincrements INTEGER primary keys
+    id: Mapped[int] = mapped_column(
+        BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True
+    )
+    device_id: Mapped[str] = mapped_column(String(64), nullable=False)
+    # Device-side counter; resets when the ESP reboots
+    seq: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    # Device clock when it sent one, otherwise when the server received it
+    measured_at: Mapped[datetime] = mapped_column(UTCDateTime, nullable=False)
+    received_at: Mapped[datetime] = mapped_column(UTCDateTime, nullable=False)
+    voltage: Mapped[float | None] = mapped_column(Float, nullable=True)
+    uptime: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    rssi: Mapped[int | None] = mapped_column(Integer, nullable=True)
@@ -1,16 +1,74 @@
 import logging
+import time
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import ValidationError
 
-from app.deps import verify_api_key
+from app.config import DEFAULT_DEVICE, settings
+from app.database import async_session
+from app.deps import too_many_requests, verify_api_key
+from app.metrics import ping_latency
+from app.services.ratelimit import RateLimiter
+from app.services.telemetry import insert_samples, parse_samples
 from app.state import power_state
 
 log = logging.getLogger(__name__)
 router = APIRouter()
 
+MAX_SAMPLES = 1000
+# Well above MAX_SAMPLES readings in either encoding
+MAX_BODY = 256 * 1024
+
+# Per device rather than per API key, which all devices share
+device_limiter = RateLimiter("device", settings.DEVICE_RATE_LIMIT, settings.DEVICE_RATE_BURST)
+
 
 @router.get("/ping", dependencies=[Depends(verify_api_key)])
-async def ping():
-    await power_state.record_ping_and_save()
-    log.info("Ping received")
+async def ping(device: str = Query(DEFAULT_DEVICE)):
+    started = time.perf_counter()
+    if power_state.get(device) is None:
+        raise HTTPException(status_code=404, detail="Unknown device")
+    if not device_limiter.allow(device):
+        # Coalesced into the ping let through a moment ago: same answer, no write
+        return {"status": "ok"}
+    await power_state.record_ping_and_save(device)
+    log.info("Ping received from %s", device)
+    ping_latency.observe(time.perf_counter() - started)
     return {"status": "ok"}
+
+
+@router.post("/telemetry", dependencies=[Depends(verify_api_key)])
+async def telemetry(request: Request, device: str = Query(DEFAULT_DEVICE)):
+    """Batched readings: newline-delimited JSON, or msgpack with Content-Type application/msgpack."""
+    if power_state.get(device) is None:
+        raise HTTPException(status_code=404, detail="Unknown device")
+    if not device_limiter.allow(device):
+        raise too_many_requests(device_limiter, device)
+
+    try:
+        samples = parse_samples(await _read_body(request), request.headers.get("content-type", ""))
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid telemetry: {e}")
+    if len(samples) > MAX_SAMPLES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_SAMPLES} samples per request")
+
+    # A telemetry upload proves the device is alive, same as /ping; only
+    # recorded once the whole batch has validated
+    await power_state.record_ping_and_save(device)
+    async with async_session() as session:
+        await insert_samples(session, device, samples)
+    return {"status": "ok", "accepted": len(samples)}
+
+
+async def _read_body(request: Request) -> bytes:
+    """The request body, or 413 once it is larger than MAX_BODY."""
+    too_large = HTTPException(status_code=413, detail=f"At most {MAX_BODY} bytes per request")
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > MAX_BODY:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_BODY:
+            raise too_large
+    return bytes(body)
@@ -0,0 +1,51 @@
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Literal
+
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import AwareDatetime
+
+from app.config import DEFAULT_DEVICE
+from app.database import async_session
+from app.services.history import get_history, ping_history
+from app.state import power_state
+
+router = APIRouter()
+
+DEFAULT_SPAN = {
+    "raw": timedelta(minutes=10),
+    "minute": timedelta(hours=6),
+    "hour": timedelta(days=7),
+    "day": timedelta(days=90),
+}
+
+
+@router.get("/history")
+async def history(
+    device: str = Query(DEFAULT_DEVICE),
+    resolution: Literal["raw", "minute", "hour", "day"] = Query("hour"),
+    start: AwareDatetime | None = Query(None),
+    end: AwareDatetime | None = Query(None),
+):
+    """Pings of ``device`` in ``[start, end)``, raw or bucketed.
+
+    ``start`` and ``end`` are ISO 8601 with a UTC offset, e.g.
+    2024-05-01T00:00:00Z; without one they are rejected with a 422.
+    """
+    if power_state.get(device) is None:
+        raise HTTPException(status_code=404, detail="Unknown device")
+    end = end or datetime.now(timezone.utc)
+    start = start or end - DEFAULT_SPAN[resolution]
+
+    if resolution == "raw":
+        pings = ping_history.raw(device, start.timestamp())
+        return {
+            "device": device,
+            "resolution": resolution,
+            "pings": [t for t in pings if t < end.timestamp()],
+            "now": time.time(),
+        }
+
+    async with async_session() as session:
+        series = await get_history(session, device, resolution, start, end)
+    return {"device": device, "resolution": resolution, "series": series}
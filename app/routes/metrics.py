@@ -0,0 +1,22 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.metrics import registry
+from app.state import power_state, subscriber_registry
+
+router = APIRouter()
+
+registry.gauge("lcm_subscribers", "Subscribed chats", lambda: len(subscriber_registry))
+registry.gauge(
+    "lcm_devices_powered",
+    "Devices currently reporting power",
+    lambda: sum(d.power_is_on for d in power_state.devices.values()),
+)
+registry.gauge("lcm_devices", "Configured devices", lambda: len(power_state.devices))
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+
+from app.database import async_session
+from app.services.outbox import get_outbox_stats
+
+router = APIRouter()
+
+
+@router.get("/outbox")
+async def outbox():
+    async with async_session() as session:
+        return await get_outbox_stats(session)
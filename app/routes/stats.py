@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta, timezone
+
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import AwareDatetime
+
+from app.config import DEFAULT_DEVICE
+from app.database import async_session
+from app.services.events import get_outage_stats, get_power_events
+from app.state import power_state
+
+router = APIRouter()
+
+
+def _device_or_404(device_id: str):
+    device = power_state.get(device_id)
+    if device is None:
+        raise HTTPException(status_code=404, detail="Unknown device")
+    return device
+
+
+@router.get("/stats")
+async def stats(
+    device: str = Query(DEFAULT_DEVICE),
+    days: int = Query(30, ge=1, le=3660),
+):
+    state = _device_or_404(device)
+    ongoing = (
+        datetime.fromtimestamp(state.power_off_time, tz=timezone.utc)
+        if not state.power_is_on and state.power_off_time
+        else None
+    )
+    async with async_session() as session:
+        result = await get_outage_stats(session, device, days, ongoing_since=ongoing)
+    return {"device": device, **result.as_dict()}
+
+
+@router.get("/events")
+async def events(
+    device: str = Query(DEFAULT_DEVICE),
+    start: AwareDatetime | None = Query(None),
+    end: AwareDatetime | None = Query(None),
+):
+    """Power events of ``device`` in ``[start, end)``; times as for /history."""
+    _device_or_404(device)
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=7)
+    async with async_session() as session:
+        rows = await get_power_events(session, device, start, end)
+    return {
+        "device": device,
+        "events": [{"power_is_on": r.power_is_on, "at": r.at.isoformat()} for r in rows],
+    }
@@ -2,20 +2,31 @@ import time
 
 from fastapi import APIRouter
 
-from app.database import async_session
-from app.services.subscriber import get_all_subscribers
-from app.state import power_state
+from app.config import DEFAULT_DEVICE
+from app.metrics import detection
+from app.services.cluster import cluster
+from app.state import power_state, subscriber_registry
 
 router = APIRouter()
 
 
 @router.get("/status")
 async def status():
-    async with async_session() as session:
-        subscribers = await get_all_subscribers(session)
+    now = time.time()
+    devices = {
+        device.device_id: {
+            "name": device.name,
+            "power_is_on": device.power_is_on,
+            "last_ping_ago_seconds": int(now - device.last_ping),
+        }
+        for device in power_state.devices.values()
+    }
 
     return {
-        "power_is_on": power_state.power_is_on,
-        "last_ping_ago_seconds": int(time.time() - power_state.last_ping),
-        "subscribers": len(subscribers),
+        # Top-level fields describe the default device, as before
+        **{k: v for k, v in devices[DEFAULT_DEVICE].items() if k != "name"},
+        "devices": devices,
+        "subscribers": len(subscriber_registry),
+        "detection": detection.as_dict(),
+        "cluster": cluster.as_dict(),
     }
@@ -0,0 +1,34 @@
+"""Webhook endpoint for the Telegram bot (BOT_MODE=webhook).
+
+To try it locally, post a recorded update with the secret header:
+
+    curl -X POST localhost:8000/telegram/webhook \
+        -H "X-Telegram-Bot-Api-Secret-Token: $BOT_WEBHOOK_SECRET" \
+        -H "Content-Type: application/json" -d @update.json
+"""
+import hmac
+
+from fastapi import APIRouter, Header, HTTPException, Request
+
+from app.bot import setup as bot_setup
+from app.config import settings
+
+router = APIRouter()
+
+
+@router.post(bot_setup.WEBHOOK_PATH)
+async def telegram_webhook(
+    request: Request,
+    x_telegram_bot_api_secret_token: str | None = Header(None),
+):
+    if not hmac.compare_digest(
+        x_telegram_bot_api_secret_token or "", settings.BOT_WEBHOOK_SECRET or ""
+    ):
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+    if bot_setup.tg_app is None:
+        raise HTTPException(status_code=503, detail="Bot is not ready")
+
+    # A non-2xx answer makes Telegram redeliver the update later
+    if not bot_setup.enqueue_update(await request.json()):
+        raise HTTPException(status_code=503, detail="Update queue is full")
+    return {"ok": True}
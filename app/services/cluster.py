@@ -0,0 +1,252 @@
+"""Coordination between app replicas sharing one Postgres database.
+
+One replica at a time holds a session-level advisory lock and is the
+leader: it runs the monitor, the schedule jobs and the bot's polling, so
+alerts go out once. Every replica accepts pings. Pings, power transitions
+and subscriber changes are published with NOTIFY on one channel, so each
+replica's in-memory state stays complete and any of them can take over.
+
+Takeover is bounded. If the leader's process dies, Postgres drops its
+connection and the lock at once, and a follower gets the lock within
+CLUSTER_POLL_INTERVAL. If the leader loses the database instead, it steps
+down after a failed health check, which takes at most two poll intervals.
+TCP keepalives make the server release the lock after about 11 seconds,
+which is later than that, so two leaders never overlap.
+
+With any other database the process is alone, and it leads from the start.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+from collections.abc import Awaitable, Callable
+
+from sqlalchemy.engine import make_url
+
+from app.config import settings
+from app.database import async_session
+from app.services.subscriber import reload_subscriber
+from app.state import DeviceState, power_state, subscriber_registry
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "lcm_replicas"
+# pg_try_advisory_lock key for the leader role ("lcm")
+LEADER_LOCK = 0x6C636D
+# NOTIFY payloads are limited to 8000 bytes
+MAX_PAYLOAD = 7500
+# Server side: declare the connection dead after 5 + 3 * 2 seconds of silence
+KEEPALIVES = {
+    "tcp_keepalives_idle": "5",
+    "tcp_keepalives_interval": "2",
+    "tcp_keepalives_count": "3",
+}
+
+Callback = Callable[[], Awaitable[None]]
+
+
+class Cluster:
+    def __init__(self, database_url: str, poll_interval: float) -> None:
+        url = make_url(database_url)
+        self.enabled = url.get_backend_name() == "postgresql"
+        # asyncpg takes a plain libpq URL
+        self.dsn = url.set(drivername="postgresql").render_as_string(hide_password=False)
+        self.poll_interval = poll_interval
+        self.replica_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = False
+        self._conn = None
+        # asyncpg runs one query at a time per connection
+        self._conn_lock = asyncio.Lock()
+        self._elected: list[Callback] = []
+        self._demoted: list[Callback] = []
+        self._handlers: dict[str, Callable[[list], None]] = {}
+        # Outgoing messages by kind, coalesced by key until the publisher runs
+        self._outbox: dict[str, dict] = {}
+        self._pending = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def on_elected(self, callback: Callback) -> None:
+        self._elected.append(callback)
+
+    def on_demoted(self, callback: Callback) -> None:
+        self._demoted.append(callback)
+
+    def subscribe(self, kind: str, handler: Callable[[list], None]) -> None:
+        """Call ``handler(items)`` with each batch of ``kind`` items from other replicas."""
+        self._handlers[kind] = handler
+
+    def publish(self, kind: str, key, item) -> None:
+        """Queue ``item`` for the other replicas; a later item with the same key replaces it."""
+        if not self.enabled:
+            return
+        self._outbox.setdefault(kind, {})[key] = item
+        self._pending.set()
+
+    def as_dict(self) -> dict:
+        return {
+            "replica": self.replica_id,
+            "clustered": self.enabled,
+            "leader": self.is_leader,
+            "connected": self._conn is not None,
+        }
+
+    async def start(self) -> None:
+        if not self.enabled:
+            await self._set_leader(True)
+            return
+        self._tasks = [
+            asyncio.create_task(self._run()),
+            asyncio.create_task(self._publish_loop()),
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        # Closing the connection, if any, releases the lock for a successor
+        await self._set_leader(False)
+
+    async def _set_leader(self, leader: bool) -> None:
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        log.info("Replica %s %s", self.replica_id, "is now the leader" if leader else "stepped down")
+        for callback in self._elected if leader else self._demoted:
+            try:
+                await callback()
+            except Exception:
+                log.exception("leader callback failed")
+
+    async def _run(self) -> None:
+        import asyncpg
+
+        while True:
+            try:
+                conn = await asyncpg.connect(
+                    self.dsn, timeout=self.poll_interval * 5, server_settings=KEEPALIVES
+                )
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError):
+                log.warning("Replica coordination can't reach the database", exc_info=True)
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            try:
+                await conn.add_listener(CHANNEL, self._on_notify)
+                self._conn = conn
+                while True:
+                    async with self._conn_lock:
+                        if self.is_leader:
+                            # Health check: a leader that can't reach the server
+                            # must stop acting before the server drops its lock
+                            await conn.fetchval("SELECT 1", timeout=self.poll_interval)
+                            acquired = True
+                        else:
+                            acquired = await conn.fetchval(
+                                "SELECT pg_try_advisory_lock($1)",
+                                LEADER_LOCK,
+                                timeout=self.poll_interval,
+                            )
+                    await self._set_leader(acquired)
+                    await asyncio.sleep(self.poll_interval)
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError):
+                log.warning("Replica coordination connection lost", exc_info=True)
+            finally:
+                self._conn = None
+                await self._set_leader(False)
+                conn.terminate()
+
+    async def _publish_loop(self) -> None:
+        while True:
+            await self._pending.wait()
+            if self._conn is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            self._pending.clear()
+            outbox, self._outbox = self._outbox, {}
+            try:
+                async with self._conn_lock:
+                    for payload in self._payloads(outbox):
+                        await self._conn.execute("SELECT pg_notify($1, $2)", CHANNEL, payload)
+            except Exception:
+                log.exception("replica notify error")
+
+    def _payloads(self, outbox: dict[str, dict]) -> list[str]:
+        """Split queued items into NOTIFY payloads of at most MAX_PAYLOAD bytes."""
+        payloads = []
+        for kind, items in outbox.items():
+            batch: list = []
+            size = 0
+            for item in items.values():
+                encoded = len(json.dumps(item))
+                if batch and size + encoded > MAX_PAYLOAD:
+                    payloads.append(self._encode(kind, batch))
+                    batch, size = [], 0
+                batch.append(item)
+                size += encoded + 1
+            if batch:
+                payloads.append(self._encode(kind, batch))
+        return payloads
+
+    def _encode(self, kind: str, items: list) -> str:
+        return json.dumps({"from": self.replica_id, "kind": kind, "items": items})
+
+    def _on_notify(self, conn, pid: int, channel: str, payload: str) -> None:
+        message = json.loads(payload)
+        # NOTIFY reaches the sender's own listening session too
+        if message["from"] == self.replica_id:
+            return
+        handler = self._handlers.get(message["kind"])
+        if handler is not None:
+            try:
+                handler(message["items"])
+            except Exception:
+                log.exception("replica message handler failed")
+
+
+cluster = Cluster(settings.DATABASE_URL, settings.CLUSTER_POLL_INTERVAL)
+
+
+_reloads: set[asyncio.Task] = set()
+
+
+def _apply_pings(items: list) -> None:
+    for device_id, at in items:
+        power_state.apply_ping(device_id, at)
+
+
+def _apply_transitions(items: list) -> None:
+    for device_id, power_is_on, off_time, on_time in items:
+        power_state.apply_transition(device_id, power_is_on, off_time, on_time)
+
+
+def _reload_subscribers(items: list) -> None:
+    async def reload() -> None:
+        async with async_session() as session:
+            for chat_id in items:
+                await reload_subscriber(session, chat_id)
+
+    task = asyncio.create_task(reload())
+    _reloads.add(task)
+    task.add_done_callback(_reloads.discard)
+
+
+def _transitioned(device: DeviceState) -> None:
+    cluster.publish(
+        "transition",
+        device.device_id,
+        [device.device_id, device.power_is_on, device.power_off_time, device.power_on_time],
+    )
+
+
+def share_state() -> None:
+    """Publish this replica's pings, transitions and subscriber changes, and apply the others'."""
+    if not cluster.enabled:
+        return
+    power_state.on_ping(lambda device_id, at: cluster.publish("ping", device_id, [device_id, at]))
+    power_state.on_transition(_transitioned)
+    subscriber_registry.on_change(lambda chat_id: cluster.publish("subscriber", chat_id, chat_id))
+    cluster.subscribe("ping", _apply_pings)
+    cluster.subscribe("transition", _apply_transitions)
+    cluster.subscribe("subscriber", _reload_subscribers)
@@ -0,0 +1,58 @@
+import heapq
+
+
+class DeadlineQueue:
+    """Min-heap of per-key deadlines with lazy re-arming.
+
+    Holds at most one live heap entry per key. Moving a key's deadline later,
+    which is what every ping does, is a dict write; the heap entry is pushed
+    back only when it reaches the top.
+    """
+
+    def __init__(self) -> None:
+        self._heap: list[tuple[float, str]] = []
+        # The key's real deadline and the one its heap entry was pushed with
+        self._deadline: dict[str, float] = {}
+        self._armed: dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._deadline)
+
+    def set(self, key: str, deadline: float) -> None:
+        self._deadline[key] = deadline
+        armed = self._armed.get(key)
+        if armed is None or deadline < armed:
+            self._armed[key] = deadline
+            heapq.heappush(self._heap, (deadline, key))
+
+    def discard(self, key: str) -> None:
+        self._deadline.pop(key, None)
+
+    def next_deadline(self) -> float | None:
+        heap = self._heap
+        while heap:
+            armed, key = heap[0]
+            if self._armed.get(key) != armed:
+                # Superseded by an earlier entry for the same key
+                heapq.heappop(heap)
+                continue
+            deadline = self._deadline.get(key)
+            if deadline is None:
+                heapq.heappop(heap)
+                del self._armed[key]
+            elif deadline > armed:
+                self._armed[key] = deadline
+                heapq.heapreplace(heap, (deadline, key))
+            else:
+                return armed
+        return None
+
+    def pop_expired(self, now: float) -> list[tuple[str, float]]:
+        """Remove and return ``(key, deadline)`` for every deadline at or before ``now``."""
+        expired = []
+        while (deadline := self.next_deadline()) is not None and deadline <= now:
+            _, key = heapq.heappop(self._heap)
+            del self._armed[key]
+            del self._deadline[key]
+            expired.append((key, deadline))
+        return expired
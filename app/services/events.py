@@ -0,0 +1,160 @@
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import PowerDailyStats, PowerEvent
+
+KYIV_TZ = ZoneInfo("Europe/Kyiv")
+
+
+@dataclass
+class Transition:
+    device_id: str
+    power_is_on: bool
+    at: datetime
+    # For power coming back: when it was lost
+    off_since: datetime | None = None
+
+
+@dataclass
+class OutageStats:
+    days: int
+    outages: int = 0
+    downtime_seconds: int = 0
+    longest_outage_seconds: int = 0
+    per_day: dict[date, tuple[int, int]] = field(default_factory=dict)
+
+    def as_dict(self) -> dict:
+        return {
+            "days": self.days,
+            "outages": self.outages,
+            "downtime_seconds": self.downtime_seconds,
+            "longest_outage_seconds": self.longest_outage_seconds,
+            "per_day": [
+                {"date": d.isoformat(), "outages": n, "downtime_seconds": s}
+                for d, (n, s) in sorted(self.per_day.items())
+            ],
+        }
+
+
+def split_by_day(start: datetime, end: datetime) -> list[tuple[date, int]]:
+    """Seconds of ``[start, end)`` falling on each Kyiv local date."""
+    parts = []
+    cursor = start.astimezone(KYIV_TZ)
+    end = end.astimezone(KYIV_TZ)
+    while cursor < end:
+        next_midnight = datetime.combine(cursor.date() + timedelta(days=1), time(), KYIV_TZ)
+        chunk_end = min(next_midnight, end)
+        parts.append((cursor.date(), int((chunk_end - cursor).total_seconds())))
+        cursor = chunk_end
+    return parts
+
+
+async def record_transitions(session: AsyncSession, transitions: list[Transition]) -> None:
+    """Append transitions to the event log and fold finished outages into the rollup."""
+    if not transitions:
+        return
+
+    session.add_all(
+        PowerEvent(device_id=t.device_id, power_is_on=t.power_is_on, at=t.at)
+        for t in transitions
+    )
+
+    # (device_id, day) -> [outages, downtime, longest]
+    deltas: dict[tuple[str, date], list[int]] = {}
+    for t in transitions:
+        if not t.power_is_on or t.off_since is None:
+            continue
+        length = int((t.at - t.off_since).total_seconds())
+        first = deltas.setdefault(
+            (t.device_id, t.off_since.astimezone(KYIV_TZ).date()), [0, 0, 0]
+        )
+        first[0] += 1
+        first[2] = max(first[2], length)
+        for day, seconds in split_by_day(t.off_since, t.at):
+            deltas.setdefault((t.device_id, day), [0, 0, 0])[1] += seconds
+
+    if deltas:
+        device_ids = {device_id for device_id, _ in deltas}
+        days = {day for _, day in deltas}
+        result = await session.execute(
+            select(PowerDailyStats).where(
+                PowerDailyStats.device_id.in_(device_ids), PowerDailyStats.day.in_(days)
+            )
+        )
+        existing = {(row.device_id, row.day): row for row in result.scalars().all()}
+        for (device_id, day), (outages, downtime, longest) in deltas.items():
+            row = existing.get((device_id, day))
+            if row is None:
+                session.add(PowerDailyStats(
+                    device_id=device_id,
+                    day=day,
+                    outages=outages,
+                    downtime_seconds=downtime,
+                    longest_outage_seconds=longest,
+                ))
+            else:
+                row.outages += outages
+                row.downtime_seconds += downtime
+                row.longest_outage_seconds = max(row.longest_outage_seconds, longest)
+
+    await session.commit()
+
+
+async def get_power_events(
+    session: AsyncSession, device_id: str, start: datetime, end: datetime
+) -> list[PowerEvent]:
+    result = await session.execute(
+        select(PowerEvent)
+        .where(PowerEvent.device_id == device_id, PowerEvent.at >= start, PowerEvent.at < end)
+        .order_by(PowerEvent.at)
+    )
+    return list(result.scalars().all())
+
+
+async def get_outage_stats(
+    session: AsyncSession,
+    device_id: str,
+    days: int,
+    *,
+    ongoing_since: datetime | None = None,
+    now: datetime | None = None,
+) -> OutageStats:
+    """Outage totals for the last ``days`` Kyiv dates, today included.
+
+    Reads only the daily rollup; ``ongoing_since`` adds an outage that hasn't
+    ended yet and so isn't in the rollup.
+    """
+    now = now or datetime.now(KYIV_TZ)
+    first_day = now.astimezone(KYIV_TZ).date() - timedelta(days=days - 1)
+
+    result = await session.execute(
+        select(PowerDailyStats).where(
+            PowerDailyStats.device_id == device_id, PowerDailyStats.day >= first_day
+        )
+    )
+    stats = OutageStats(days=days)
+    for row in result.scalars().all():
+        stats.per_day[row.day] = (row.outages, row.downtime_seconds)
+        stats.outages += row.outages
+        stats.downtime_seconds += row.downtime_seconds
+        stats.longest_outage_seconds = max(stats.longest_outage_seconds, row.longest_outage_seconds)
+
+    if ongoing_since is not None:
+        for day, seconds in split_by_day(ongoing_since, now):
+            if day < first_day:
+                continue
+            outages, downtime = stats.per_day.get(day, (0, 0))
+            if day == ongoing_since.astimezone(KYIV_TZ).date():
+                outages += 1
+                stats.outages += 1
+            stats.per_day[day] = (outages, downtime + seconds)
+            stats.downtime_seconds += seconds
+        stats.longest_outage_seconds = max(
+            stats.longest_outage_seconds, int((now - ongoing_since).total_seconds())
+        )
+
+    return stats
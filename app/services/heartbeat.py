@@ -0,0 +1,121 @@
+"""UDP heartbeats: a lighter way for an ESP to say it's alive than GET /ping.
+
+One datagram per heartbeat, no reply. Layout, big-endian:
+
+    version    1 byte    PACKET_VERSION
+    sequence   8 bytes   counts up from the device's boot
+    sent_at    4 bytes   unix time in seconds, from the device's NTP clock
+    device_id  1-64 bytes, UTF-8
+    tag        16 bytes  HMAC-SHA256 over the bytes above, keyed with
+                         ESP_API_KEY and truncated
+
+A packet sent more than HEARTBEAT_MAX_SKEW seconds from the server's clock
+is dropped as stale. That bounds replays on any replica and across
+restarts: a captured packet is only good for as long as a real one would
+be. Within the window each process also drops packets whose
+``(sent_at, sequence)`` isn't above the last one accepted from the device,
+so a packet counts once and reordered ones are dropped.
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import struct
+import time
+from collections.abc import Callable
+
+from app.config import settings
+from app.metrics import heartbeat_packets
+from app.state import PowerStateManager, power_state
+
+log = logging.getLogger(__name__)
+
+PACKET_VERSION = 2
+HEADER = struct.Struct("!BQI")
+TAG_SIZE = 16
+MAX_DEVICE_ID = 64
+
+
+def _tag(key: bytes, body: bytes) -> bytes:
+    return hmac.new(key, body, hashlib.sha256).digest()[:TAG_SIZE]
+
+
+def pack_heartbeat(key: bytes, device_id: str, sequence: int, sent_at: int | None = None) -> bytes:
+    if sent_at is None:
+        sent_at = int(time.time())
+    body = HEADER.pack(PACKET_VERSION, sequence, sent_at) + device_id.encode()
+    return body + _tag(key, body)
+
+
+def unpack_heartbeat(key: bytes, packet: bytes) -> tuple[str, int, int]:
+    """Return ``(device_id, sequence, sent_at)``; ValueError if the packet is malformed or forged."""
+    if not HEADER.size < len(packet) - TAG_SIZE <= HEADER.size + MAX_DEVICE_ID:
+        raise ValueError("bad length")
+    body, tag = packet[:-TAG_SIZE], packet[-TAG_SIZE:]
+    if not hmac.compare_digest(tag, _tag(key, body)):
+        raise ValueError("bad signature")
+    version, sequence, sent_at = HEADER.unpack_from(body)
+    if version != PACKET_VERSION:
+        raise ValueError(f"unsupported version {version}")
+    return body[HEADER.size:].decode(), sequence, sent_at
+
+
+class HeartbeatProtocol(asyncio.DatagramProtocol):
+    def __init__(
+        self, key: bytes, state: PowerStateManager, clock: Callable[[], float] = time.time
+    ) -> None:
+        self.key = key
+        self.state = state
+        self.clock = clock
+        self.max_skew = settings.HEARTBEAT_MAX_SKEW
+        # device_id -> (sent_at, sequence) of the last accepted packet
+        self.last_accepted: dict[str, tuple[int, int]] = {}
+        self._saves: set[asyncio.Task] = set()
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        try:
+            device_id, sequence, sent_at = unpack_heartbeat(self.key, data)
+        except ValueError:
+            heartbeat_packets.inc("invalid")
+            return
+        if self.state.get(device_id) is None:
+            heartbeat_packets.inc("unknown_device")
+            return
+        if abs(self.clock() - sent_at) > self.max_skew:
+            heartbeat_packets.inc("stale")
+            return
+        order = (sent_at, sequence)
+        last = self.last_accepted.get(device_id)
+        if last is not None and order <= last:
+            heartbeat_packets.inc("replayed")
+            return
+        self.last_accepted[device_id] = order
+        heartbeat_packets.inc("accepted")
+
+        self.state.record_ping(device_id)
+        log.debug("Heartbeat received from %s", device_id)
+        if not self.state.write_behind:
+            task = asyncio.create_task(self._save(device_id))
+            self._saves.add(task)
+            task.add_done_callback(self._saves.discard)
+
+    async def _save(self, device_id: str) -> None:
+        try:
+            await self.state.save_to_db([device_id])
+        except Exception:
+            log.exception("heartbeat save error")
+
+    def error_received(self, exc: Exception) -> None:
+        log.warning("Heartbeat socket error: %s", exc)
+
+
+async def start_heartbeat_listener(
+    host: str, port: int, state: PowerStateManager = power_state
+) -> asyncio.DatagramTransport:
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: HeartbeatProtocol(settings.ESP_API_KEY.encode(), state),
+        local_addr=(host, port),
+    )
+    log.info("Listening for UDP heartbeats on %s:%d", host, port)
+    return transport
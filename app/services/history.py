@@ -0,0 +1,312 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import async_session
+from app.models import PingHistory
+
+log = logging.getLogger(__name__)
+
+KYIV_TZ = ZoneInfo("Europe/Kyiv")
+RESOLUTIONS = ("minute", "hour", "day")
+# Raw ping times kept in memory per device
+RAW_SAMPLES = 600
+
+
+def bucket_start(ts: float, resolution: str) -> float:
+    """Start of the bucket containing ``ts``; days follow Kyiv midnight."""
+    if resolution == "minute":
+        return ts - ts % 60
+    if resolution == "hour":
+        return ts - ts % 3600
+    local = datetime.fromtimestamp(ts, tz=KYIV_TZ)
+    return local.replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+
+def bucket_length(start: float, resolution: str) -> float:
+    if resolution == "minute":
+        return 60
+    if resolution == "hour":
+        return 3600
+    local = datetime.fromtimestamp(start, tz=KYIV_TZ)
+    # 23 or 25 hours on DST switch days
+    return (local + timedelta(days=1)).replace(hour=0).timestamp() - start
+
+
+class Bucket:
+    __slots__ = ("pings", "gaps", "max_gap", "covered")
+
+    def __init__(self) -> None:
+        self.pings = 0
+        self.gaps = 0
+        self.max_gap = 0.0
+        self.covered = 0.0
+
+    def merge(self, other: "Bucket") -> None:
+        self.pings += other.pings
+        self.gaps += other.gaps
+        self.max_gap = max(self.max_gap, other.max_gap)
+        self.covered += other.covered
+
+
+class _DeviceHistory:
+    __slots__ = ("last_ping", "minute_start", "minute", "raw")
+
+    def __init__(self) -> None:
+        self.last_ping: float | None = None
+        self.minute_start = 0.0
+        self.minute = Bucket()
+        self.raw: deque[float] = deque(maxlen=RAW_SAMPLES)
+
+
+class PingHistoryStore:
+    """Rolls pings up into minute, hour and day buckets as they arrive.
+
+    Each device keeps its open minute in memory. When the minute closes, it
+    is added to pending deltas for its minute, hour and day rows, and the
+    flusher adds those deltas to the database. A ping costs a few
+    arithmetic operations, and writes are proportional to closed minutes.
+    """
+
+    def __init__(self) -> None:
+        self._devices: dict[str, _DeviceHistory] = {}
+        self._pending: dict[tuple[str, str, float], Bucket] = {}
+        self._flusher: asyncio.Task | None = None
+        self._last_prune = 0.0
+        # With several replicas every one sees every ping, and only the
+        # leader writes, so rows aren't counted once per replica
+        self.writer = True
+
+    def record(self, device_id: str, now: float) -> None:
+        history = self._devices.get(device_id)
+        if history is None:
+            history = self._devices[device_id] = _DeviceHistory()
+        history.raw.append(now)
+
+        minute_start = bucket_start(now, "minute")
+        carry = gap = 0.0
+        if history.last_ping is not None:
+            gap = now - history.last_ping
+            # A ping vouches for at most PING_TIMEOUT seconds after it
+            covered_end = history.last_ping + min(gap, settings.PING_TIMEOUT)
+            minute_end = history.minute_start + 60
+            history.minute.covered += min(covered_end, minute_end) - history.last_ping
+            # Coverage spilling into the new minute
+            carry = max(covered_end - max(minute_end, minute_start), 0.0)
+            if minute_start != history.minute_start:
+                self._add_minute(device_id, history.minute_start, history.minute)
+                self._add_skipped(device_id, minute_end, min(covered_end, minute_start))
+
+        if minute_start != history.minute_start:
+            history.minute_start = minute_start
+            history.minute = Bucket()
+
+        bucket = history.minute
+        bucket.pings += 1
+        bucket.covered += carry
+        if gap > settings.PING_TIMEOUT:
+            # Counted in the bucket where the silence ends
+            bucket.gaps += 1
+            bucket.max_gap = max(bucket.max_gap, gap)
+        history.last_ping = now
+
+    def close(self) -> None:
+        """Move every open minute to the pending deltas, e.g. before handing over or exiting.
+
+        Each device's last ping is credited with its full PING_TIMEOUT, since
+        no later ping will be recorded here to credit it.
+        """
+        for device_id, history in self._devices.items():
+            if history.last_ping is None:
+                continue
+            covered_end = history.last_ping + settings.PING_TIMEOUT
+            minute_end = history.minute_start + 60
+            history.minute.covered += min(covered_end, minute_end) - history.last_ping
+            self._add_minute(device_id, history.minute_start, history.minute)
+            self._add_skipped(device_id, minute_end, covered_end)
+            history.last_ping = None
+            history.minute_start = 0.0
+            history.minute = Bucket()
+
+    def _add_skipped(self, device_id: str, start: float, end: float) -> None:
+        """Credit minutes from ``start`` with no ping of their own with their part of ``[start, end)``."""
+        while start < end:
+            bucket = Bucket()
+            bucket.covered = min(end, start + 60) - start
+            self._add_minute(device_id, start, bucket)
+            start += 60
+
+    def _add_minute(self, device_id: str, minute_start: float, minute: Bucket) -> None:
+        """Add a closed minute to the pending deltas of its minute, hour and day."""
+        for resolution in RESOLUTIONS:
+            key = (device_id, resolution, bucket_start(minute_start, resolution))
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = Bucket()
+            pending.merge(minute)
+
+    def raw(self, device_id: str, since: float) -> list[float]:
+        history = self._devices.get(device_id)
+        return [t for t in history.raw if t >= since] if history else []
+
+    def unsaved(self, device_id: str, resolution: str) -> dict[float, Bucket]:
+        """Buckets not in the DB yet: pending deltas plus the open minute."""
+        buckets: dict[float, Bucket] = {}
+        for (d, r, start), bucket in self._pending.items():
+            if d == device_id and r == resolution:
+                buckets.setdefault(start, Bucket()).merge(bucket)
+        history = self._devices.get(device_id)
+        if history and history.last_ping is not None:
+            start = bucket_start(history.minute_start, resolution)
+            buckets.setdefault(start, Bucket()).merge(history.minute)
+        return buckets
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        if not self.writer:
+            self._pending.clear()
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            async with async_session() as session:
+                await add_history(session, pending)
+        except Exception:
+            # Put the deltas back so the next flush retries them
+            for key, bucket in pending.items():
+                self._pending.setdefault(key, Bucket()).merge(bucket)
+            raise
+
+        if time.time() - self._last_prune > 3600:
+            async with async_session() as session:
+                await prune_history(session)
+            self._last_prune = time.time()
+
+    def start_flusher(self) -> None:
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop_flusher(self) -> None:
+        flusher, self._flusher = self._flusher, None
+        if flusher is None:
+            return
+        flusher.cancel()
+        try:
+            await flusher
+        except asyncio.CancelledError:
+            pass
+
+    async def _flush_loop(self) -> None:
+        # Before 3.12, asyncio.wait_for can swallow a cancel, e.g. one that
+        # lands as SQLAlchemy's pool hands flush() a connection, so the loop
+        # also stops once it is no longer the flusher
+        while self._flusher is asyncio.current_task():
+            await asyncio.sleep(60)
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("ping history flush error")
+
+
+async def add_history(
+    session: AsyncSession, deltas: dict[tuple[str, str, float], Bucket]
+) -> None:
+    """Add bucket deltas to their rows, creating rows as needed."""
+    keys = {
+        (device_id, resolution, datetime.fromtimestamp(start, tz=timezone.utc)): bucket
+        for (device_id, resolution, start), bucket in deltas.items()
+    }
+    result = await session.execute(
+        select(PingHistory).where(
+            PingHistory.device_id.in_({k[0] for k in keys}),
+            PingHistory.resolution.in_({k[1] for k in keys}),
+            PingHistory.bucket_start.in_({k[2] for k in keys}),
+        )
+    )
+    existing = {
+        (row.device_id, row.resolution, row.bucket_start): row
+        for row in result.scalars().all()
+    }
+    for key, bucket in keys.items():
+        row = existing.get(key)
+        if row is None:
+            session.add(PingHistory(
+                device_id=key[0],
+                resolution=key[1],
+                bucket_start=key[2],
+                pings=bucket.pings,
+                gaps=bucket.gaps,
+                max_gap_seconds=bucket.max_gap,
+                covered_seconds=bucket.covered,
+            ))
+        else:
+            row.pings += bucket.pings
+            row.gaps += bucket.gaps
+            row.max_gap_seconds = max(row.max_gap_seconds, bucket.max_gap)
+            row.covered_seconds += bucket.covered
+    await session.commit()
+
+
+async def prune_history(session: AsyncSession) -> None:
+    """Drop buckets older than their resolution's retention."""
+    now = datetime.now(timezone.utc)
+    for resolution, days in settings.HISTORY_RETENTION_DAYS.items():
+        await session.execute(
+            delete(PingHistory).where(
+                PingHistory.resolution == resolution,
+                PingHistory.bucket_start < now - timedelta(days=days),
+            )
+        )
+    await session.commit()
+
+
+async def get_history(
+    session: AsyncSession, device_id: str, resolution: str, start: datetime, end: datetime
+) -> list[dict]:
+    """Series of buckets overlapping ``[start, end)``, including data not flushed yet."""
+    start = datetime.fromtimestamp(bucket_start(start.timestamp(), resolution), tz=timezone.utc)
+    result = await session.execute(
+        select(PingHistory)
+        .where(
+            PingHistory.device_id == device_id,
+            PingHistory.resolution == resolution,
+            PingHistory.bucket_start >= start,
+            PingHistory.bucket_start < end,
+        )
+        .order_by(PingHistory.bucket_start)
+    )
+    buckets: dict[float, Bucket] = {}
+    for row in result.scalars().all():
+        bucket = buckets[row.bucket_start.timestamp()] = Bucket()
+        bucket.pings = row.pings
+        bucket.gaps = row.gaps
+        bucket.max_gap = row.max_gap_seconds
+        bucket.covered = row.covered_seconds
+
+    for bucket_ts, bucket in ping_history.unsaved(device_id, resolution).items():
+        if start.timestamp() <= bucket_ts < end.timestamp():
+            buckets.setdefault(bucket_ts, Bucket()).merge(bucket)
+
+    now = time.time()
+    series = []
+    for bucket_ts in sorted(buckets):
+        bucket = buckets[bucket_ts]
+        length = min(bucket_length(bucket_ts, resolution), max(now - bucket_ts, 1.0))
+        series.append({
+            "start": datetime.fromtimestamp(bucket_ts, tz=timezone.utc).isoformat(),
+            "pings": bucket.pings,
+            "gaps": bucket.gaps,
+            "max_gap_seconds": round(bucket.max_gap, 1),
+            "uptime": round(min(bucket.covered / length, 1.0), 4),
+        })
+    return series
+
+
+ping_history = PingHistoryStore()
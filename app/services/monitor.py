@@ -1,59 +1,166 @@
 import asyncio
 import logging
 import time
+from datetime import datetime, timezone
 
 from telegram import Bot
 
-from app.bot.notifications import notify_all
+from app.bot.notifications import notify_site, release_site_alert
 from app.config import settings
-from app.services.schedule import fetch_schedule, get_next_off_text, get_next_on_time
-from app.state import power_state
+from app.database import async_session
+from app.metrics import detection, monitor_lag
+from app.services.events import Transition, record_transitions
+from app.services.schedule import (
+    device_region,
+    fetch_schedules,
+    get_next_off_text,
+    get_next_on_time,
+    region_groups,
+)
+from app.services.schedule_index import ScheduleIndex
+from app.state import DeviceState, power_state
 
 log = logging.getLogger(__name__)
 
+REQUIRED_MISSES = 3
+# Spacing between misses once a device is past PING_TIMEOUT; an outage is
+# declared PING_TIMEOUT + (REQUIRED_MISSES - 1) * MISS_INTERVAL after the last ping.
+MISS_INTERVAL = 5
+# Seconds a queued alert waits for its schedule line before going out without it
+ALERT_HOLD = max(source.timeout for source in settings.SCHEDULE_SOURCES.values()) + 5
+
+_announcements: set[asyncio.Task] = set()
+
+
+def _utc(ts: float | None) -> datetime | None:
+    return datetime.fromtimestamp(ts, tz=timezone.utc) if ts else None
+
+
+def _alert_text(device: DeviceState) -> str:
+    if not device.power_is_on:
+        return "🔴 *Світло зникло!*"
+    duration = int((device.power_on_time - device.power_off_time) / 60)
+    hours = duration // 60
+    minutes = duration % 60
+    dur_text = f"{hours} год {minutes} хв" if hours > 0 else f"{minutes} хв"
+    return f"💡 *Світло з'явилось!*\n\nНе було: {dur_text}"
+
+
+def _schedule_text(device_id: str, power_is_on: bool, data: ScheduleIndex | None) -> str:
+    groups = region_groups(device_region(device_id))
+    if power_is_on:
+        return f"\n\n{get_next_off_text(data, groups)}" if data else ""
+    next_on = get_next_on_time(data, groups) if data else None
+    return f"\n\n🕐 Планове увімкнення: {next_on or 'невідомо'}"
+
+
+async def _queue_alerts(
+    devices: list[DeviceState], held_until: datetime
+) -> list[tuple[int, str, bool, str]]:
+    """Enqueue each device's alert, without the schedule yet; returns what _announce needs."""
+    alerts = []
+    for device in devices:
+        text = _alert_text(device)
+        if device.power_is_on:
+            kind, at, event_at = "on", device.power_on_time, None
+        else:
+            kind, at, event_at = "off", device.power_off_time, _utc(device.last_ping)
+        # Keyed on the transition, so a retried announcement doesn't alert twice
+        key = f"{kind}:{device.device_id}:{at:.0f}"
+        # What goes out if the schedule line is never added
+        placeholder = text + _schedule_text(device.device_id, device.power_is_on, None)
+        job_id = await notify_site(device.device_id, placeholder, kind, key, event_at, held_until)
+        if job_id is not None:
+            alerts.append((job_id, device.device_id, device.power_is_on, text))
+    return alerts
+
+
+async def _announce(alerts: list[tuple[int, str, bool, str]], held_until: datetime) -> None:
+    """Add each queued alert's schedule line, from its site's region, and release it."""
+    indexes: dict[str, ScheduleIndex | None] = {}
+    try:
+        indexes = await fetch_schedules(device_region(device_id) for _, device_id, _, _ in alerts)
+    except Exception:
+        log.exception("schedule fetch for power alerts failed")
+    for job_id, device_id, power_is_on, text in alerts:
+        data = indexes.get(device_region(device_id))
+        try:
+            await release_site_alert(
+                job_id, device_id, text + _schedule_text(device_id, power_is_on, data), held_until
+            )
+        except Exception:
+            log.exception("power notification error")
+
+
+async def check_devices(bot: Bot) -> None:
+    """Handle devices whose deadline passed or that came back.
+
+    Only those devices are touched, so the cost doesn't grow with the number
+    of healthy devices.
+    """
+    now = time.time()
+    turned_off: list[DeviceState] = []
+    for device, deadline in power_state.pop_expired(now):
+        monitor_lag.observe(now - deadline)
+        device.missed_checks += 1
+        log.warning(
+            "%s: no ping for %.0fs (missed %d/%d)",
+            device.device_id,
+            now - device.last_ping,
+            device.missed_checks,
+            REQUIRED_MISSES,
+        )
+        if device.missed_checks < REQUIRED_MISSES:
+            power_state.defer(device, deadline + MISS_INTERVAL)
+            continue
+        detection.observe(now - deadline, now - device.last_ping)
+        power_state.mark_off(device)
+        turned_off.append(device)
+
+    turned_on: list[DeviceState] = []
+    for device in power_state.pop_recovered():
+        if device.power_is_on:
+            continue
+        power_state.mark_on(device)
+        turned_on.append(device)
+
+    if not turned_off and not turned_on:
+        return
+
+    changed = [d.device_id for d in turned_off + turned_on]
+    await power_state.save_to_db(changed)
+
+    async with async_session() as session:
+        await record_transitions(session, [
+            *(Transition(d.device_id, False, _utc(d.power_off_time)) for d in turned_off),
+            *(
+                Transition(d.device_id, True, _utc(d.power_on_time), _utc(d.power_off_time))
+                for d in turned_on
+            ),
+        ])
+
+    # Queue the alerts right after saving the transitions, so they survive a
+    # crash from here on. The schedule lookup can take up to a source's
+    # timeout, so it runs in the background; if it never finishes, the
+    # alerts go out without it once the hold runs out.
+    held_until = _utc(time.time() + ALERT_HOLD)
+    alerts = await _queue_alerts(turned_off + turned_on, held_until)
+    task = asyncio.create_task(_announce(alerts, held_until))
+    _announcements.add(task)
+    task.add_done_callback(_announcements.discard)
+
 
 async def monitor_power(bot: Bot) -> None:
-    await asyncio.sleep(15)
-    missed_checks = 0
-    required_misses = 3
+    """Sleep until the next device deadline or a recovery ping, then check."""
     while True:
-        await asyncio.sleep(5)
+        next_deadline = power_state.deadlines.next_deadline()
+        timeout = None if next_deadline is None else max(next_deadline - time.time(), 0)
+        try:
+            await asyncio.wait_for(power_state.wake.wait(), timeout)
+        except TimeoutError:
+            pass
+        power_state.wake.clear()
         try:
-            elapsed = time.time() - power_state.last_ping
-
-            if elapsed > settings.PING_TIMEOUT and power_state.power_is_on:
-                missed_checks += 1
-                log.warning("No ping for %.0fs (missed %d/%d)", elapsed, missed_checks, required_misses)
-                if missed_checks < required_misses:
-                    continue
-                missed_checks = 0
-                power_state.power_is_on = False
-                power_state.power_off_time = time.time()
-                await power_state.save_to_db()
-                msg = "🔴 *Світло зникло!*"
-                data = await fetch_schedule()
-                next_on = get_next_on_time(data) if data else None
-                if next_on:
-                    msg += f"\n\n🕐 Планове увімкнення: {next_on}"
-                else:
-                    msg += "\n\n🕐 Планове увімкнення: невідомо"
-                await notify_all(bot, msg)
-
-            elif elapsed <= settings.PING_TIMEOUT and not power_state.power_is_on:
-                missed_checks = 0
-                power_state.power_is_on = True
-                power_state.power_on_time = time.time()
-                duration = int((power_state.power_on_time - power_state.power_off_time) / 60)
-                hours = duration // 60
-                minutes = duration % 60
-                dur_text = f"{hours} год {minutes} хв" if hours > 0 else f"{minutes} хв"
-                await power_state.save_to_db()
-                msg = f"💡 *Світло з'явилось!*\n\nНе було: {dur_text}"
-                data = await fetch_schedule()
-                if data:
-                    msg += f"\n\n{get_next_off_text(data)}"
-                await notify_all(bot, msg)
-            else:
-                missed_checks = 0
+            await check_devices(bot)
         except Exception:
             log.exception("monitor_power error")
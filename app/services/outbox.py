@@ -0,0 +1,182 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, case, delete, exists, func, insert, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import OutboxDelivery, OutboxJob
+
+# Seconds a claimed batch is reserved for its worker; far longer than a
+# batch takes to send, so a live worker's batch is never claimed twice
+LEASE = 120
+# Completed jobs are kept this long, for the record of what was sent
+RETENTION = timedelta(days=7)
+# Seconds of sent deliveries the reported drain rate averages over
+DRAIN_WINDOW = 60
+
+
+async def enqueue(
+    session: AsyncSession,
+    dedupe_key: str,
+    text: str,
+    chat_ids: list[int],
+    event_at: datetime | None = None,
+    held_until: datetime | None = None,
+) -> int | None:
+    """Store a broadcast and its recipients; None if ``dedupe_key`` was already enqueued.
+
+    With ``held_until``, workers leave the deliveries alone until then, or
+    until release_job lets them go sooner.
+    """
+    job = OutboxJob(dedupe_key=dedupe_key, text=text, event_at=event_at)
+    session.add(job)
+    try:
+        await session.flush()
+    except IntegrityError:
+        await session.rollback()
+        return None
+    if chat_ids:
+        await session.execute(
+            insert(OutboxDelivery),
+            [{"job_id": job.id, "chat_id": c, "claimed_until": held_until} for c in chat_ids],
+        )
+    else:
+        job.completed_at = datetime.now(timezone.utc)
+    await session.commit()
+    return job.id
+
+
+async def release_job(
+    session: AsyncSession, job_id: int, text: str, held_until: datetime
+) -> None:
+    """Give a held job its final text and make its deliveries claimable now.
+
+    Deliveries a worker claimed after the hold ran out keep their claim.
+    """
+    await session.execute(update(OutboxJob).where(OutboxJob.id == job_id).values(text=text))
+    await session.execute(
+        update(OutboxDelivery)
+        .where(
+            OutboxDelivery.job_id == job_id,
+            OutboxDelivery.status == "pending",
+            OutboxDelivery.claimed_until <= held_until,
+        )
+        .values(claimed_until=None)
+    )
+    await session.commit()
+
+
+async def claim_deliveries(
+    session: AsyncSession, limit: int, lease: float = LEASE
+) -> list[tuple[int, int]]:
+    """Reserve up to ``limit`` pending deliveries, oldest job first.
+
+    Postgres skips rows other workers hold locked (SKIP LOCKED); SQLite has
+    one writer at a time, so the UPDATE alone is atomic there.
+    """
+    now = datetime.now(timezone.utc)
+    candidates = (
+        select(OutboxDelivery.job_id, OutboxDelivery.chat_id)
+        .where(
+            OutboxDelivery.status == "pending",
+            (OutboxDelivery.claimed_until.is_(None)) | (OutboxDelivery.claimed_until < now),
+        )
+        .order_by(OutboxDelivery.job_id)
+        .limit(limit)
+    )
+    if session.bind.dialect.name == "postgresql":
+        candidates = candidates.with_for_update(skip_locked=True)
+    result = await session.execute(
+        update(OutboxDelivery)
+        .where(tuple_(OutboxDelivery.job_id, OutboxDelivery.chat_id).in_(candidates))
+        .values(claimed_until=now + timedelta(seconds=lease))
+        .returning(OutboxDelivery.job_id, OutboxDelivery.chat_id)
+    )
+    claimed = [tuple(row) for row in result.all()]
+    await session.commit()
+    return claimed
+
+
+async def get_jobs(session: AsyncSession, job_ids: set[int]) -> dict[int, OutboxJob]:
+    result = await session.execute(select(OutboxJob).where(OutboxJob.id.in_(job_ids)))
+    return {job.id: job for job in result.scalars().all()}
+
+
+async def finish_deliveries(
+    session: AsyncSession,
+    job_id: int,
+    sent: list[int],
+    failed: list[int],
+    retry: list[int],
+    max_attempts: int,
+) -> None:
+    """Record a batch's outcome and release it; retried chats fail after ``max_attempts``."""
+    now = datetime.now(timezone.utc)
+    delivery = OutboxDelivery
+
+    def where(chat_ids: list[int]):
+        return and_(delivery.job_id == job_id, delivery.chat_id.in_(chat_ids))
+
+    if sent:
+        await session.execute(
+            update(delivery).where(where(sent)).values(status="sent", sent_at=now, claimed_until=None)
+        )
+    if failed:
+        await session.execute(
+            update(delivery).where(where(failed)).values(status="failed", claimed_until=None)
+        )
+    if retry:
+        await session.execute(
+            update(delivery)
+            .where(where(retry))
+            .values(
+                attempts=delivery.attempts + 1,
+                status=case((delivery.attempts + 1 >= max_attempts, "failed"), else_="pending"),
+                claimed_until=None,
+            )
+        )
+    await session.execute(
+        update(OutboxJob)
+        .where(
+            OutboxJob.id == job_id,
+            ~exists().where(delivery.job_id == job_id, delivery.status == "pending"),
+        )
+        .values(completed_at=now)
+    )
+    await session.commit()
+
+
+async def prune_outbox(session: AsyncSession) -> None:
+    """Drop jobs completed more than RETENTION ago, with their deliveries."""
+    cutoff = datetime.now(timezone.utc) - RETENTION
+    old = select(OutboxJob.id).where(OutboxJob.completed_at < cutoff)
+    await session.execute(delete(OutboxDelivery).where(OutboxDelivery.job_id.in_(old)))
+    await session.execute(delete(OutboxJob).where(OutboxJob.completed_at < cutoff))
+    await session.commit()
+
+
+async def get_outbox_stats(session: AsyncSession) -> dict:
+    now = datetime.now(timezone.utc)
+    result = await session.execute(
+        select(OutboxDelivery.status, func.count()).group_by(OutboxDelivery.status)
+    )
+    by_status = dict(result.all())
+    result = await session.execute(
+        select(func.count(), func.min(OutboxJob.created_at)).where(OutboxJob.completed_at.is_(None))
+    )
+    open_jobs, oldest = result.one()
+    result = await session.execute(
+        select(func.count()).where(
+            OutboxDelivery.status == "sent",
+            OutboxDelivery.sent_at >= now - timedelta(seconds=DRAIN_WINDOW),
+        )
+    )
+    recently_sent = result.scalar_one()
+    return {
+        "pending_deliveries": by_status.get("pending", 0),
+        "sent_deliveries": by_status.get("sent", 0),
+        "failed_deliveries": by_status.get("failed", 0),
+        "open_jobs": open_jobs,
+        "drain_rate_per_second": round(recently_sent / DRAIN_WINDOW, 2),
+        "oldest_open_job_seconds": round((now - oldest).total_seconds(), 1) if oldest else 0.0,
+    }
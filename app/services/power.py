@@ -1,43 +1,44 @@
+import time
 from datetime import datetime, timezone
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.metrics import db_commit_latency
 from app.models import PowerState
 
 
-async def get_power_state(session: AsyncSession) -> PowerState | None:
-    result = await session.execute(select(PowerState).where(PowerState.id == 1))
-    return result.scalar_one_or_none()
+async def get_power_states(session: AsyncSession) -> list[PowerState]:
+    result = await session.execute(select(PowerState))
+    return list(result.scalars().all())
 
 
-async def upsert_power_state(
-    session: AsyncSession,
-    *,
-    power_is_on: bool,
-    last_ping_at: datetime,
-    power_off_at: datetime | None = None,
-    power_on_at: datetime | None = None,
-) -> PowerState:
-    row = await get_power_state(session)
-    now = datetime.now(timezone.utc)
+async def upsert_power_states(session: AsyncSession, rows: list[dict]) -> None:
+    """Insert or update several devices' state in one transaction.
+
+    Each row is a dict with ``device_id``, ``power_is_on``, ``last_ping_at``,
+    ``power_off_at`` and ``power_on_at``.
+    """
+    if not rows:
+        return
 
-    if row is None:
-        row = PowerState(
-            id=1,
-            power_is_on=power_is_on,
-            last_ping_at=last_ping_at,
-            power_off_at=power_off_at,
-            power_on_at=power_on_at,
-            updated_at=now,
-        )
-        session.add(row)
-    else:
-        row.power_is_on = power_is_on
-        row.last_ping_at = last_ping_at
-        row.power_off_at = power_off_at
-        row.power_on_at = power_on_at
-        row.updated_at = now
+    result = await session.execute(
+        select(PowerState).where(PowerState.device_id.in_([r["device_id"] for r in rows]))
+    )
+    existing = {row.device_id: row for row in result.scalars().all()}
+    now = datetime.now(timezone.utc)
 
+    for values in rows:
+        row = existing.get(values["device_id"])
+        if row is None:
+            session.add(PowerState(**values, updated_at=now))
+        else:
+            row.power_is_on = values["power_is_on"]
+            row.last_ping_at = values["last_ping_at"]
+            row.power_off_at = values["power_off_at"]
+            row.power_on_at = values["power_on_at"]
+            row.updated_at = now
+
+    started = time.perf_counter()
     await session.commit()
-    return row
+    db_commit_latency.observe(time.perf_counter() - started)
@@ -0,0 +1,62 @@
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+
+from app.metrics import rate_limited
+
+
+class RateLimiter:
+    """Token buckets per key: ``rate`` requests a second, bursts of up to ``burst``.
+
+    A bucket is two floats, refilled lazily when its key is next seen, so a
+    check is O(1) with no timers. Keys are kept in least-recently-seen order
+    and the idlest is dropped beyond ``max_keys``; a key seen again after
+    that starts with a full bucket, as it would have refilled by then
+    anyway. A ``rate`` of 0 turns the limiter off.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int,
+        max_keys: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        # key -> [tokens, last refill]
+        self._buckets: OrderedDict[Hashable, list[float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def allow(self, key: Hashable) -> bool:
+        """Take a token for ``key``; False, and counted as rejected, if none is left."""
+        if not self.rate:
+            return True
+        now = self.clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(self.burst), now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < 1:
+            rate_limited.inc(self.name)
+            return False
+        bucket[0] -= 1
+        return True
+
+    def retry_after(self, key: Hashable) -> float:
+        """Seconds until ``key`` has a token again."""
+        bucket = self._buckets.get(key)
+        if bucket is None or not self.rate:
+            return 0.0
+        return max(0.0, (1 - bucket[0]) / self.rate)
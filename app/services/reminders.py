@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+from collections.abc import Callable
+from datetime import datetime, time as dtime, timezone
+
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram import Bot
+
+from app.bot.notifications import notify_groups
+from app.config import DEFAULT_REGION, settings
+from app.database import async_session
+from app.models import PendingReminder
+from app.services.deadlines import DeadlineQueue
+from app.services.schedule_index import HOURS, KYIV_TZ, MFIRST, MSECOND, NO, ScheduleIndex
+
+log = logging.getLogger(__name__)
+
+# Half-hour slots in which power is planned to be off
+_FIRST_HALF_OFF = frozenset((NO, MFIRST))
+_SECOND_HALF_OFF = frozenset((NO, MSECOND))
+
+# (group, outage start as a unix timestamp)
+Reminder = tuple[str, float]
+
+
+def planned_outages(index: ScheduleIndex, groups: list[str]) -> set[Reminder]:
+    """Start times of the planned outages in today's and tomorrow's schedule.
+
+    Runs once per schedule version. An outage continuing past midnight
+    into the next day's data counts once, from its start.
+    """
+    starts: set[Reminder] = set()
+    day_keys = [key for key in (index.day_key("today"), index.day_key("tomorrow")) if key]
+    for group in groups:
+        was_off = False
+        for day_key in day_keys:
+            day = index.days[day_key].get(group)
+            if day is None:
+                was_off = False
+                continue
+            midnight = datetime.combine(index.day_date(day_key), dtime(), KYIV_TZ)
+            for hour in range(HOURS):
+                code = day.slots[hour]
+                for half, off in enumerate((code in _FIRST_HALF_OFF, code in _SECOND_HALF_OFF)):
+                    if off and not was_off:
+                        at = midnight.replace(hour=hour, minute=30 * half)
+                        starts.add((group, at.timestamp()))
+                    was_off = off
+    return starts
+
+
+def _key(reminder: Reminder) -> str:
+    return f"{reminder[0]}@{reminder[1]:.0f}"
+
+
+async def get_pending_reminders(session: AsyncSession, source: str) -> list[PendingReminder]:
+    result = await session.execute(select(PendingReminder).where(PendingReminder.source == source))
+    return list(result.scalars())
+
+
+async def save_reminders(
+    session: AsyncSession, source: str, added: dict[Reminder, float], removed: list[Reminder]
+) -> None:
+    """Apply a reschedule: insert ``added`` ({reminder: fire_at}) and drop ``removed``."""
+    if removed:
+        await session.execute(
+            delete(PendingReminder).where(
+                PendingReminder.source == source,
+                tuple_(PendingReminder.group, PendingReminder.starts_at).in_(
+                    [(group, datetime.fromtimestamp(ts, timezone.utc)) for group, ts in removed]
+                ),
+            )
+        )
+    session.add_all(
+        PendingReminder(
+            source=source,
+            group=group,
+            starts_at=datetime.fromtimestamp(ts, timezone.utc),
+            fire_at=datetime.fromtimestamp(fire_at, timezone.utc),
+        )
+        for (group, ts), fire_at in added.items()
+    )
+    await session.commit()
+
+
+class ReminderScheduler:
+    """Sends "power goes off in N minutes" reminders ahead of planned outages.
+
+    Pending reminders sit in a deadline heap keyed by group and start time;
+    the loop sleeps until the earliest one is due, so nothing scans the
+    schedule between versions. A new schedule version is diffed against the
+    pending set and only the difference is applied, here and in the
+    pending_reminders table, which is reloaded on startup.
+
+    Each region has its own scheduler. ``clock`` returns unix time; pass a
+    fake one to drive it in tests.
+    """
+
+    def __init__(
+        self,
+        groups: list[str],
+        lead: float,
+        source: str = DEFAULT_REGION,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.groups = groups
+        self.lead = lead
+        self.source = source
+        self.clock = clock
+        self.queue = DeadlineQueue()
+        self.pending: dict[str, Reminder] = {}
+        # Set when the heap head may have moved earlier
+        self.wake = asyncio.Event()
+
+    def _schedule(self, reminder: Reminder, fire_at: float) -> None:
+        key = _key(reminder)
+        self.pending[key] = reminder
+        self.queue.set(key, fire_at)
+
+    async def load(self) -> None:
+        async with async_session() as session:
+            rows = await get_pending_reminders(session, self.source)
+        # Replaces whatever is left from an earlier term as leader
+        self.queue = DeadlineQueue()
+        self.pending.clear()
+        for row in rows:
+            reminder = (row.group, row.starts_at.timestamp())
+            self._schedule(reminder, row.fire_at.timestamp())
+        self.wake.set()
+
+    async def reschedule(self, index: ScheduleIndex) -> None:
+        """Bring the pending reminders in line with a new schedule version."""
+        # Only reminders still ahead: one already due has been sent or is about
+        # to be, and an outage published less than the lead time ahead gets none
+        horizon = self.clock() + self.lead
+        wanted = {r for r in planned_outages(index, self.groups) if r[1] > horizon}
+        current = {r for r in self.pending.values() if r[1] > horizon}
+
+        added = {r: r[1] - self.lead for r in wanted - current}
+        removed = list(current - wanted)
+        for reminder in removed:
+            key = _key(reminder)
+            del self.pending[key]
+            self.queue.discard(key)
+        for reminder, fire_at in added.items():
+            self._schedule(reminder, fire_at)
+
+        if added or removed:
+            log.info("Reminders rescheduled: %d added, %d removed", len(added), len(removed))
+            async with async_session() as session:
+                await save_reminders(session, self.source, added, removed)
+            self.wake.set()
+
+    async def fire_due(self, bot: Bot) -> int:
+        """Send every reminder that is due; returns how many were sent."""
+        now = self.clock()
+        due = [self.pending.pop(key) for key, _ in self.queue.pop_expired(now)]
+        if not due:
+            return 0
+
+        # An outage that has already begun, e.g. after downtime, needs no reminder
+        upcoming = sorted((r for r in due if r[1] > now), key=lambda r: r[1])
+        lines: dict[str, str] = {}
+        for group, starts_at in upcoming:
+            at = datetime.fromtimestamp(starts_at, KYIV_TZ)
+            minutes = max(1, round((starts_at - now) / 60))
+            lines.setdefault(group, f"*{group}*: о {at:%H:%M} (через {minutes} хв)")
+        if lines:
+            await notify_groups(
+                bot, "⏰ *Незабаром планове відключення*\n", lines, region=self.source
+            )
+
+        async with async_session() as session:
+            await save_reminders(session, self.source, {}, due)
+        return len(lines)
+
+    async def run(self, bot: Bot) -> None:
+        await self.load()
+        while True:
+            deadline = self.queue.next_deadline()
+            timeout = None if deadline is None else max(0.0, deadline - self.clock())
+            self.wake.clear()
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.fire_due(bot)
+            except Exception:
+                log.exception("reminder error")
+
+
+reminder_schedulers = {
+    region: ReminderScheduler(source.groups, settings.REMINDER_LEAD_MINUTES * 60, region)
+    for region, source in settings.SCHEDULE_SOURCES.items()
+}
@@ -1,90 +1,237 @@
+import asyncio
+import hashlib
 import logging
+import time
+from collections.abc import Iterable
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
 import httpx
 
-from app.config import settings
+from app.config import DEFAULT_REGION, settings
+from app.metrics import (
+    render_cache_hits,
+    render_cache_misses,
+    schedule_cache_hits,
+    schedule_cache_misses,
+    schedule_fetch_latency,
+)
+from app.services.schedule_index import (
+    NO_HOUR,
+    OUTAGE_CODES,
+    STATUS_ICONS,
+    GroupDay,
+    ScheduleIndex,
+)
 
 log = logging.getLogger(__name__)
 
 KYIV_TZ = ZoneInfo("Europe/Kyiv")
-SCHEDULE_URL = (
-    "https://raw.githubusercontent.com/yaroslav2901/OE_OUTAGE_DATA"
-    "/main/data/Ternopiloblenerho.json"
-)
+# How soon to try again after a failed fetch, when the TTL is longer
+ERROR_RETRY = 30
+
+_client: httpx.AsyncClient | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Long-lived client shared by all schedule sources, so connections are reused."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=10,
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+class ScheduleCache:
+    """Caches the schedule JSON for ``ttl`` seconds, then revalidates it.
+
+    Revalidation is conditional (ETag / Last-Modified), concurrent callers
+    share one in-flight request, and the last good copy is served when the
+    source can't be reached. A downloaded body whose hash matches the cached
+    one isn't parsed again and doesn't count as a new version. A fetch
+    that takes longer than ``timeout`` seconds counts as failed.
+    """
+
+    def __init__(self, url: str, ttl: float, timeout: float = 10.0) -> None:
+        self.url = url
+        self.ttl = ttl
+        self.timeout = timeout
+        self.data: dict | None = None
+        self.index: ScheduleIndex | None = None
+        # Bumped whenever a body with a new fingerprint is downloaded
+        self.version = 0
+        self.fingerprint: str | None = None
+        # Whether the last fetch attempt failed
+        self.failed = False
+        self.etag: str | None = None
+        self.last_modified: str | None = None
+        self.expires_at = 0.0
+        self._inflight: asyncio.Task | None = None
+
+    async def get(self) -> dict | None:
+        if self.data is not None and time.monotonic() < self.expires_at:
+            schedule_cache_hits.inc()
+            return self.data
+        schedule_cache_misses.inc()
+        return await self.refresh()
+
+    async def refresh(self) -> dict | None:
+        """Revalidate now regardless of the TTL, joining a fetch already in flight."""
+        if self._inflight is None:
+            self._inflight = asyncio.create_task(self._refresh())
+            self._inflight.add_done_callback(self._clear_inflight)
+        # Shield so one caller being cancelled doesn't abort the shared fetch
+        return await asyncio.shield(self._inflight)
+
+    def _clear_inflight(self, task: asyncio.Task) -> None:
+        self._inflight = None
+
+    async def _refresh(self) -> dict | None:
+        headers = {}
+        if self.data is not None:
+            if self.etag:
+                headers["If-None-Match"] = self.etag
+            if self.last_modified:
+                headers["If-Modified-Since"] = self.last_modified
+
+        started = time.perf_counter()
+        try:
+            # httpx's timeout bounds each read; this bounds the whole fetch
+            resp = await asyncio.wait_for(
+                get_http_client().get(self.url, headers=headers, timeout=self.timeout),
+                self.timeout,
+            )
+            schedule_fetch_latency.observe(time.perf_counter() - started)
+            if resp.status_code == 304 and self.data is not None:
+                self.failed = False
+                self.expires_at = time.monotonic() + self.ttl
+                return self.data
+            resp.raise_for_status()
+            fingerprint = hashlib.sha256(resp.content).hexdigest()
+            if fingerprint != self.fingerprint or self.data is None:
+                self.data = resp.json()
+                self.fingerprint = fingerprint
+                self.version += 1
+                self.index = None
+        except Exception:
+            self.failed = True
+            if self.data is None:
+                log.exception("Failed to fetch outage schedule from %s", self.url)
+            else:
+                log.warning(
+                    "Failed to refresh outage schedule from %s, serving cached copy",
+                    self.url,
+                    exc_info=True,
+                )
+            self.expires_at = time.monotonic() + min(self.ttl, ERROR_RETRY)
+            return self.data
+
+        self.failed = False
+        self.etag = resp.headers.get("ETag")
+        self.last_modified = resp.headers.get("Last-Modified")
+        self.expires_at = time.monotonic() + self.ttl
+        return self.data
+
+    async def get_index(self) -> ScheduleIndex | None:
+        """The schedule compiled for lookups; compiled once per downloaded version."""
+        data = await self.get()
+        if data is None:
+            return None
+        if self.index is None or self.index.version != self.version:
+            self.index = ScheduleIndex(data, self.version)
+        return self.index
 
-STATUS_LABELS = {
-    "yes": "✅",
-    "no": "❌",
-    "mfirst": "🟡",
-    "msecond": "🟠",
+
+schedule_caches = {
+    region: ScheduleCache(source.url, settings.SCHEDULE_TTL, source.timeout)
+    for region, source in settings.SCHEDULE_SOURCES.items()
 }
 
 
-async def fetch_schedule() -> dict | None:
-    try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            resp = await client.get(SCHEDULE_URL)
-            resp.raise_for_status()
-            return resp.json()
-    except Exception:
-        log.exception("Failed to fetch outage schedule")
-        return None
+def device_region(device_id: str) -> str:
+    return settings.DEVICE_REGIONS.get(device_id, DEFAULT_REGION)
 
 
-def _get_day_key(data: dict, day: str = "today") -> str | None:
-    fact = data.get("fact", {})
-    today_key = fact.get("today")
-    if not today_key:
-        return None
+def region_devices(region: str) -> list[str]:
+    return [d for d in settings.DEVICES if device_region(d) == region]
 
-    # Verify the "today" key actually matches today's date
-    key_date = datetime.fromtimestamp(int(today_key), tz=KYIV_TZ).date()
-    actual_today = datetime.now(KYIV_TZ).date()
 
-    if day == "today":
-        if key_date != actual_today:
-            return None
-        return str(today_key)
+def region_groups(region: str = DEFAULT_REGION) -> list[str]:
+    return settings.SCHEDULE_SOURCES[region].groups
+
+
+async def fetch_schedule(region: str = DEFAULT_REGION) -> ScheduleIndex | None:
+    return await schedule_caches[region].get_index()
+
+
+async def fetch_schedules(regions: Iterable[str]) -> dict[str, ScheduleIndex | None]:
+    """Several regions' indexes, fetched concurrently so a slow source holds up only itself."""
+    regions = list(dict.fromkeys(regions))
+    indexes = await asyncio.gather(*(fetch_schedule(r) for r in regions))
+    return dict(zip(regions, indexes))
+
+
+def _memo(index: ScheduleIndex, key: tuple, render) -> str:
+    """Rendered text for ``key``, kept until the schedule version changes."""
+    text = index.texts.get(key)
+    if text is not None:
+        render_cache_hits.inc("schedule")
     else:
-        tomorrow_key = str(int(today_key) + 86400)
-        if key_date != actual_today:
-            return None
-        # Check if tomorrow's data exists
-        if tomorrow_key not in fact.get("data", {}):
-            return None
-        return tomorrow_key
+        render_cache_misses.inc("schedule")
+        if len(index.texts) >= 256:
+            # Old dates and hours pile up while the schedule stays unchanged
+            index.texts.clear()
+        text = index.texts[key] = render()
+    return text
+
 
+def _slot_text(hour: int) -> str:
+    """Half-hour window text for slot ``hour`` (0-based), as the schedule is announced."""
+    return f"{hour:02d}:00-{hour:02d}:30"
 
-def format_schedule_text(data: dict, day: str = "today") -> str:
-    fact = data.get("fact", {})
+
+def format_schedule_text(
+    index: ScheduleIndex, day: str = "today", groups: list[str] | None = None
+) -> str:
+    groups = groups or region_groups()
+    today = datetime.now(KYIV_TZ).date()
+    return _memo(
+        index, ("table", day, today, tuple(groups)),
+        lambda: _render_schedule(index, day, today, groups),
+    )
+
+
+def _render_schedule(index: ScheduleIndex, day: str, today, groups: list[str]) -> str:
     label = "сьогодні" if day == "today" else "завтра"
-    day_key = _get_day_key(data, day)
+    day_key = index.day_key(day, today)
     if not day_key:
-        update = fact.get("update", "?")
-        return f"⚠️ Графік на {label} ще не опубліковано\n\nОстаннє оновлення графіку: {update}"
+        return f"⚠️ Графік на {label} ще не опубліковано\n\nОстаннє оновлення графіку: {index.update}"
 
-    day_data = fact.get("data", {}).get(day_key, {})
+    day_data = index.days.get(day_key)
     if not day_data:
         return f"⚠️ Графік на {label} не знайдено"
 
-    day_date = datetime.fromtimestamp(int(day_key), tz=KYIV_TZ)
-
-    groups = settings.OUTAGE_GROUPS
+    day_date = index.day_date(day_key)
     group_data = {g: day_data.get(g) for g in groups}
 
     if len(groups) >= 2 and all(group_data.values()):
         header = "         " + "  ".join(f"{g:>6}" for g in groups)
         lines = [f"📅 *Графік на {label} ({day_date.strftime('%d.%m.%Y')})*\n"]
         lines.append(f"`{header}`")
-        for h in range(1, 25):
-            end = "00" if h == 24 else f"{h:02d}"
-            row = f"{h - 1:02d}-{end}    "
+        for h in range(24):
+            end = "00" if h == 23 else f"{h + 1:02d}"
+            row = f"{h:02d}-{end}    "
             for g in groups:
-                status = group_data[g].get(str(h), "yes")
-                icon = STATUS_LABELS.get(status, "❓")
-                row += f" {icon}    "
+                row += f" {STATUS_ICONS[group_data[g].slots[h]]}    "
             lines.append(f"`{row.rstrip()}`")
     else:
         lines = [f"📅 *Графік на {label} ({day_date.strftime('%d.%m.%Y')})*\n"]
@@ -93,81 +240,63 @@ def format_schedule_text(data: dict, day: str = "today") -> str:
             if not hours:
                 lines.append(f"\n*{g}*: дані відсутні")
                 continue
-            for h in range(1, 25):
-                status = hours.get(str(h), "yes")
-                icon = STATUS_LABELS.get(status, "❓")
-                end = "00:00" if h == 24 else f"{h:02d}:00"
-                lines.append(f"`{h - 1:02d}:00-{end}` {icon}")
+            for h in range(24):
+                end = "00:00" if h == 23 else f"{h + 1:02d}:00"
+                lines.append(f"`{h:02d}:00-{end}` {STATUS_ICONS[hours.slots[h]]}")
 
-    lines.append(f"\nГрафік оновлено: {fact.get('update', '?')}")
+    lines.append(f"\nГрафік оновлено: {index.update}")
     return "\n".join(lines)
 
 
-def _get_active_group(day_data: dict, current_hour: int) -> str | None:
+def _get_active_group(
+    day_data: dict[str, GroupDay], hour: int, groups: list[str]
+) -> GroupDay | None:
     """Determine which group is currently causing the outage."""
-    for group in settings.OUTAGE_GROUPS:
+    for group in groups:
         hours = day_data.get(group)
-        if not hours:
-            continue
-        status = hours.get(str(current_hour), "yes")
-        if status in ("no", "mfirst", "msecond"):
-            return group
+        if hours and hours.slots[hour] in OUTAGE_CODES:
+            return hours
     return None
 
 
-def get_next_on_time(data: dict) -> str | None:
-    fact = data.get("fact", {})
-    today_key = _get_day_key(data)
-    if not today_key:
-        return None
-
-    day_data = fact.get("data", {}).get(today_key, {})
+def get_next_on_time(index: ScheduleIndex, groups: list[str] | None = None) -> str | None:
+    groups = groups or region_groups()
+    day_data = index.day()
     if not day_data:
         return None
 
-    now = datetime.now(KYIV_TZ)
-    current_hour = now.hour + 1  # schedule uses 1-24
-
-    active_group = _get_active_group(day_data, current_hour)
-    if not active_group:
+    hour = datetime.now(KYIV_TZ).hour
+    active = _get_active_group(day_data, hour, groups)
+    if not active:
         return None  # current slot is not a planned outage — restoration time unknown
 
-    hours = day_data.get(active_group)
-    if not hours:
-        return None
+    next_on = active.next_on[hour + 1]
+    return _slot_text(next_on) if next_on != NO_HOUR else None
 
-    for h in range(current_hour + 1, 25):
-        status = hours.get(str(h), "yes")
-        if status != "no":
-            return f"{h - 1:02d}:00-{h - 1:02d}:30"
 
-    return None
+def get_next_off_text(index: ScheduleIndex, groups: list[str] | None = None) -> str:
+    groups = groups or region_groups()
+    now = datetime.now(KYIV_TZ)
+    return _memo(
+        index, ("next_off", now.date(), now.hour, tuple(groups)),
+        lambda: _render_next_off(index, now, groups),
+    )
 
 
-def get_next_off_text(data: dict) -> str:
-    fact = data.get("fact", {})
-    today_key = _get_day_key(data)
-    if not today_key:
-        return "🕐 Наступне відключення сьогодні: невідомо"
-
-    day_data = fact.get("data", {}).get(today_key, {})
+def _render_next_off(index: ScheduleIndex, now: datetime, groups: list[str]) -> str:
+    day_data = index.day(today=now.date())
     if not day_data:
         return "🕐 Наступне відключення сьогодні: невідомо"
 
-    now = datetime.now(KYIV_TZ)
-    next_hour = now.hour + 2  # schedule uses 1-24, skip current slot
-
+    # Skip the current slot
     parts = []
-    for group in settings.OUTAGE_GROUPS:
+    for group in groups:
         hours = day_data.get(group)
         if not hours:
             continue
-
-        for h in range(next_hour, 25):
-            status = hours.get(str(h), "yes")
-            if status == "no":
-                parts.append(f"{h - 1:02d}:00-{h - 1:02d}:30")
-                break
+        next_off = hours.next_off[now.hour + 1]
+        if next_off != NO_HOUR:
+            parts.append(_slot_text(next_off))
 
     if not parts:
         return "🕐 Наступне відключення сьогодні: не планується"
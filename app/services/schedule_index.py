@@ -0,0 +1,80 @@
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+KYIV_TZ = ZoneInfo("Europe/Kyiv")
+
+HOURS = 24
+NO_HOUR = 255
+
+# Slot status codes, in the order of STATUS_ICONS
+YES, NO, MFIRST, MSECOND, UNKNOWN = range(5)
+STATUS_CODES = {"yes": YES, "no": NO, "mfirst": MFIRST, "msecond": MSECOND}
+STATUS_ICONS = ("✅", "❌", "🟡", "🟠", "❓")
+OUTAGE_CODES = frozenset((NO, MFIRST, MSECOND))
+
+
+def _next_matching(slots: bytes, match) -> bytes:
+    """For each slot i, the first slot >= i for which ``match`` holds."""
+    table = bytearray([NO_HOUR] * (HOURS + 1))
+    for i in range(HOURS - 1, -1, -1):
+        table[i] = i if match(slots[i]) else table[i + 1]
+    return bytes(table)
+
+
+class GroupDay:
+    """One group's 24 hourly slots for a day, with next-transition tables.
+
+    Slot ``i`` covers ``i:00-(i+1):00``; the tables have a trailing
+    ``NO_HOUR`` sentinel so ``i == 24`` is a valid lookup.
+    """
+
+    __slots__ = ("slots", "next_on", "next_off")
+
+    def __init__(self, hours: dict) -> None:
+        # The published schedule numbers hours 1-24; a missing hour means power
+        self.slots = bytes(
+            STATUS_CODES.get(hours.get(str(h), "yes"), UNKNOWN) for h in range(1, HOURS + 1)
+        )
+        self.next_on = _next_matching(self.slots, lambda code: code != NO)
+        self.next_off = _next_matching(self.slots, lambda code: code == NO)
+
+
+class ScheduleIndex:
+    """The schedule JSON compiled once per fetched version."""
+
+    def __init__(self, data: dict, version: int = 0) -> None:
+        fact = data.get("fact", {})
+        self.version = version
+        self.update: str = fact.get("update", "?")
+        self.days: dict[str, dict[str, GroupDay]] = {
+            key: {group: GroupDay(hours) for group, hours in groups.items() if hours}
+            for key, groups in fact.get("data", {}).items()
+        }
+
+        today_key = fact.get("today")
+        self.today_key = str(today_key) if today_key else None
+        self.today_date: date | None = (
+            datetime.fromtimestamp(int(today_key), tz=KYIV_TZ).date() if today_key else None
+        )
+        self.tomorrow_key = str(int(today_key) + 86400) if today_key else None
+        # Rendered texts, keyed by whatever they depend on besides the version
+        self.texts: dict[tuple, str] = {}
+
+    def day_key(self, day: str = "today", today: date | None = None) -> str | None:
+        """Key of ``day``'s data, or None when it isn't published for the real date."""
+        if self.today_key is None:
+            return None
+        # Verify the "today" key actually matches today's date
+        if self.today_date != (today or datetime.now(KYIV_TZ).date()):
+            return None
+        if day == "today":
+            return self.today_key
+        # Check if tomorrow's data exists
+        return self.tomorrow_key if self.tomorrow_key in self.days else None
+
+    def day(self, day: str = "today", today: date | None = None) -> dict[str, GroupDay] | None:
+        key = self.day_key(day, today)
+        return self.days.get(key) if key else None
+
+    def day_date(self, day_key: str) -> date:
+        return datetime.fromtimestamp(int(day_key), tz=KYIV_TZ).date()
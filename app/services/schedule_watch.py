@@ -0,0 +1,182 @@
+import asyncio
+import json
+import logging
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram import Bot
+
+from app.bot.notifications import notify_groups
+from app.config import DEFAULT_REGION, settings
+from app.database import async_session
+from app.models import ScheduleVersion
+from app.services.schedule import ScheduleCache, schedule_caches
+from app.services.schedule_index import HOURS, KYIV_TZ, STATUS_ICONS, YES, ScheduleIndex
+
+log = logging.getLogger(__name__)
+
+# {day_key: {group: 24 slot codes}}
+Slots = dict[str, dict[str, bytes]]
+
+
+def snapshot(index: ScheduleIndex) -> Slots:
+    """Slots of today and later days, the part of a version worth diffing."""
+    today = datetime.now(KYIV_TZ).date()
+    return {
+        key: {group: day.slots for group, day in groups.items()}
+        for key, groups in index.days.items()
+        if index.day_date(key) >= today
+    }
+
+
+def diff(old: Slots, new: Slots, groups: list[str]) -> dict[str, dict[str, list[int]]]:
+    """Changed hours per group and day. A day missing from ``old`` counts as all power."""
+    no_outages = bytes([YES] * HOURS)
+    changes: dict[str, dict[str, list[int]]] = {}
+    for day_key, new_groups in new.items():
+        for group in groups:
+            after = new_groups.get(group)
+            if after is None:
+                continue
+            before = old.get(day_key, {}).get(group, no_outages)
+            hours = [h for h in range(HOURS) if before[h] != after[h]]
+            if hours:
+                changes.setdefault(group, {})[day_key] = hours
+    return changes
+
+
+def _day_label(index: ScheduleIndex, day_key: str) -> str:
+    day = index.day_date(day_key)
+    today = datetime.now(KYIV_TZ).date()
+    if day == today:
+        return "сьогодні"
+    if day == today + timedelta(days=1):
+        return "завтра"
+    return day.strftime("%d.%m")
+
+
+def describe(index: ScheduleIndex, group: str, days: dict[str, list[int]], slots: Slots) -> str:
+    """One line per group: changed hour ranges with their new status."""
+    parts = []
+    for day_key in sorted(days):
+        codes = slots[day_key][group]
+        ranges: list[tuple[int, int]] = []
+        for hour in days[day_key]:
+            if ranges and ranges[-1][1] == hour and codes[ranges[-1][0]] == codes[hour]:
+                ranges[-1] = (ranges[-1][0], hour + 1)
+            else:
+                ranges.append((hour, hour + 1))
+        spans = ", ".join(
+            f"{STATUS_ICONS[codes[start]]} {start:02d}:00–{end % 24:02d}:00"
+            for start, end in ranges
+        )
+        parts.append(f"*{group}*, {_day_label(index, day_key)}: {spans}")
+    return "\n".join(parts)
+
+
+async def get_latest_version(session: AsyncSession, source: str) -> ScheduleVersion | None:
+    result = await session.execute(
+        select(ScheduleVersion)
+        .where(ScheduleVersion.source == source)
+        .order_by(ScheduleVersion.id.desc())
+        .limit(1)
+    )
+    return result.scalar_one_or_none()
+
+
+async def save_version(session: AsyncSession, source: str, fingerprint: str, slots: Slots) -> None:
+    encoded = {key: {g: codes.hex() for g, codes in groups.items()} for key, groups in slots.items()}
+    session.add(ScheduleVersion(source=source, fingerprint=fingerprint, slots=json.dumps(encoded)))
+    await session.commit()
+
+
+class ScheduleWatcher:
+    """Polls a schedule source and announces what changed between versions.
+
+    The poll interval starts at SCHEDULE_POLL_MIN and grows while nothing
+    changes, up to SCHEDULE_POLL_MAX. Polls are conditional requests, and a
+    body with an unchanged hash isn't parsed (see ScheduleCache). Each
+    region has its own watcher, polling on its own schedule.
+    """
+
+    def __init__(
+        self, cache: ScheduleCache, groups: list[str], source: str = DEFAULT_REGION
+    ) -> None:
+        self.cache = cache
+        self.groups = groups
+        self.source = source
+        self.fingerprint: str | None = None
+        self.slots: Slots | None = None
+        self._listeners: list[Callable[[ScheduleIndex], Awaitable[None]]] = []
+
+    def on_change(self, listener: Callable[[ScheduleIndex], Awaitable[None]]) -> None:
+        """Await ``listener(index)`` for every new version, the first one included."""
+        self._listeners.append(listener)
+
+    async def load(self) -> None:
+        """Pick up the last known version so changes made while down are announced."""
+        async with async_session() as session:
+            row = await get_latest_version(session, self.source)
+        if row is not None:
+            self.fingerprint = row.fingerprint
+            self.slots = {
+                key: {g: bytes.fromhex(codes) for g, codes in groups.items()}
+                for key, groups in json.loads(row.slots).items()
+            }
+
+    async def check(self, bot: Bot) -> bool:
+        """Fetch once; returns True if a new version appeared."""
+        await self.cache.refresh()
+        if self.cache.fingerprint is None or self.cache.fingerprint == self.fingerprint:
+            return False
+
+        index = await self.cache.get_index()
+        slots = snapshot(index)
+        previous = self.slots
+        self.fingerprint, self.slots = self.cache.fingerprint, slots
+        async with async_session() as session:
+            await save_version(session, self.source, self.fingerprint, slots)
+
+        for listener in self._listeners:
+            try:
+                await listener(index)
+            except Exception:
+                log.exception("schedule change listener failed")
+
+        if previous is None:
+            # First version ever seen: nothing to compare against
+            return True
+        changes = diff(previous, slots, self.groups)
+        if changes:
+            log.info("Schedule changed for %s", ", ".join(changes))
+            await notify_groups(
+                bot,
+                "📅 *Графік змінено*\n",
+                {group: describe(index, group, days, slots) for group, days in changes.items()},
+                f"Графік оновлено: {index.update}",
+                region=self.source,
+            )
+        return True
+
+    async def run(self, bot: Bot) -> None:
+        await self.load()
+        interval = settings.SCHEDULE_POLL_MIN
+        while True:
+            try:
+                changed = await self.check(bot)
+            except Exception:
+                log.exception("schedule watch error")
+                changed = False
+            if changed:
+                interval = settings.SCHEDULE_POLL_MIN
+            else:
+                interval = min(interval * 1.5, settings.SCHEDULE_POLL_MAX)
+            await asyncio.sleep(interval)
+
+
+schedule_watchers = {
+    region: ScheduleWatcher(schedule_caches[region], source.groups, region)
+    for region, source in settings.SCHEDULE_SOURCES.items()
+}
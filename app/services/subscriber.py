@@ -1,7 +1,8 @@
 from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models import Subscriber
+from app.models import Subscriber, Subscription
+from app.state import Preferences, subscriber_registry
 
 
 async def get_all_subscribers(session: AsyncSession) -> list[int]:
@@ -9,8 +10,17 @@ async def get_all_subscribers(session: AsyncSession) -> list[int]:
     return list(result.scalars().all())
 
 
-async def add_subscriber(session: AsyncSession, chat_id: int) -> bool:
-    """Add subscriber. Returns True if new, False if already existed."""
+async def get_subscriptions(session: AsyncSession, chat_id: int) -> set[str]:
+    result = await session.execute(
+        select(Subscription.device_id).where(Subscription.chat_id == chat_id)
+    )
+    return set(result.scalars().all())
+
+
+async def add_subscriber(
+    session: AsyncSession, chat_id: int, device_ids: list[str] | None = None
+) -> bool:
+    """Add subscriber following ``device_ids``. Returns True if new, False if already existed."""
     existing = await session.execute(
         select(Subscriber).where(Subscriber.chat_id == chat_id)
     )
@@ -18,17 +28,125 @@ async def add_subscriber(session: AsyncSession, chat_id: int) -> bool:
         return False
 
     session.add(Subscriber(chat_id=chat_id))
+    # Flush the subscriber first so the subscriptions' foreign key resolves
+    await session.flush()
+    session.add_all(Subscription(chat_id=chat_id, device_id=d) for d in device_ids or [])
     await session.commit()
+    subscriber_registry.add(chat_id, device_ids or [])
     return True
 
 
+async def set_subscription(
+    session: AsyncSession, chat_id: int, device_id: str, follow: bool
+) -> None:
+    if follow:
+        existing = await session.get(Subscription, (chat_id, device_id))
+        if existing is None:
+            session.add(Subscription(chat_id=chat_id, device_id=device_id))
+    else:
+        await session.execute(
+            delete(Subscription).where(
+                Subscription.chat_id == chat_id, Subscription.device_id == device_id
+            )
+        )
+    await session.commit()
+    subscriber_registry.follow(chat_id, device_id, follow)
+
+
 async def remove_subscriber(session: AsyncSession, chat_id: int) -> None:
+    await session.execute(delete(Subscription).where(Subscription.chat_id == chat_id))
     await session.execute(delete(Subscriber).where(Subscriber.chat_id == chat_id))
     await session.commit()
+    subscriber_registry.remove(chat_id)
 
 
 async def remove_subscribers(session: AsyncSession, chat_ids: list[int]) -> None:
     if not chat_ids:
         return
+    await session.execute(delete(Subscription).where(Subscription.chat_id.in_(chat_ids)))
     await session.execute(delete(Subscriber).where(Subscriber.chat_id.in_(chat_ids)))
     await session.commit()
+    for chat_id in chat_ids:
+        subscriber_registry.remove(chat_id)
+
+
+async def migrate_subscribers(session: AsyncSession, migrated: dict[int, int]) -> None:
+    """Move subscribers to their chats' new ids, keyed by the old ones.
+
+    Telegram gives a group a new id when it becomes a supergroup. If the new
+    chat is already subscribed, the two sets of sites are merged and its own
+    preferences kept.
+    """
+    moved = []
+    for old_id, new_id in migrated.items():
+        old = await session.get(Subscriber, old_id)
+        if old is None:
+            continue
+        sites = await get_subscriptions(session, old_id)
+        new = await session.get(Subscriber, new_id)
+        if new is None:
+            new = Subscriber(
+                chat_id=new_id,
+                created_at=old.created_at,
+                quiet_start=old.quiet_start,
+                quiet_end=old.quiet_end,
+                off_only=old.off_only,
+                schedule_alerts=old.schedule_alerts,
+                groups=old.groups,
+            )
+            session.add(new)
+            await session.flush()
+        new_sites = await get_subscriptions(session, new_id)
+        session.add_all(Subscription(chat_id=new_id, device_id=d) for d in sites - new_sites)
+        await session.execute(delete(Subscription).where(Subscription.chat_id == old_id))
+        await session.execute(delete(Subscriber).where(Subscriber.chat_id == old_id))
+        moved.append((old_id, new_id, sites | new_sites, _preferences(new)))
+    await session.commit()
+    for old_id, new_id, sites, prefs in moved:
+        subscriber_registry.migrate(old_id, new_id, sites, prefs)
+
+
+def _preferences(row: Subscriber) -> Preferences:
+    return Preferences(
+        quiet_start=row.quiet_start,
+        quiet_end=row.quiet_end,
+        off_only=row.off_only,
+        schedule_alerts=row.schedule_alerts,
+        groups=frozenset(row.groups.split(",")) if row.groups is not None else None,
+    )
+
+
+async def set_preferences(session: AsyncSession, chat_id: int, prefs: Preferences) -> None:
+    row = await session.get(Subscriber, chat_id)
+    if row is None:
+        return
+    row.quiet_start = prefs.quiet_start
+    row.quiet_end = prefs.quiet_end
+    row.off_only = prefs.off_only
+    row.schedule_alerts = prefs.schedule_alerts
+    row.groups = ",".join(sorted(prefs.groups)) if prefs.groups is not None else None
+    await session.commit()
+    subscriber_registry.set_preferences(chat_id, prefs)
+
+
+async def load_subscribers(session: AsyncSession) -> None:
+    """Fill the in-memory registry from the DB."""
+    result = await session.execute(select(Subscriber))
+    subscribers = {
+        row.chat_id: (set(), _preferences(row)) for row in result.scalars().all()
+    }
+    result = await session.execute(select(Subscription.chat_id, Subscription.device_id))
+    for chat_id, device_id in result.all():
+        if chat_id in subscribers:
+            subscribers[chat_id][0].add(device_id)
+    subscriber_registry.load(subscribers)
+
+
+async def reload_subscriber(session: AsyncSession, chat_id: int) -> None:
+    """Refresh one subscriber in the registry, e.g. after another replica changed it."""
+    row = await session.get(Subscriber, chat_id, populate_existing=True)
+    if row is None:
+        subscriber_registry.replace(chat_id, None)
+        return
+    sites = await get_subscriptions(session, chat_id)
+    subscriber_registry.replace(chat_id, sites, _preferences(row))
@@ -0,0 +1,74 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import msgpack
+from pydantic import BaseModel, Field
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Telemetry
+
+# Device timestamps further off than this are treated as an unset clock
+MAX_CLOCK_SKEW = timedelta(days=7)
+# Largest value of the BIGINT columns
+MAX_BIGINT = 2**63 - 1
+
+
+class TelemetrySample(BaseModel):
+    # Bounded by their columns, so out-of-range values are a 422 rather than
+    # a failed INSERT
+    seq: int | None = Field(None, ge=0, le=MAX_BIGINT)
+    # Unix time on the device, if its clock is set
+    ts: float | None = None
+    voltage: float | None = None
+    uptime: int | None = Field(None, ge=0, le=MAX_BIGINT)
+    # dBm
+    rssi: int | None = Field(None, ge=-128, le=127)
+
+
+def parse_samples(body: bytes, content_type: str) -> list[TelemetrySample]:
+    """Decode newline-delimited JSON, or a msgpack map or array of maps.
+
+    Raises ValueError, or pydantic's ValidationError, on malformed input.
+    """
+    if "msgpack" in content_type:
+        raw = msgpack.unpackb(body)
+        if isinstance(raw, dict):
+            raw = [raw]
+        elif not isinstance(raw, list):
+            raise ValueError(f"expected a msgpack map or array, got {type(raw).__name__}")
+    else:
+        raw = [json.loads(line) for line in body.splitlines() if line.strip()]
+    return [TelemetrySample.model_validate(item) for item in raw]
+
+
+async def insert_samples(
+    session: AsyncSession, device_id: str, samples: list[TelemetrySample]
+) -> None:
+    """Write all samples with a single multi-row INSERT."""
+    if not samples:
+        return
+
+    now = datetime.now(timezone.utc)
+    rows = []
+    for sample in samples:
+        measured_at = now
+        if sample.ts is not None:
+            try:
+                device_time = datetime.fromtimestamp(sample.ts, tz=timezone.utc)
+            except (OverflowError, OSError, ValueError):
+                device_time = None
+            if device_time and abs(device_time - now) <= MAX_CLOCK_SKEW:
+                measured_at = device_time
+        rows.append({
+            "device_id": device_id,
+            "seq": sample.seq,
+            "measured_at": measured_at,
+            "received_at": now,
+            "voltage": sample.voltage,
+            "uptime": sample.uptime,
+            "rssi": sample.rssi,
+        })
+
+    await session.execute(insert(Telemetry), rows)
+    await session.commit()
@@ -1,63 +1,441 @@
+import asyncio
+import logging
 import time
+from collections.abc import Callable
+from dataclasses import dataclass
 from datetime import datetime, timezone
 
+from app.config import settings
 from app.database import async_session
-from app.services.power import get_power_state, upsert_power_state
+from app.services.deadlines import DeadlineQueue
+from app.services.history import ping_history
+from app.services.power import get_power_states, upsert_power_states
 
+log = logging.getLogger(__name__)
 
-class PowerStateManager:
-    def __init__(self) -> None:
-        self.last_ping: float = time.time()
-        self.power_is_on: bool = True
+
+def _to_dt(ts: float | None) -> datetime | None:
+    return datetime.fromtimestamp(ts, tz=timezone.utc) if ts else None
+
+
+class DeviceState:
+    __slots__ = (
+        "device_id",
+        "last_ping",
+        "power_is_on",
+        "power_off_time",
+        "power_on_time",
+        "missed_checks",
+        "version",
+    )
+
+    def __init__(self, device_id: str, last_ping: float) -> None:
+        self.device_id = device_id
+        self.last_ping = last_ping
+        self.power_is_on = True
         self.power_off_time: float | None = None
         self.power_on_time: float | None = None
+        self.missed_checks = 0
+        # Bumped on every change that shows up in the bot's replies
+        self.version = 0
+
+    @property
+    def name(self) -> str:
+        return settings.DEVICES.get(self.device_id, self.device_id)
+
+    def as_row(self) -> dict:
+        return {
+            "device_id": self.device_id,
+            "power_is_on": self.power_is_on,
+            "last_ping_at": _to_dt(self.last_ping),
+            "power_off_at": _to_dt(self.power_off_time),
+            "power_on_at": _to_dt(self.power_on_time),
+        }
+
+
+class PowerStateManager:
+    def __init__(self) -> None:
+        self.devices: dict[str, DeviceState] = {}
+        # When each powered device is next considered missing
+        self.deadlines = DeadlineQueue()
+        # Powered-off devices that pinged since the last monitor pass
+        self._recovered: set[str] = set()
+        # Set when the monitor has something to do before the next deadline
+        self.wake = asyncio.Event()
+        self._dirty: set[str] = set()
+        self._save_lock = asyncio.Lock()
+        self._flusher: asyncio.Task | None = None
+        self._ping_listeners: list[Callable[[str, float], None]] = []
+        self._transition_listeners: list[Callable[[DeviceState], None]] = []
+
+        now = time.time()
+        for device_id in settings.DEVICES:
+            self._track(DeviceState(device_id, now))
+
+    @property
+    def write_behind(self) -> bool:
+        return settings.PING_FLUSH_INTERVAL > 0
+
+    def get(self, device_id: str) -> DeviceState | None:
+        return self.devices.get(device_id)
+
+    def _track(self, device: DeviceState) -> None:
+        self.devices[device.device_id] = device
+        if device.power_is_on:
+            self.deadlines.set(device.device_id, device.last_ping + settings.PING_TIMEOUT)
+        else:
+            self.deadlines.discard(device.device_id)
 
     async def load_from_db(self) -> None:
         """Restore state from DB after restart."""
         async with async_session() as session:
-            row = await get_power_state(session)
+            rows = await get_power_states(session)
 
-        if row is None:
-            # First ever launch — save defaults
-            await self.save_to_db()
-            return
+        now = time.time()
+        for row in rows:
+            if row.device_id not in settings.DEVICES:
+                continue
+            device = DeviceState(row.device_id, now)
+            device.power_is_on = row.power_is_on
+            device.power_off_time = row.power_off_at.timestamp() if row.power_off_at else None
+            device.power_on_time = row.power_on_at.timestamp() if row.power_on_at else None
+            if not row.power_is_on:
+                # Power was OFF — keep the old last_ping so monitor stays in "off" state
+                device.last_ping = row.last_ping_at.timestamp()
+            # Power was ON — last_ping is "now" to give the ESP time to reconnect
+            self._track(device)
+
+        known = {row.device_id for row in rows}
+        new = [d for d in self.devices if d not in known]
+        if new:
+            # First launch for these devices — save defaults
+            await self.save_to_db(new)
 
-        self.power_is_on = row.power_is_on
-        self.power_off_time = row.power_off_at.timestamp() if row.power_off_at else None
-        self.power_on_time = row.power_on_at.timestamp() if row.power_on_at else None
+    async def save_to_db(self, device_ids: list[str] | None = None) -> None:
+        """Persist in-memory state of the given devices (all by default) to DB."""
+        ids = list(self.devices) if device_ids is None else device_ids
+        # Serialize writers so a slow flush can't commit an older snapshot
+        # after a transition has already been saved.
+        async with self._save_lock:
+            self._dirty.difference_update(ids)
+            try:
+                async with async_session() as session:
+                    await upsert_power_states(
+                        session, [self.devices[d].as_row() for d in ids]
+                    )
+            except Exception:
+                self._dirty.update(ids)
+                raise
 
-        if row.power_is_on:
-            # Power was ON — give ESP 60s to reconnect
-            self.last_ping = time.time()
+    async def flush(self) -> None:
+        """Write pings buffered since the last save, if any."""
+        if self._dirty:
+            await self.save_to_db(list(self._dirty))
+
+    def on_ping(self, listener: Callable[[str, float], None]) -> None:
+        """Call ``listener(device_id, at)`` for every ping received by this process."""
+        self._ping_listeners.append(listener)
+
+    def on_transition(self, listener: Callable[[DeviceState], None]) -> None:
+        """Call ``listener(device)`` after this process marks a device off or on."""
+        self._transition_listeners.append(listener)
+
+    def record_ping(self, device_id: str) -> None:
+        now = time.time()
+        self._ping(self.devices[device_id], now)
+        for listener in self._ping_listeners:
+            listener(device_id, now)
+
+    def apply_ping(self, device_id: str, at: float) -> None:
+        """Record a ping another replica received at ``at``.
+
+        Pings older than the device's last one are dropped, which keeps the
+        ping history in order when replicas' reports interleave.
+        """
+        device = self.devices.get(device_id)
+        if device is not None and at > device.last_ping:
+            self._ping(device, at)
+
+    def _ping(self, device: DeviceState, at: float) -> None:
+        device_id = device.device_id
+        device.last_ping = at
+        device.missed_checks = 0
+        device.version += 1
+        ping_history.record(device_id, at)
+        if device.power_is_on:
+            self.deadlines.set(device_id, at + settings.PING_TIMEOUT)
         else:
-            # Power was OFF — keep the old last_ping so monitor stays in "off" state
-            self.last_ping = row.last_ping_at.timestamp()
+            self._recovered.add(device_id)
+            self.wake.set()
+        self._dirty.add(device_id)
 
-    async def save_to_db(self) -> None:
-        """Persist current in-memory state to DB."""
-        async with async_session() as session:
-            await upsert_power_state(
-                session,
-                power_is_on=self.power_is_on,
-                last_ping_at=datetime.fromtimestamp(self.last_ping, tz=timezone.utc),
-                power_off_at=(
-                    datetime.fromtimestamp(self.power_off_time, tz=timezone.utc)
-                    if self.power_off_time
-                    else None
-                ),
-                power_on_at=(
-                    datetime.fromtimestamp(self.power_on_time, tz=timezone.utc)
-                    if self.power_on_time
-                    else None
-                ),
-            )
-
-    def record_ping(self) -> None:
-        self.last_ping = time.time()
-
-    async def record_ping_and_save(self) -> None:
-        self.record_ping()
-        await self.save_to_db()
+    def apply_transition(
+        self, device_id: str, power_is_on: bool, off_time: float | None, on_time: float | None
+    ) -> None:
+        """Take over a power transition the leading replica detected."""
+        device = self.devices.get(device_id)
+        if device is None:
+            return
+        device.power_is_on = power_is_on
+        device.power_off_time = off_time
+        device.power_on_time = on_time
+        device.missed_checks = 0
+        device.version += 1
+        if power_is_on:
+            self._recovered.discard(device_id)
+        self._track(device)
+
+    async def record_ping_and_save(self, device_id: str) -> None:
+        self.record_ping(device_id)
+        if not self.write_behind:
+            await self.save_to_db([device_id])
+
+    def pop_expired(self, now: float) -> list[tuple[DeviceState, float]]:
+        """Powered devices whose deadline has passed, with that deadline."""
+        return [(self.devices[d], at) for d, at in self.deadlines.pop_expired(now)]
+
+    def defer(self, device: DeviceState, deadline: float) -> None:
+        """Check ``device`` again at ``deadline`` unless it pings first."""
+        self.deadlines.set(device.device_id, deadline)
+
+    def pop_recovered(self) -> list[DeviceState]:
+        """Powered-off devices that pinged since the last call."""
+        recovered = [self.devices[d] for d in self._recovered]
+        self._recovered.clear()
+        return recovered
+
+    def mark_off(self, device: DeviceState) -> None:
+        device.power_is_on = False
+        device.power_off_time = time.time()
+        device.missed_checks = 0
+        device.version += 1
+        self._track(device)
+        self._transitioned(device)
+
+    def mark_on(self, device: DeviceState) -> None:
+        device.power_is_on = True
+        device.power_on_time = time.time()
+        device.missed_checks = 0
+        device.version += 1
+        self._track(device)
+        self._transitioned(device)
+
+    def _transitioned(self, device: DeviceState) -> None:
+        for listener in self._transition_listeners:
+            listener(device)
+
+    def start_flusher(self) -> None:
+        if self.write_behind and self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop_flusher(self) -> None:
+        flusher, self._flusher = self._flusher, None
+        if flusher is None:
+            return
+        flusher.cancel()
+        try:
+            await flusher
+        except asyncio.CancelledError:
+            pass
+
+    async def _flush_loop(self) -> None:
+        # Before 3.12, asyncio.wait_for can swallow a cancel, e.g. one that
+        # lands as SQLAlchemy's pool hands flush() a connection, so the loop
+        # also stops once it is no longer the flusher
+        while self._flusher is asyncio.current_task():
+            await asyncio.sleep(settings.PING_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("power state flush error")
 
 
 power_state = PowerStateManager()
+
+
+@dataclass(frozen=True)
+class Preferences:
+    """What a subscriber wants to be notified about."""
+
+    # Local (Kyiv) hours [quiet_start, quiet_end) with no notifications; may wrap midnight
+    quiet_start: int | None = None
+    quiet_end: int | None = None
+    # Skip "power is back" alerts
+    off_only: bool = False
+    # Schedule change alerts and reminders
+    schedule_alerts: bool = True
+    # Outage groups to hear about; None means all groups of their sites' regions
+    groups: frozenset[str] | None = None
+
+    def quiet_hours(self) -> list[int]:
+        if self.quiet_start is None or self.quiet_end is None:
+            return []
+        length = (self.quiet_end - self.quiet_start) % 24
+        return [(self.quiet_start + i) % 24 for i in range(length)]
+
+    def follows_group(self, group: str) -> bool:
+        return self.groups is None or group in self.groups
+
+
+class SubscriberRegistry:
+    """In-memory copy of subscribers, the sites they follow and their preferences.
+
+    Loaded once at startup and updated by the subscriber services after each
+    commit, so counts, membership checks and broadcast recipient lists don't
+    touch the database. Preferences are also indexed as sets of chat ids, so
+    picking an event's recipients is a few set operations.
+    """
+
+    def __init__(self) -> None:
+        self._sites: dict[int, set[str]] = {}
+        self._prefs: dict[int, Preferences] = {}
+        self._listeners: list[Callable[[int], None]] = []
+        self._reset_indexes()
+
+    def _reset_indexes(self) -> None:
+        self._followers: dict[str, set[int]] = {}
+        self._off_only: set[int] = set()
+        self._no_schedule: set[int] = set()
+        self._quiet: list[set[int]] = [set() for _ in range(24)]
+        # Subscribers with a group filter, by group; the rest are in _all_groups
+        self._by_group: dict[str, set[int]] = {}
+        self._all_groups: set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._sites)
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._sites
+
+    def on_change(self, listener: Callable[[int], None]) -> None:
+        """Call ``listener(chat_id)`` after every local change, e.g. to tell other replicas."""
+        self._listeners.append(listener)
+
+    def _changed(self, chat_id: int) -> None:
+        for listener in self._listeners:
+            listener(chat_id)
+
+    def _index(self, chat_id: int) -> None:
+        for device_id in self._sites[chat_id]:
+            self._followers.setdefault(device_id, set()).add(chat_id)
+        prefs = self._prefs[chat_id]
+        if prefs.off_only:
+            self._off_only.add(chat_id)
+        if not prefs.schedule_alerts:
+            self._no_schedule.add(chat_id)
+        for hour in prefs.quiet_hours():
+            self._quiet[hour].add(chat_id)
+        if prefs.groups is None:
+            self._all_groups.add(chat_id)
+        else:
+            for group in prefs.groups:
+                self._by_group.setdefault(group, set()).add(chat_id)
+
+    def _unindex(self, chat_id: int) -> None:
+        for device_id in self._sites.get(chat_id, ()):
+            self._followers[device_id].discard(chat_id)
+        prefs = self._prefs.get(chat_id)
+        if prefs is None:
+            return
+        self._off_only.discard(chat_id)
+        self._no_schedule.discard(chat_id)
+        for hour in prefs.quiet_hours():
+            self._quiet[hour].discard(chat_id)
+        self._all_groups.discard(chat_id)
+        for group in prefs.groups or ():
+            self._by_group[group].discard(chat_id)
+
+    def load(self, subscribers: dict[int, tuple[set[str], Preferences]]) -> None:
+        self._sites = {chat_id: set(sites) for chat_id, (sites, _) in subscribers.items()}
+        self._prefs = {chat_id: prefs for chat_id, (_, prefs) in subscribers.items()}
+        self._reset_indexes()
+        for chat_id in self._sites:
+            self._index(chat_id)
+
+    def replace(
+        self, chat_id: int, sites: set[str] | None, prefs: Preferences | None = None
+    ) -> None:
+        """Set one subscriber's sites and preferences without notifying.
+
+        ``sites=None`` removes the subscriber; ``prefs=None`` keeps the current ones.
+        """
+        prefs = prefs or self._prefs.get(chat_id) or Preferences()
+        self._unindex(chat_id)
+        if sites is None:
+            self._sites.pop(chat_id, None)
+            self._prefs.pop(chat_id, None)
+            return
+        self._sites[chat_id] = set(sites)
+        self._prefs[chat_id] = prefs
+        self._index(chat_id)
+
+    def add(self, chat_id: int, sites: list[str]) -> None:
+        self.replace(chat_id, set(sites), Preferences())
+        self._changed(chat_id)
+
+    def remove(self, chat_id: int) -> None:
+        self.replace(chat_id, None)
+        self._changed(chat_id)
+
+    def follow(self, chat_id: int, device_id: str, follow: bool) -> None:
+        sites = set(self._sites.get(chat_id, ()))
+        if follow:
+            sites.add(device_id)
+        else:
+            sites.discard(device_id)
+        self.replace(chat_id, sites)
+        self._changed(chat_id)
+
+    def set_preferences(self, chat_id: int, prefs: Preferences) -> None:
+        self.replace(chat_id, self._sites.get(chat_id, set()), prefs)
+        self._changed(chat_id)
+
+    def migrate(self, old_id: int, new_id: int, sites: set[str], prefs: Preferences) -> None:
+        """Move a subscriber to a new chat id, e.g. a group that became a supergroup."""
+        self.replace(old_id, None)
+        self.replace(new_id, sites, prefs)
+        self._changed(old_id)
+        self._changed(new_id)
+
+    def sites(self, chat_id: int) -> set[str]:
+        return set(self._sites.get(chat_id, ()))
+
+    def preferences(self, chat_id: int) -> Preferences:
+        return self._prefs.get(chat_id) or Preferences()
+
+    def chat_ids(self) -> list[int]:
+        """Snapshot of all subscribers, safe to iterate across awaits."""
+        return list(self._sites)
+
+    def followers(self, device_id: str) -> list[int]:
+        """Snapshot of the subscribers following ``device_id``."""
+        return list(self._followers.get(device_id, ()))
+
+    def recipients(
+        self,
+        kind: str,
+        *,
+        hour: int,
+        device_id: str | None = None,
+        group: str | None = None,
+    ) -> list[int]:
+        """Who should get an event, after preferences and quiet hours.
+
+        ``kind`` is "off" or "on" for a site's power alerts (``device_id``),
+        or "schedule" for schedule news about ``group``.
+        """
+        if device_id is not None:
+            chosen = set(self._followers.get(device_id, ()))
+        else:
+            chosen = set(self._sites)
+        if kind == "on":
+            chosen -= self._off_only
+        elif kind == "schedule":
+            chosen -= self._no_schedule
+            if group is not None:
+                chosen &= self._all_groups | self._by_group.get(group, set())
+        chosen -= self._quiet[hour]
+        return list(chosen)
+
+
+subscriber_registry = SubscriberRegistry()
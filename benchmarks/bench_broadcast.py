@@ -0,0 +1,77 @@
+"""Broadcast engine throughput against a fake Telegram bot.
+
+    python -m benchmarks.bench_broadcast --subscribers 5000 --latency 0.05 --output bench_results.json
+"""
+import argparse
+import asyncio
+import json
+
+import benchmarks.common as common
+from app.bot.broadcast import RateLimiter, broadcast
+from benchmarks.fake_bot import FakeBot
+
+
+async def sequential(bot: FakeBot, chat_ids: list[int]) -> None:
+    for chat_id in chat_ids:
+        try:
+            await bot.send_message(chat_id=chat_id, text="bench")
+        except Exception:
+            pass
+
+
+async def run(args: argparse.Namespace) -> dict:
+    chat_ids = list(range(1, args.subscribers + 1))
+    bot = FakeBot(
+        latency=args.latency,
+        blocked_ratio=args.blocked_ratio,
+        timeout_ratio=args.timeout_ratio,
+        flood_ratio=args.flood_ratio,
+    )
+    limiter = RateLimiter(args.rate)
+    result = await broadcast(
+        bot, chat_ids, "bench", limiter=limiter, concurrency=args.concurrency
+    )
+    results = {
+        "engine": {
+            "subscribers": result.total,
+            "sent": result.sent,
+            "failed": result.failed,
+            "retries": result.retries,
+            "duration_s": round(result.duration, 3),
+            "throughput_msg_s": round(result.throughput, 1),
+            "fanout_s": round(result.fanout_latency, 3),
+        }
+    }
+
+    if args.compare:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await sequential(FakeBot(latency=args.latency), chat_ids)
+        elapsed = loop.time() - started
+        results["sequential"] = {
+            "duration_s": round(elapsed, 3),
+            "throughput_msg_s": round(len(chat_ids) / elapsed, 1),
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subscribers", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    # 0 disables pacing so the engine itself is measured
+    parser.add_argument("--rate", type=float, default=0)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--blocked-ratio", type=float, default=0.01)
+    parser.add_argument("--timeout-ratio", type=float, default=0.01)
+    parser.add_argument("--flood-ratio", type=float, default=0.0)
+    parser.add_argument("--compare", action="store_true", help="also time a sequential loop")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+    common.write_results(args.output, "broadcast", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""UDP heartbeat packet rate, against the cost of an HTTP /ping.
+
+    python -m benchmarks.bench_heartbeat --packets 100000 --output bench_results.json
+
+``handler`` feeds signed packets straight to HeartbeatProtocol, so it
+measures verification and the state update alone. ``http_ping`` sends the
+same number of heartbeats as GET /ping over httpx's ASGI transport, for
+comparison. ``socket`` starts the listener on localhost and floods it from
+--senders esp_client processes; packets the kernel dropped because the
+loop fell behind show up as ``lost``.
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+
+import benchmarks.common as common
+
+
+async def _handler(packets: int) -> dict:
+    from app.config import settings
+    from app.services.heartbeat import HeartbeatProtocol, pack_heartbeat
+    from app.state import power_state
+
+    key = settings.ESP_API_KEY.encode()
+    devices = list(settings.DEVICES)
+    batch = [pack_heartbeat(key, devices[i % len(devices)], i + 1) for i in range(packets)]
+    protocol = HeartbeatProtocol(key, power_state)
+    started = time.perf_counter()
+    for packet in batch:
+        protocol.datagram_received(packet, None)
+    elapsed = time.perf_counter() - started
+    return {
+        "packets": packets,
+        "packets_per_s": round(packets / elapsed, 1),
+        "us_per_packet": round(elapsed / packets * 1e6, 2),
+    }
+
+
+async def _http_ping(requests: int) -> dict:
+    import httpx
+
+    from app.config import settings
+    from app.main import app
+
+    devices = list(settings.DEVICES)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        for i in range(requests):
+            params = {"device": devices[i % len(devices)], "api_key": settings.ESP_API_KEY}
+            resp = await client.get("/ping", params=params)
+            assert resp.status_code == 200, resp.text
+        elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "requests_per_s": round(requests / elapsed, 1),
+        "us_per_request": round(elapsed / requests * 1e6, 2),
+    }
+
+
+async def _socket(packets: int, senders: int) -> dict:
+    from app.config import settings
+    from app.metrics import heartbeat_packets
+    from app.services.heartbeat import start_heartbeat_listener
+
+    def accepted() -> int:
+        counter = heartbeat_packets.children.get("accepted")
+        return counter.value if counter else 0
+
+    transport = await start_heartbeat_listener("127.0.0.1", 0)
+    port = transport.get_extra_info("sockname")[1]
+    devices = list(settings.DEVICES)
+    per_sender = packets // senders
+    before = accepted()
+    procs = [
+        await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "benchmarks.esp_client", "--port", str(port),
+            "--device", devices[i % len(devices)], "--interval", "0", "--count", str(per_sender),
+            stdout=subprocess.DEVNULL,
+        )
+        for i in range(senders)
+    ]
+    # Timed from the first packet in until the socket has been drained,
+    # leaving out the senders' interpreter startup
+    while accepted() == before:
+        await asyncio.sleep(0.001)
+    started = time.perf_counter()
+    await asyncio.gather(*(proc.wait() for proc in procs))
+    last, finished = accepted(), time.perf_counter()
+    while True:
+        await asyncio.sleep(0.1)
+        if accepted() == last:
+            break
+        last, finished = accepted(), time.perf_counter()
+    elapsed = finished - started
+    transport.close()
+    received = accepted() - before
+    sent = per_sender * senders
+    return {
+        "senders": senders,
+        "sent": sent,
+        "received": received,
+        "lost": sent - received,
+        "packets_per_s": round(received / elapsed, 1),
+    }
+
+
+async def run(packets: int = 100000, senders: int = 2) -> dict:
+    from app.state import power_state
+
+    await common.init_db()
+    await power_state.load_from_db()
+    power_state.start_flusher()
+    results = {
+        "handler": await _handler(packets),
+        "http_ping": await _http_ping(min(packets, 5000)),
+        "socket": await _socket(packets, senders),
+    }
+    await power_state.stop_flusher()
+    await common.dispose_db()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--packets", type=int, default=100000)
+    parser.add_argument("--senders", type=int, default=2)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+    results = asyncio.run(run(args.packets, args.senders))
+    print(json.dumps(results, indent=2))
+    common.write_results(args.output, "heartbeat", results)
+
+
+if __name__ == "__main__":
+    main()
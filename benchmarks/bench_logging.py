@@ -0,0 +1,95 @@
+"""/ping latency under each logging setup, with a slow log sink.
+
+    python -m benchmarks.bench_logging --duration 5 --write-ms 1 --output bench_results.json
+
+Logs go to a stream whose writes take --write-ms, standing in for a log
+driver or pipe that has fallen behind. ``off`` logs nothing; ``direct`` is
+the old logging.basicConfig setup, writing on the event loop; ``queued`` is
+app.logs with no thinning, so every record is written by the listener
+thread; ``aggregated`` is app.logs with the default LOG_AGGREGATE and
+LOG_SAMPLE. ``lines`` counts what reached the sink and ``dropped`` what the
+full queue turned away.
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import time
+
+import benchmarks.common as common
+
+
+class SlowStream(io.StringIO):
+    def __init__(self, delay: float) -> None:
+        super().__init__()
+        self.delay = delay
+        self.lines = 0
+
+    def write(self, text: str) -> int:
+        time.sleep(self.delay)
+        self.lines += text.count("\n")
+        return len(text)
+
+
+async def run(duration: float = 5.0, write_ms: float = 1.0) -> dict:
+    import httpx
+
+    from app.config import settings
+    from app.logs import setup_logging, stop_logging
+    from app.main import app
+    from app.metrics import log_records_dropped
+    from app.state import power_state
+    from benchmarks.bench_ping import _measure
+
+    await common.init_db()
+    await power_state.load_from_db()
+    power_state.start_flusher()
+
+    aggregate, sample = settings.LOG_AGGREGATE, settings.LOG_SAMPLE
+    root = logging.getLogger()
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        devices = list(settings.DEVICES)
+        stop_logging()
+        for mode in ("off", "direct", "queued", "aggregated"):
+            sink = SlowStream(write_ms / 1000)
+            if mode == "off":
+                root.handlers = []
+                root.setLevel(logging.WARNING)
+            elif mode == "direct":
+                root.handlers = [logging.StreamHandler(sink)]
+                root.setLevel(logging.INFO)
+            else:
+                thin = mode == "aggregated"
+                settings.LOG_AGGREGATE = aggregate if thin else []
+                settings.LOG_SAMPLE = sample if thin else {}
+                setup_logging(sink)
+            dropped = log_records_dropped.value
+            results[mode] = await _measure(client, devices, duration)
+            # Draining the slow sink takes seconds; keep the loop running meanwhile
+            await asyncio.to_thread(stop_logging)
+            results[mode]["lines"] = sink.lines
+            results[mode]["dropped"] = log_records_dropped.value - dropped
+
+    settings.LOG_AGGREGATE, settings.LOG_SAMPLE = aggregate, sample
+    setup_logging()
+    await power_state.stop_flusher()
+    await common.dispose_db()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--write-ms", type=float, default=1.0, help="time each write to the log sink takes")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+    results = asyncio.run(run(args.duration, args.write_ms))
+    print(json.dumps(results, indent=2))
+    common.write_results(args.output, "logging", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Alert fan-out time for growing subscriber counts, against a fake bot.
+
+``direct`` is notify_all broadcasting straight away; ``outbox`` is a power
+alert going through the durable outbox: enqueueing the job and its
+deliveries, then the worker draining them batch by batch.
+
+    python -m benchmarks.bench_notify --sizes 1000 10000 100000 --latency 0.002
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import benchmarks.common as common
+from benchmarks.fake_bot import FakeBot
+
+
+async def run(sizes: list[int], latency: float = 0.002, blocked_ratio: float = 0.0) -> dict:
+    from app.bot.notifications import notify_all, notify_site
+    from app.config import DEFAULT_DEVICE
+    from app.bot.outbox import outbox_worker
+    from app.state import Preferences, subscriber_registry
+
+    await common.init_db()
+    results = {}
+    for size in sizes:
+        subscriber_registry.load(
+            {chat_id: ({DEFAULT_DEVICE}, Preferences()) for chat_id in range(1, size + 1)}
+        )
+        bot = FakeBot(latency=latency, blocked_ratio=blocked_ratio)
+        started = time.perf_counter()
+        result = await notify_all(bot, "bench")
+        elapsed = time.perf_counter() - started
+
+        bot = FakeBot(latency=latency)
+        started = time.perf_counter()
+        await notify_site(DEFAULT_DEVICE, "bench", "off", f"bench:{size}")
+        enqueued = time.perf_counter() - started
+        sent = await outbox_worker.drain(bot)
+        drained = time.perf_counter() - started
+
+        results[str(size)] = {
+            "direct": {
+                "sent": result.sent,
+                "failed": result.failed,
+                "duration_s": round(elapsed, 3),
+                "throughput_msg_s": round(result.throughput, 1),
+                "fanout_latency_s": round(result.fanout_latency, 3),
+            },
+            "outbox": {
+                "sent": sent,
+                "enqueue_s": round(enqueued, 3),
+                "duration_s": round(drained, 3),
+                "throughput_msg_s": round(sent / drained, 1) if drained else 0.0,
+            },
+        }
+    await common.dispose_db()
+    return {"latency_s": latency, "sizes": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--latency", type=float, default=0.002)
+    parser.add_argument("--blocked-ratio", type=float, default=0.0)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+    results = asyncio.run(run(args.sizes, args.latency, args.blocked_ratio))
+    print(json.dumps(results, indent=2))
+    common.write_results(args.output, "notify", results)
+
+
+if __name__ == "__main__":
+    main()
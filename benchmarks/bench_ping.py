@@ -0,0 +1,100 @@
+"""/ping throughput and latency with concurrent simulated ESP devices.
+
+    python -m benchmarks.bench_ping --duration 10 --output bench_results.json
+
+The number of devices comes from BENCH_DEVICES (default 50). Requests go
+through app.main:app in-process over httpx's ASGI transport, so the numbers
+cover routing, API key checks and state updates, but not the network.
+``rate_limited`` repeats write-through with the per-device limit at 1/s,
+so nearly every ping gets the coalesced answer; ``limiter`` times one
+RateLimiter.allow call over more keys than it keeps.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import benchmarks.common as common
+
+
+async def _device(client, device_id: str, until: float, samples: list[float], errors: list[int]) -> None:
+    params = {"device": device_id, "api_key": os.environ["ESP_API_KEY"]}
+    while time.perf_counter() < until:
+        started = time.perf_counter()
+        resp = await client.get("/ping", params=params)
+        samples.append(time.perf_counter() - started)
+        if resp.status_code != 200:
+            errors.append(resp.status_code)
+
+
+async def _measure(client, devices: list[str], duration: float) -> dict:
+    samples: list[float] = []
+    errors: list[int] = []
+    until = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(_device(client, d, until, samples, errors) for d in devices))
+    elapsed = time.perf_counter() - started
+    return {
+        "devices": len(devices),
+        "errors": len(errors),
+        "throughput_rps": round(len(samples) / elapsed, 1),
+        **common.latency_summary(samples),
+    }
+
+
+async def run(duration: float = 5.0) -> dict:
+    import httpx
+
+    from app.config import settings
+    from app.main import app
+    from app.routes.esp import device_limiter
+    from app.services.ratelimit import RateLimiter
+    from app.state import power_state
+
+    await common.init_db()
+    await power_state.load_from_db()
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        devices = list(settings.DEVICES)
+        flush_interval = settings.PING_FLUSH_INTERVAL
+        for mode, interval in (("write_behind", flush_interval or 5.0), ("write_through", 0)):
+            settings.PING_FLUSH_INTERVAL = interval
+            power_state.start_flusher()
+            results[mode] = await _measure(client, devices, duration)
+            await power_state.stop_flusher()
+            await power_state.flush()
+        device_limiter.rate, device_limiter.burst = 1.0, 1
+        results["rate_limited"] = await _measure(client, devices, duration)
+        device_limiter.rate = 0
+        settings.PING_FLUSH_INTERVAL = flush_interval
+
+    limiter = RateLimiter("bench", 1.0, 5, max_keys=10000)
+    keys = 100000
+    started = time.perf_counter()
+    for i in range(keys):
+        limiter.allow(i % 20000)
+    results["limiter"] = {
+        "keys_seen": 20000,
+        "max_keys": limiter.max_keys,
+        "us_per_check": round((time.perf_counter() - started) / keys * 1e6, 3),
+    }
+
+    await common.dispose_db()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+    results = asyncio.run(run(args.duration))
+    print(json.dumps(results, indent=2))
+    common.write_results(args.output, "ping", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Cost of compiling the outage schedule and rendering replies from it.
+
+    python -m benchmarks.bench_schedule --iterations 10000
+
+``fetch`` times a cold fetch of --regions schedule sources over a mock
+transport where each answers after --source-latency seconds and one hangs
+past its timeout: one after another, then with fetch_schedules.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+import benchmarks.common as common
+
+
+def synthetic_schedule(groups: int = 12, seed: int = 0) -> dict:
+    """Schedule JSON shaped like the published one, for today and tomorrow."""
+    from app.services.schedule_index import KYIV_TZ
+
+    rng = random.Random(seed)
+    today = datetime.now(KYIV_TZ).replace(hour=0, minute=0, second=0, microsecond=0)
+    names = [f"GPV{g // 2 + 1}.{g % 2 + 1}" for g in range(groups)]
+
+    def day() -> dict:
+        return {
+            name: {str(h): rng.choice(["yes", "yes", "no", "mfirst", "msecond"]) for h in range(1, 25)}
+            for name in names
+        }
+
+    today_key = int(today.timestamp())
+    tomorrow_key = int((today + timedelta(days=1)).timestamp())
+    return {
+        "fact": {
+            "today": today_key,
+            "update": today.strftime("%d.%m.%Y %H:%M"),
+            "data": {str(today_key): day(), str(tomorrow_key): day()},
+        }
+    }
+
+
+def _time(fn, iterations: int) -> float:
+    """Mean microseconds per call."""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return round((time.perf_counter() - started) / iterations * 1e6, 3)
+
+
+async def _fetch(regions: int, latency: float) -> dict:
+    import httpx
+
+    import app.services.schedule as schedule
+
+    body = json.dumps(synthetic_schedule()).encode()
+    timeout = latency * 5
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(timeout * 2 if request.url.host == "slow" else latency)
+        return httpx.Response(200, content=body)
+
+    def caches() -> dict:
+        hosts = ["slow", *(f"region{i}" for i in range(1, regions))]
+        return {h: schedule.ScheduleCache(f"http://{h}/schedule.json", 300, timeout) for h in hosts}
+
+    real_caches, real_client = schedule.schedule_caches, schedule._client
+    schedule._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    try:
+        schedule.schedule_caches = caches()
+        started = time.perf_counter()
+        for region in schedule.schedule_caches:
+            await schedule.fetch_schedule(region)
+        sequential = time.perf_counter() - started
+
+        schedule.schedule_caches = caches()
+        started = time.perf_counter()
+        indexes = await schedule.fetch_schedules(schedule.schedule_caches)
+        concurrent = time.perf_counter() - started
+    finally:
+        await schedule.close_http_client()
+        schedule.schedule_caches, schedule._client = real_caches, real_client
+    return {
+        "regions": regions,
+        "source_latency_s": latency,
+        "timeout_s": timeout,
+        "fetched": sum(index is not None for index in indexes.values()),
+        "sequential_s": round(sequential, 3),
+        "concurrent_s": round(concurrent, 3),
+    }
+
+
+def run(iterations: int = 10000, regions: int = 5, source_latency: float = 0.2) -> dict:
+    from app.services.schedule import format_schedule_text, get_next_off_text, get_next_on_time
+    from app.services.schedule_index import ScheduleIndex
+
+    data = synthetic_schedule()
+    groups = ["GPV1.1", "GPV1.2"]
+    index = ScheduleIndex(data, 1)
+
+    def render_cold() -> None:
+        index.texts.clear()
+        format_schedule_text(index, "today", groups)
+
+    return {
+        "groups": groups,
+        "compile_us": _time(lambda: ScheduleIndex(data, 1), max(iterations // 10, 1)),
+        "format_schedule_cold_us": _time(render_cold, iterations),
+        "format_schedule_warm_us": _time(lambda: format_schedule_text(index, "today", groups), iterations),
+        "next_on_us": _time(lambda: get_next_on_time(index, groups), iterations),
+        "next_off_us": _time(lambda: get_next_off_text(index, groups), iterations),
+        "fetch": asyncio.run(_fetch(regions, source_latency)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=10000)
+    parser.add_argument("--regions", type=int, default=5)
+    parser.add_argument("--source-latency", type=float, default=0.2)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+    results = run(args.iterations, args.regions, args.source_latency)
+    print(json.dumps(results, indent=2))
+    common.write_results(args.output, "schedule", results)
+
+
+if __name__ == "__main__":
+    main()
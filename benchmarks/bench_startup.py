@@ -0,0 +1,116 @@
+"""Startup time: importing app.main, and booting until /ping is served.
+
+    python -m benchmarks.bench_startup --runs 5 --output bench_results.json
+
+Each run is a fresh interpreter. ``import_s`` is the time to import
+app.main. The boot cases enter the app's lifespan and time it until
+requests are accepted, first against an empty database that gets fully
+migrated, then against an up-to-date one. The phase timings recorded by
+app.main are reported with them. Telegram is replaced with a stub that
+takes --bot-latency seconds to start, which shows that /ping doesn't
+wait for it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import benchmarks.common as common
+
+
+async def _boot(bot_latency: float) -> dict:
+    import httpx
+
+    import app.bot.setup as bot_setup
+    import app.main as main
+
+    class _Application:
+        bot = None
+
+    async def setup_bot():
+        await asyncio.sleep(bot_latency)
+        return _Application()
+
+    async def noop() -> None:
+        pass
+
+    bot_setup.setup_bot = setup_bot
+    bot_setup.start_polling = bot_setup.stop_polling = bot_setup.shutdown_bot = noop
+
+    started = time.perf_counter()
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            resp = await client.get("/ping", params={"api_key": os.environ["ESP_API_KEY"]})
+        first_ping = time.perf_counter() - started
+        assert resp.status_code == 200, resp.text
+    return {"first_ping_s": round(first_ping, 4), **main.startup_phases}
+
+
+def _child(case: str, bot_latency: float) -> None:
+    if case == "import":
+        started = time.perf_counter()
+        import app.main  # noqa: F401
+
+        result = {"import_s": round(time.perf_counter() - started, 4)}
+    else:
+        if case == "fresh":
+            from app.database import Base, engine
+
+            async def reset() -> None:
+                async with engine.begin() as conn:
+                    await conn.run_sync(Base.metadata.drop_all)
+                await engine.dispose()
+
+            asyncio.run(reset())
+        result = asyncio.run(_boot(bot_latency))
+    print(json.dumps(result))
+
+
+def _spawn(case: str, bot_latency: float) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_startup", "--child", case,
+         "--bot-latency", str(bot_latency)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def _median(runs: list[dict]) -> dict:
+    # Phases still running when a boot was measured are missing from it
+    keys = set.intersection(*(set(r) for r in runs))
+    return {key: round(statistics.median(r[key] for r in runs), 4) for key in sorted(keys)}
+
+
+def run(runs: int = 5, bot_latency: float = 1.0) -> dict:
+    results = {"runs": runs, "bot_latency_s": bot_latency}
+    results["import"] = _median([_spawn("import", bot_latency) for _ in range(runs)])
+    results["boot_fresh_db"] = _median([_spawn("fresh", bot_latency) for _ in range(runs)])
+    results["boot_migrated_db"] = _median([_spawn("migrated", bot_latency) for _ in range(runs)])
+    asyncio.run(common.dispose_db())
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--bot-latency", type=float, default=1.0)
+    parser.add_argument("--child", choices=["import", "fresh", "migrated"], help=argparse.SUPPRESS)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+    if args.child:
+        _child(args.child, args.bot_latency)
+        return
+    results = run(args.runs, args.bot_latency)
+    print(json.dumps(results, indent=2))
+    common.write_results(args.output, "startup", results)
+
+
+if __name__ == "__main__":
+    main()
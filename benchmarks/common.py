@@ -0,0 +1,86 @@
+"""Shared setup for the benchmarks.
+
+Import this before anything from ``app``: it fills in the settings the app
+needs, defaulting to a throwaway SQLite database. Set BENCH_DATABASE_URL to
+run against a local Postgres instead.
+
+    pip install -r benchmarks/requirements.txt
+"""
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+os.environ.setdefault("BOT_TOKEN", "bench")
+os.environ.setdefault("ESP_API_KEY", "bench")
+os.environ.setdefault(
+    "DATABASE_URL",
+    os.environ.get("BENCH_DATABASE_URL")
+    or f"sqlite+aiosqlite:///{tempfile.gettempdir()}/lcm-bench-{os.getpid()}.db",
+)
+# Measure the engine, not Telegram's pacing or the rate limits
+os.environ.setdefault("BROADCAST_RATE", "0")
+os.environ.setdefault("DEVICE_RATE_LIMIT", "0")
+os.environ.setdefault("CLIENT_RATE_LIMIT", "0")
+os.environ.setdefault(
+    "DEVICES",
+    json.dumps({f"esp{i}": f"Site {i}" for i in range(int(os.environ.get("BENCH_DEVICES", 50)))}),
+)
+
+
+def percentile(samples: list[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[int(p) - 1]
+
+
+def latency_summary(samples: list[float]) -> dict:
+    """p50/p99/max of latencies given in seconds, reported in milliseconds."""
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "max_ms": round(max(samples, default=0.0) * 1000, 3),
+    }
+
+
+async def init_db() -> None:
+    from app.database import Base, engine
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def dispose_db() -> None:
+    from app.database import engine
+
+    await engine.dispose()
+    url = os.environ["DATABASE_URL"]
+    if url.startswith("sqlite") and "lcm-bench-" in url:
+        path = url.split("///", 1)[1]
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def write_results(path: str, name: str, results: dict) -> None:
+    """Merge ``results`` under ``name`` into the JSON file at ``path``."""
+    data = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            data = json.load(f)
+    data["meta"] = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "database": os.environ["DATABASE_URL"].split(":", 1)[0],
+    }
+    data[name] = results
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
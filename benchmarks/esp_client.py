@@ -0,0 +1,65 @@
+"""Stands in for an ESP device sending UDP heartbeats.
+
+    python -m benchmarks.esp_client --port 8001 --device home --interval 10
+
+The key defaults to ESP_API_KEY, as for /ping. Packets carry the local
+clock as their send time, so the client's clock must be within
+HEARTBEAT_MAX_SKEW of the server's.
+--interval 0 sends as fast as it can, which bench_heartbeat uses.
+"""
+import argparse
+import os
+import socket
+import time
+
+import benchmarks.common  # noqa: F401
+from app.services.heartbeat import pack_heartbeat
+
+
+class HeartbeatClient:
+    def __init__(self, host: str, port: int, key: str, device_id: str) -> None:
+        self.address = (host, port)
+        self.key = key.encode()
+        self.device_id = device_id
+        self.sequence = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self) -> bytes:
+        self.sequence += 1
+        packet = pack_heartbeat(self.key, self.device_id, self.sequence)
+        self.sock.sendto(packet, self.address)
+        return packet
+
+    def close(self) -> None:
+        self.sock.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--key", default=os.environ["ESP_API_KEY"])
+    parser.add_argument("--device", nargs="+", default=["home"], help="one client per device")
+    parser.add_argument("--interval", type=float, default=10.0)
+    parser.add_argument("--count", type=int, default=0, help="packets per device, 0 for no limit")
+    args = parser.parse_args()
+
+    clients = [HeartbeatClient(args.host, args.port, args.key, d) for d in args.device]
+    sent = 0
+    try:
+        while not args.count or sent < args.count:
+            for client in clients:
+                client.send()
+            sent += 1
+            if args.interval:
+                time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for client in clients:
+            client.close()
+    print(sent * len(clients))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import asyncio
+import random
+
+from telegram.error import Forbidden, RetryAfter, TimedOut
+
+
+class FakeBot:
+    """Stands in for ``telegram.Bot`` with simulated latency and failures."""
+
+    def __init__(
+        self,
+        *,
+        latency: float = 0.05,
+        blocked_ratio: float = 0.0,
+        timeout_ratio: float = 0.0,
+        flood_ratio: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        self.latency = latency
+        self.blocked_ratio = blocked_ratio
+        self.timeout_ratio = timeout_ratio
+        self.flood_ratio = flood_ratio
+        self.sent: list[int] = []
+        self._random = random.Random(seed)
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> None:
+        await asyncio.sleep(self.latency)
+        roll = self._random.random()
+        if roll < self.blocked_ratio:
+            raise Forbidden("Forbidden: bot was blocked by the user")
+        roll -= self.blocked_ratio
+        if roll < self.timeout_ratio:
+            raise TimedOut()
+        roll -= self.timeout_ratio
+        if roll < self.flood_ratio:
+            raise RetryAfter(1)
+        self.sent.append(chat_id)
@@ -0,0 +1,55 @@
+"""Run every benchmark and write the results to one JSON file.
+
+    python -m benchmarks.run_all --output bench_results.json
+
+Compare two result files to spot regressions; each section is keyed by
+benchmark name and the ``meta`` section records where it ran.
+
+Each benchmark runs in its own process, through its own command line, as
+the app keeps event-loop-bound state in module-level singletons that can't
+be carried from one asyncio.run to the next. bench_cluster is only run
+when BENCH_DATABASE_URL points at Postgres.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+def _benchmarks(quick: bool) -> dict[str, list[str]]:
+    duration = "2" if quick else "5"
+    benchmarks = {
+        "ping": ["--duration", duration],
+        "heartbeat": ["--packets", "20000" if quick else "100000"],
+        "logging": ["--duration", duration],
+        "notify": ["--sizes", "1000", "10000"] if quick else ["--sizes", "1000", "10000", "100000"],
+        "broadcast": ["--subscribers", "500" if quick else "2000"],
+        "schedule": ["--iterations", "1000" if quick else "10000"],
+        "startup": ["--runs", "3" if quick else "5"],
+        "backends": ["--ops", "300" if quick else "2000"],
+    }
+    if os.environ.get("BENCH_DATABASE_URL", "").startswith("postgresql"):
+        benchmarks["cluster"] = ["--rounds", "50" if quick else "200"]
+    return benchmarks
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes for a smoke run")
+    args = parser.parse_args()
+
+    for name, options in _benchmarks(args.quick).items():
+        print(f"Running bench_{name}", file=sys.stderr)
+        subprocess.run(
+            [sys.executable, "-m", f"benchmarks.bench_{name}", *options, "--output", args.output],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+    with open(args.output) as f:
+        print(json.dumps(json.load(f), indent=2))
+
+
+if __name__ == "__main__":
+    main()